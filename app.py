@@ -2,13 +2,25 @@ import logging
 import os
 import subprocess
 import sys
+import tempfile
 
 from flask import Flask, current_app, flash, redirect, render_template, request, url_for
 from flask_minify import minify
 from flask_restx import Api
+from flask_restx.representations import output_json
+from werkzeug.exceptions import Forbidden
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+import zoneforge.accesslog
+import zoneforge.api
+import zoneforge.core.interning
+import zoneforge.core.notify
+import zoneforge.metrics
 import zoneforge.modal_data
+import zoneforge.passwords
+import zoneforge.profiling
+import zoneforge.throttle
+import zoneforge.tracing
 from zoneforge.api.authentication import LoginResource, SignupResource
 from zoneforge.api.authentication import api as ns_auth
 from zoneforge.api.rbac import api as ns_rbac
@@ -19,8 +31,20 @@ from zoneforge.api.types import RecordTypeResource
 from zoneforge.api.types import api as ns_types
 from zoneforge.api.zones import DnsZone
 from zoneforge.api.zones import api as ns_zone
-from zoneforge.api.zones import get_zones
-from zoneforge.db import db
+from zoneforge.core.compact import get_zone_responses
+from zoneforge.core.store import zone_store
+from zoneforge.db import engine_options, init_db
+
+
+def _access_denied(api_response: tuple):
+    """
+    Answers a page whose API call was refused: a request without a valid login is sent to the login page, and one whose user
+    lacks the permission is refused with a 403.
+    """
+    body, status_code = api_response
+    if status_code == 403:
+        raise Forbidden(body["message"])
+    return redirect(url_for("login"))
 
 
 def get_logging_conf() -> dict:
@@ -63,6 +87,7 @@ def create_app():
     app.config["ZONE_FILE_FOLDER"] = os.environ.get(
         "ZONE_FILE_FOLDER", "./lib/examples"
     )
+    app.config["CATALOG_ZONE"] = os.environ.get("CATALOG_ZONE", "")
     app.config["DEFAULT_ZONE_TTL"] = os.environ.get("DEFAULT_ZONE_TTL", 86400)
     app.config["AUTH_ENABLED"] = (
         os.environ.get("AUTH_ENABLED", "false").lower() == "true"
@@ -75,20 +100,199 @@ def create_app():
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
         "AUTH_DB_URI", "sqlite:///zoneinfo.db"
     )
+    app.config["AUTH_DB_JOURNAL_MODE"] = os.environ.get("AUTH_DB_JOURNAL_MODE", "WAL")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app.config["SQLALCHEMY_DATABASE_URI"],
+        busy_timeout=float(os.environ.get("AUTH_DB_BUSY_TIMEOUT", 5)),
+        pool_size=int(os.environ.get("AUTH_DB_POOL_SIZE", 5)),
+        max_overflow=int(os.environ.get("AUTH_DB_MAX_OVERFLOW", 10)),
+        pool_recycle=int(os.environ.get("AUTH_DB_POOL_RECYCLE", 1800)),
+    )
+    app.config["AUTH_USER_CACHE_TTL"] = float(os.environ.get("AUTH_USER_CACHE_TTL", 30))
+    app.config["AUTH_REVOCATION_REFRESH"] = float(
+        os.environ.get("AUTH_REVOCATION_REFRESH", 5)
+    )
+    app.config["AUTH_REVOCATION_CAPACITY"] = int(
+        os.environ.get("AUTH_REVOCATION_CAPACITY", 10000)
+    )
+    app.config["AUTH_BCRYPT_ROUNDS"] = int(os.environ.get("AUTH_BCRYPT_ROUNDS", 12))
+    app.config["AUTH_BCRYPT_MAX_CONCURRENT"] = int(
+        os.environ.get("AUTH_BCRYPT_MAX_CONCURRENT", 2)
+    )
+    app.config["AUTH_BCRYPT_SLOTS_DIR"] = os.environ.get("AUTH_BCRYPT_SLOTS_DIR", "")
+    app.config["AUTH_LOGIN_USER_BURST"] = int(
+        os.environ.get("AUTH_LOGIN_USER_BURST", 10)
+    )
+    app.config["AUTH_LOGIN_USER_RATE"] = float(
+        os.environ.get("AUTH_LOGIN_USER_RATE", 10)
+    )
+    app.config["AUTH_LOGIN_ADDRESS_BURST"] = int(
+        os.environ.get("AUTH_LOGIN_ADDRESS_BURST", 50)
+    )
+    app.config["AUTH_LOGIN_ADDRESS_RATE"] = float(
+        os.environ.get("AUTH_LOGIN_ADDRESS_RATE", 50)
+    )
+    app.config["AUTH_LOGIN_THROTTLE_SIZE"] = int(
+        os.environ.get("AUTH_LOGIN_THROTTLE_SIZE", 65536)
+    )
+    app.config["AUTH_LOGIN_THROTTLE_DB"] = os.environ.get("AUTH_LOGIN_THROTTLE_DB", "")
+    app.config["METRICS_ENABLED"] = (
+        os.environ.get("METRICS_ENABLED", "false").lower() == "true"
+    )
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR", "")
+    app.config["METRICS_SCRAPE_TOKEN"] = os.environ.get("METRICS_SCRAPE_TOKEN", "")
+    app.config["METRICS_FLUSH_INTERVAL"] = float(
+        os.environ.get("METRICS_FLUSH_INTERVAL", 5)
+    )
+    app.config["PROFILE_ENABLED"] = (
+        os.environ.get("PROFILE_ENABLED", "false").lower() == "true"
+    )
+    app.config["PROFILE_DIR"] = os.environ.get(
+        "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "zoneforge-profiles")
+    )
+    app.config["PROFILE_MODE"] = os.environ.get("PROFILE_MODE", "cprofile").lower()
+    app.config["PROFILE_HEADER"] = os.environ.get(
+        "PROFILE_HEADER", "X-ZoneForge-Profile"
+    )
+    app.config["PROFILE_SAMPLE_RATE"] = int(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    app.config["PROFILE_SAMPLE_INTERVAL"] = float(
+        os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005)
+    )
+    app.config["PROFILE_MAX_FILES"] = int(os.environ.get("PROFILE_MAX_FILES", 100))
+    app.config["MEMORY_TRACE_ENABLED"] = (
+        os.environ.get("MEMORY_TRACE_ENABLED", "false").lower() == "true"
+    )
+    app.config["MEMORY_TRACE_FRAMES"] = int(os.environ.get("MEMORY_TRACE_FRAMES", 16))
+    app.config["ACCESS_LOG_ENABLED"] = (
+        os.environ.get("ACCESS_LOG_ENABLED", "false").lower() == "true"
+    )
+    app.config["ACCESS_LOG_FILE"] = os.environ.get("ACCESS_LOG_FILE", "")
+    app.config["SLOW_REQUEST_THRESHOLD"] = float(
+        os.environ.get("SLOW_REQUEST_THRESHOLD", 1)
+    )
+    app.config["TRACING_ENABLED"] = (
+        os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+    )
+    app.config["TRACE_BUFFER_SIZE"] = int(os.environ.get("TRACE_BUFFER_SIZE", 100))
+    app.config["TRACE_EXPORT_DIR"] = os.environ.get("TRACE_EXPORT_DIR", "")
+    app.config["COMPACT_ZONES"] = (
+        os.environ.get("COMPACT_ZONES", "false").lower() == "true"
+    )
+    app.config["NAME_INTERN_CAPACITY"] = int(
+        os.environ.get("NAME_INTERN_CAPACITY", 100000)
+    )
     # Controls whether Flask-RESTx suggests similar endpoints when a 404 Not Found error occurs
     app.config["ERROR_404_HELP"] = False
+    app.config["NOTIFY_ENABLED"] = (
+        os.environ.get("NOTIFY_ENABLED", "false").lower() == "true"
+    )
+    app.config["NOTIFY_TARGETS"] = [
+        target
+        for target in os.environ.get("NOTIFY_TARGETS", "").split(",")
+        if target.strip()
+    ]
+    app.config["NOTIFY_DELAY"] = float(os.environ.get("NOTIFY_DELAY", 5))
+    app.config["NOTIFY_MAX_DELAY"] = float(os.environ.get("NOTIFY_MAX_DELAY", 60))
+    app.config["NOTIFY_PORT"] = int(os.environ.get("NOTIFY_PORT", 53))
+    app.config["NOTIFY_RETRIES"] = int(os.environ.get("NOTIFY_RETRIES", 3))
+    app.config["NOTIFY_TIMEOUT"] = float(os.environ.get("NOTIFY_TIMEOUT", 2))
 
     if app.config["AUTH_ENABLED"]:
         logging.info("authentication enabled, setting up database")
-        db.init_app(app)
+        init_db(app, journal_mode=app.config["AUTH_DB_JOURNAL_MODE"])
+        # cached users and groups belong to the database this app was set up with
+        zoneforge.api.invalidate_user_cache()
+        zoneforge.api.invalidate_group_cache()
+        zoneforge.api.user_cache.ttl = app.config["AUTH_USER_CACHE_TTL"]
+        zoneforge.api.group_cache.ttl = app.config["AUTH_USER_CACHE_TTL"]
+        zoneforge.api.zone_acl_cache.ttl = app.config["AUTH_USER_CACHE_TTL"]
+        zoneforge.api.invalidate_zone_acl()
+        zoneforge.api.configure_revocations(
+            capacity=app.config["AUTH_REVOCATION_CAPACITY"],
+            refresh_interval=app.config["AUTH_REVOCATION_REFRESH"],
+        )
         with app.app_context():
-            db.create_all()
+            zoneforge.api.zone_acl()
+            zoneforge.api.refresh_revocations()
+        zoneforge.passwords.configure(
+            rounds=app.config["AUTH_BCRYPT_ROUNDS"],
+            max_concurrent=app.config["AUTH_BCRYPT_MAX_CONCURRENT"],
+            slots_directory=app.config["AUTH_BCRYPT_SLOTS_DIR"],
+        )
+        zoneforge.throttle.configure(
+            shared_path=app.config["AUTH_LOGIN_THROTTLE_DB"],
+            maxsize=app.config["AUTH_LOGIN_THROTTLE_SIZE"],
+            user_burst=app.config["AUTH_LOGIN_USER_BURST"],
+            user_rate=app.config["AUTH_LOGIN_USER_RATE"],
+            address_burst=app.config["AUTH_LOGIN_ADDRESS_BURST"],
+            address_rate=app.config["AUTH_LOGIN_ADDRESS_RATE"],
+        )
+
+    zone_store(
+        app.config["ZONE_FILE_FOLDER"], compact_reads=app.config["COMPACT_ZONES"]
+    )
+    zoneforge.core.interning.configure(capacity=app.config["NAME_INTERN_CAPACITY"])
+
+    if app.config["NOTIFY_ENABLED"]:
+        logging.info("NOTIFY enabled, zone writes will notify secondaries")
+        zoneforge.core.notify.configure(
+            delay=app.config["NOTIFY_DELAY"],
+            max_delay=app.config["NOTIFY_MAX_DELAY"],
+            extra_targets=app.config["NOTIFY_TARGETS"],
+            port=app.config["NOTIFY_PORT"],
+            retries=app.config["NOTIFY_RETRIES"],
+            timeout=app.config["NOTIFY_TIMEOUT"],
+        )
+
+    if app.config["METRICS_ENABLED"]:
+        zoneforge.metrics.configure(
+            directory=app.config["METRICS_DIR"],
+            interval=app.config["METRICS_FLUSH_INTERVAL"],
+        )
+        zoneforge.metrics.init_app(app)
+
+    if app.config["PROFILE_ENABLED"]:
+        logging.info(
+            "profiling enabled, writing profiles to '%s'", app.config["PROFILE_DIR"]
+        )
+        zoneforge.profiling.init_app(
+            app,
+            directory=app.config["PROFILE_DIR"],
+            authorize=lambda: zoneforge.api.request_permitted("serverDiagnostics_read"),
+            mode=app.config["PROFILE_MODE"],
+            header=app.config["PROFILE_HEADER"],
+            sample_rate=app.config["PROFILE_SAMPLE_RATE"],
+            interval=app.config["PROFILE_SAMPLE_INTERVAL"],
+            max_profiles=app.config["PROFILE_MAX_FILES"],
+        )
+
+    if app.config["TRACING_ENABLED"]:
+        logging.info("tracing enabled")
+        zoneforge.tracing.configure(
+            capacity=app.config["TRACE_BUFFER_SIZE"],
+            export_dir=app.config["TRACE_EXPORT_DIR"],
+        )
+        zoneforge.tracing.init_app(app)
+    else:
+        zoneforge.tracing.disable()
+
+    zoneforge.accesslog.init_app(
+        app,
+        log_requests=app.config["ACCESS_LOG_ENABLED"],
+        slow_threshold=app.config["SLOW_REQUEST_THRESHOLD"],
+        log_file=app.config["ACCESS_LOG_FILE"],
+    )
 
     minify(app=app, html=True, js=True, cssless=True, static=True)
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
     # API Setup
     api = Api(app, prefix="/api", doc="/api", validate=True)
 
+    @api.representation("application/json")
+    def output_timed_json(data, code, headers=None):
+        with zoneforge.accesslog.phase("serialize"):
+            return output_json(data, code, headers)
+
     @app.route("/", methods=["GET"])
     def home():
         zf_zone = DnsZone()
@@ -97,6 +301,9 @@ def create_app():
         # generic except to actually let the homepage render, even if internal error
         except:  # pylint: disable=bare-except
             zones = []
+        # with authentication enabled, zones are only listed for a logged in user
+        if isinstance(zones, tuple):
+            return _access_denied(zones)
         zone_create_defaults = (
             zoneforge.modal_data.ZONE_DEFAULTS
             | zoneforge.modal_data.ZONE_PRIMARY_NS_DEFAULTS
@@ -113,11 +320,13 @@ def create_app():
 
     @app.route("/zone/<string:zone_name>", methods=["GET"])
     def zone(zone_name):
-        zone = get_zones(
+        zone = get_zone_responses(
             zonefile_folder=current_app.config["ZONE_FILE_FOLDER"], zone_name=zone_name
-        )[0].to_response()
+        )[0]
         zf_record = DnsRecord()
         records = zf_record.get(zone_name=zone_name)
+        if isinstance(records, tuple):
+            return _access_denied(records)
         current_zone_data = {
             "name": zone_name,
             "soa_ttl": zone["soa"]["ttl"],
@@ -152,7 +361,16 @@ def create_app():
 
                 return render_template("login.html.j2")
 
-            return redirect(url_for("home"))
+            # the web UI's requests to the API authenticate with this cookie
+            response = redirect(url_for("home"))
+            response.set_cookie(
+                "access_token",
+                login_response[0]["token"],
+                httponly=True,
+                samesite="Lax",
+                secure=request.is_secure,
+            )
+            return response
         return render_template("login.html.j2")
 
     @app.route("/signup", methods=["GET", "POST"])
@@ -0,0 +1,48 @@
+import math
+import statistics
+import threading
+import time
+
+ORIGIN = "bench.example."
+
+
+def run_clients(send, *, clients: int, duration: float) -> tuple[int, int]:
+    """
+    Calls send() from several threads for duration seconds, returning how many calls returned true and false.
+    """
+    counts = [[0, 0] for _ in range(clients)]
+    deadline = time.monotonic() + duration
+
+    def client(count):
+        while time.monotonic() < deadline:
+            count[0 if send() else 1] += 1
+
+    threads = [threading.Thread(target=client, args=(count,)) for count in counts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(c[0] for c in counts), sum(c[1] for c in counts)
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """
+    Returns the nearest-rank percentile of samples, e.g. 0.95 for the 95th percentile.
+    """
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def summarize(samples: list[float]) -> dict:
+    """
+    Summarizes timings in seconds.
+    """
+    return {
+        "samples": len(samples),
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "p95": percentile(samples, 0.95),
+        "min": min(samples),
+        "max": max(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
@@ -0,0 +1,113 @@
+"""
+Compares benchmark results with stored baseline results, to catch regressions in hot paths.
+"""
+
+import json
+import os
+
+# metrics compared with the baseline
+TIME_METRICS = ("mean", "p95")
+MEMORY_METRIC = "peak_bytes"
+
+
+def _key(result: dict) -> tuple:
+    return (result["name"], result["records"])
+
+
+def load(path: str) -> dict:
+    """
+    Returns the baseline stored at path, or an empty one if there is none yet.
+    """
+    if not os.path.exists(path):
+        return {"results": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(path: str, baseline: dict, run: dict):
+    """
+    Stores the results of a run as the baseline, keeping baseline results for benchmarks the run didn't include.
+    """
+    results = {_key(result): result for result in baseline["results"]}
+    results.update({_key(result): result for result in run["results"]})
+    run = run | {"results": sorted(results.values(), key=_key)}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+        f.write("\n")
+
+
+def compare(
+    baseline: dict,
+    run: dict,
+    *,
+    tolerance: float,
+    memory_tolerance: float,
+    noise_floor: float,
+) -> list[dict]:
+    """
+    Compares the results of a run with the baseline, returning a row for each metric of each benchmark.
+
+    A timing regresses when it's more than tolerance (a fraction) slower than the baseline, and by more than noise_floor
+    seconds, so that tiny timings don't fail on scheduling noise. Peak memory regresses when it's more than memory_tolerance
+    higher.
+    """
+    baseline_results = {_key(result): result for result in baseline["results"]}
+    rows = []
+    for result in run["results"]:
+        previous = baseline_results.get(_key(result))
+        for metric in TIME_METRICS + (MEMORY_METRIC,):
+            current = result.get(metric)
+            if current is None:
+                continue
+            row = {
+                "name": result["name"],
+                "records": result["records"],
+                "metric": metric,
+                "baseline": previous.get(metric) if previous else None,
+                "current": current,
+                "change": None,
+                "status": "new",
+            }
+            if row["baseline"]:
+                row["change"] = current / row["baseline"] - 1
+                if metric == MEMORY_METRIC:
+                    regressed = row["change"] > memory_tolerance
+                    allowed = memory_tolerance
+                else:
+                    regressed = (
+                        row["change"] > tolerance
+                        and current - row["baseline"] > noise_floor
+                    )
+                    allowed = tolerance
+                if regressed:
+                    row["status"] = "REGRESSED"
+                elif row["change"] < -allowed:
+                    row["status"] = "improved"
+                else:
+                    row["status"] = "ok"
+            rows.append(row)
+    return rows
+
+
+def format_table(rows: list[dict]) -> str:
+    lines = [
+        f"{'benchmark':<22} {'records':>8} {'metric':<10} {'baseline':>12} {'current':>12} {'change':>8}  status",
+        "-" * 86,
+    ]
+    for row in rows:
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+        lines.append(
+            f"{row['name']:<22} {row['records']:>8} {row['metric']:<10}"
+            f" {_format_value(row['metric'], row['baseline']):>12}"
+            f" {_format_value(row['metric'], row['current']):>12}"
+            f" {change:>8}  {row['status']}"
+        )
+    return "\n".join(lines)
+
+
+def _format_value(metric: str, value) -> str:
+    if value is None:
+        return "-"
+    if metric == MEMORY_METRIC:
+        return f"{value / 1024:.0f} KiB"
+    return f"{value * 1000:.3f} ms"
@@ -0,0 +1,136 @@
+"""
+Measures login and token refresh throughput against a shared authentication database, from several worker processes.
+
+Each process stands in for a gunicorn worker with its own app and connection pool:
+
+    python -m tests.benchmarks.bench_auth --workers 4 --users 100 --duration 5
+    python -m tests.benchmarks.bench_auth --journal-mode DELETE
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+PASSWORD = "benchmark"
+
+
+def _create_app(folder: str, journal_mode: str):
+    os.environ.update(
+        {
+            "ZONE_FILE_FOLDER": folder,
+            "AUTH_ENABLED": "true",
+            "AUTH_DB_URI": f"sqlite:///{folder}/zoneinfo.db",
+            "AUTH_DB_JOURNAL_MODE": journal_mode,
+            # keep password hashing cheap, so the database is what's measured
+            "AUTH_BCRYPT_ROUNDS": "4",
+        }
+    )
+    # imported here so the app module's own app is created with the settings above
+    from app import create_app  # pylint: disable=import-outside-toplevel
+
+    return create_app()
+
+
+# pylint: disable=too-many-arguments
+def _worker(
+    folder: str,
+    journal_mode: str,
+    *,
+    users: int,
+    signup_ratio: float,
+    duration: float,
+    results,
+):
+    app = _create_app(folder, journal_mode)
+    client = app.test_client()
+    counts = {"login": 0, "refresh": 0, "signup": 0, "failed": 0}
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if random.random() < signup_ratio:
+            res = client.post(
+                "/api/auth/signup",
+                json={
+                    "username": f"new{os.getpid()}_{counts['signup']}",
+                    "password": PASSWORD,
+                },
+            )
+            counts["signup" if res.status_code == 200 else "failed"] += 1
+            continue
+        res = client.post(
+            "/api/auth/login",
+            json={"username": f"user{random.randrange(users)}", "password": PASSWORD},
+        )
+        if res.status_code != 200:
+            counts["failed"] += 1
+            continue
+        counts["login"] += 1
+        res = client.post(
+            "/api/auth/refresh",
+            headers={"Authorization": f"Bearer {res.json['refresh_token']}"},
+        )
+        counts["refresh" if res.status_code == 200 else "failed"] += 1
+    results.put(counts)
+
+
+# pylint: enable=too-many-arguments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument(
+        "--signup-ratio",
+        type=float,
+        default=0.1,
+        help="share of iterations that sign up a new user, writing to the database",
+    )
+    parser.add_argument("--journal-mode", default="WAL")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        app = _create_app(folder, args.journal_mode)
+        client = app.test_client()
+        for i in range(args.users):
+            client.post(
+                "/api/auth/signup", json={"username": f"user{i}", "password": PASSWORD}
+            )
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        workers = [
+            context.Process(
+                target=_worker,
+                args=(folder, args.journal_mode),
+                kwargs={
+                    "users": args.users,
+                    "signup_ratio": args.signup_ratio,
+                    "duration": args.duration,
+                    "results": results,
+                },
+            )
+            for _ in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        totals = {"login": 0, "refresh": 0, "signup": 0, "failed": 0}
+        for _ in workers:
+            for key, count in results.get().items():
+                totals[key] += count
+        for worker in workers:
+            worker.join()
+
+    print(
+        f"{args.journal_mode:>8}: {totals['login'] / args.duration:8.0f} logins/sec,"
+        f" {totals['refresh'] / args.duration:8.0f} refreshes/sec,"
+        f" {totals['signup'] / args.duration:8.0f} signups/sec"
+        f" ({args.workers} workers, {totals['failed']} failed)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Measures the core zone and record operations on synthetic zones, and writes the results as JSON.
+
+Each operation is timed repeat times on zones of each size, after a warmup run, then run once more under tracemalloc for its
+peak memory:
+
+    python -m tests.benchmarks.bench_core --records 1000,10000 --repeat 5 --output results.json
+    python -m tests.benchmarks.bench_core --records 100000 --rrset-width 50 --only get_zones_cold,write_to_file
+
+With --baseline, results are compared with the baseline file instead, exiting with 1 if any regressed. --update-baseline
+stores them as the new baseline:
+
+    python -m tests.benchmarks.bench_core --baseline tests/benchmarks/baseline.json
+    python -m tests.benchmarks.bench_core --baseline tests/benchmarks/baseline.json --update-baseline
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import dns.name
+import dns.rdata
+import dns.version
+from app import create_app
+from tests.benchmarks import baseline, summarize
+from tests.benchmarks.zonegen import (
+    DEFAULT_ORIGIN,
+    add_zone_arguments,
+    write_synthetic_zone,
+    zone_arguments,
+)
+from zoneforge.core import (
+    create_record,
+    delete_record,
+    get_zones,
+    record_to_response,
+    request_to_rdata,
+    update_record,
+)
+from zoneforge.core.compact import CompactZone
+from zoneforge.core.store import zone_store
+
+# request_to_rdata is timed over this many record payloads taken from the zone
+RDATA_SAMPLE_SIZE = 1000
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    """
+    Registers a benchmark. It's called with the zone's context once, and returns the operation to time.
+    """
+    BENCHMARKS[func.__name__.removeprefix("bench_")] = func
+    return func
+
+
+# pylint: disable=too-few-public-methods
+class ZoneContext:
+    def __init__(self, folder: str, origin: str, *, runs: int):
+        self.folder = folder
+        self.origin = origin
+        self.zone_name = dns.name.from_text(origin)
+        # how many times the benchmark's operation will be called
+        self.runs = runs
+
+    def zone(self):
+        return get_zones(self.folder, self.zone_name)[0]
+
+
+# pylint: enable=too-few-public-methods
+
+
+@benchmark
+def bench_get_zones_cold(context: ZoneContext):
+    store = zone_store(context.folder)
+
+    def run():
+        # parses the zone file again, as when it changed
+        store.discard(context.zone_name)
+        get_zones(context.folder, context.zone_name)
+
+    return run
+
+
+@benchmark
+def bench_get_zones_cached(context: ZoneContext):
+    return lambda: get_zones(context.folder, context.zone_name)
+
+
+@benchmark
+def bench_get_all_records(context: ZoneContext):
+    zone = context.zone()
+    return zone.get_all_records
+
+
+@benchmark
+def bench_record_to_response(context: ZoneContext):
+    records = context.zone().get_all_records()
+    return lambda: record_to_response(records)
+
+
+@benchmark
+def bench_iter_records(context: ZoneContext):
+    zone = context.zone()
+    return lambda: record_to_response(zone.iter_records())
+
+
+@benchmark
+def bench_compact_records(context: ZoneContext):
+    compact = CompactZone(context.zone())
+    return compact.records
+
+
+@benchmark
+def bench_request_to_rdata(context: ZoneContext):
+    payloads = []
+    for record in record_to_response(context.zone().get_all_records()):
+        payload = {
+            "zone_name": context.origin,
+            "record_type": record["type"],
+            "record_data": record["data"],
+            "record_class": "IN",
+        }
+        try:
+            request_to_rdata(**payload | {"record_data": dict(record["data"])})
+        except Exception:  # pylint: disable=broad-exception-caught
+            # e.g. TXT records of several strings, which the API doesn't round trip
+            continue
+        payloads.append(payload)
+        if len(payloads) == RDATA_SAMPLE_SIZE:
+            break
+
+    def run():
+        for payload in payloads:
+            # request_to_rdata relativizes names in the record data it's given
+            request_to_rdata(**payload | {"record_data": dict(payload["record_data"])})
+
+    return run
+
+
+@benchmark
+def bench_create_record(context: ZoneContext):
+    names = (f"bench-create{i}" for i in itertools.count())
+    return lambda: create_record(
+        record_name=next(names),
+        record_type="A",
+        record_data={"address": "192.0.2.1"},
+        record_ttl=300,
+        zonefile_folder=context.folder,
+        zone_name=context.origin,
+    )
+
+
+@benchmark
+def bench_update_record(context: ZoneContext):
+    create_record(
+        record_name="bench-update",
+        record_type="A",
+        record_data={"address": "192.0.2.1"},
+        record_ttl=300,
+        zonefile_folder=context.folder,
+        zone_name=context.origin,
+    )
+    addresses = (f"192.0.2.{i % 250 + 2}" for i in itertools.count())
+    return lambda: update_record(
+        zone_name=context.origin,
+        zonefile_folder=context.folder,
+        record_name="bench-update",
+        record_type="A",
+        record_data={"address": next(addresses)},
+        record_index=0,
+        record_ttl=300,
+    )
+
+
+@benchmark
+def bench_delete_record(context: ZoneContext):
+    # one record for each run, including the warmup, created with a single write
+    names = [f"bench-delete{i}" for i in range(context.runs)]
+    zone = context.zone()
+    with zone.writer() as txn:
+        for name in names:
+            txn.add(name, 300, dns.rdata.from_text("IN", "A", "192.0.2.1"))
+    zone.write_to_file()
+    names = iter(names)
+    return lambda: delete_record(
+        zone_name=context.origin,
+        zonefile_folder=context.folder,
+        record_name=next(names),
+        record_type="A",
+        record_data={"address": "192.0.2.1"},
+        record_index=0,
+    )
+
+
+@benchmark
+def bench_write_to_file(context: ZoneContext):
+    zone = context.zone()
+    return zone.write_to_file
+
+
+def _api_client(context: ZoneContext):
+    os.environ["ZONE_FILE_FOLDER"] = context.folder
+    return create_app().test_client()
+
+
+@benchmark
+def bench_api_get_zone(context: ZoneContext):
+    client = _api_client(context)
+    return lambda: client.get(f"/api/zones/{context.origin}")
+
+
+@benchmark
+def bench_api_get_records(context: ZoneContext):
+    client = _api_client(context)
+    return lambda: client.get(f"/api/zones/{context.origin}/records")
+
+
+def measure(run, *, repeat: int) -> dict:
+    run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    # traced separately, since tracing allocations slows them down
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize(samples) | {"peak_bytes": peak}
+
+
+def environment() -> dict:
+    return {
+        "started_at": datetime.now(tz=timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "dnspython": dns.version.version,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--records",
+        type=lambda text: [int(size) for size in text.split(",")],
+        default=[1000, 10000],
+        help="comma separated zone sizes, from 1000 to 1000000 records",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    add_zone_arguments(parser)
+    parser.add_argument(
+        "--only", type=lambda text: text.split(","), default=list(BENCHMARKS)
+    )
+    parser.add_argument("--output", help="file to write the JSON results to")
+    parser.add_argument("--baseline", help="baseline file to compare results with")
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="store the results in the baseline file instead of comparing with it",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="fraction by which mean and p95 timings may exceed the baseline",
+    )
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=0.1,
+        help="fraction by which peak memory may exceed the baseline",
+    )
+    parser.add_argument(
+        "--noise-floor",
+        type=float,
+        default=0.001,
+        help="seconds a timing must also exceed the baseline by to count as a regression",
+    )
+    args = parser.parse_args()
+
+    results = []
+    for records in args.records:
+        for name in args.only:
+            # each benchmark gets a zone of its own, since some of them change it
+            with tempfile.TemporaryDirectory() as folder:
+                write_synthetic_zone(folder, records=records, **zone_arguments(args))
+                # the warmup and traced runs come on top of the timed ones
+                context = ZoneContext(folder, DEFAULT_ORIGIN, runs=args.repeat + 2)
+                result = {"name": name, "records": records} | measure(
+                    BENCHMARKS[name](context), repeat=args.repeat
+                )
+            results.append(result)
+            print(
+                f"{name:>20} {records:>8} records:"
+                f" mean {result['mean'] * 1000:10.3f} ms,"
+                f" p95 {result['p95'] * 1000:10.3f} ms",
+                file=sys.stderr,
+            )
+
+    output = {
+        "environment": environment(),
+        "parameters": {"repeat": args.repeat} | zone_arguments(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+    if not args.baseline:
+        if not args.output:
+            json.dump(output, sys.stdout, indent=2)
+        return 0
+
+    stored = baseline.load(args.baseline)
+    if args.update_baseline:
+        baseline.save(args.baseline, stored, output)
+        print(f"Stored results as the baseline in '{args.baseline}'", file=sys.stderr)
+        return 0
+    if stored.get("parameters", output["parameters"]) != output["parameters"]:
+        print(
+            "Warning: the baseline was run with other parameters, so results may not be comparable",
+            file=sys.stderr,
+        )
+    rows = baseline.compare(
+        stored,
+        output,
+        tolerance=args.tolerance,
+        memory_tolerance=args.memory_tolerance,
+        noise_floor=args.noise_floor,
+    )
+    print(baseline.format_table(rows))
+    regressions = [row for row in rows if row["status"] == "REGRESSED"]
+    if regressions:
+        print(f"\n{len(regressions)} regressions beyond the tolerance", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
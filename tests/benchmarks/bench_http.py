@@ -0,0 +1,335 @@
+"""
+Load tests the web app over HTTP at a fixed concurrency, reporting throughput and latency percentiles for each endpoint.
+
+Unlike bench_core, each request goes through the whole stack, including request parsing, marshalling, minification and
+ProxyFix. The app is served by gunicorn, as in production, or by a multi-threaded development server:
+
+    python -m tests.benchmarks.bench_http --records 10000 --concurrency 8 --duration 10
+    python -m tests.benchmarks.bench_http --server threaded --mix list_records=1,get_record=1 --output results.json
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from werkzeug.serving import make_server
+from tests.benchmarks import percentile
+from tests.benchmarks.zonegen import DEFAULT_ORIGIN, write_synthetic_zone
+
+DEFAULT_MIX = {
+    "home": 5,
+    "zone_page": 10,
+    "list_records": 25,
+    "get_record": 30,
+    "create_record": 10,
+    "update_record": 10,
+    "delete_record": 10,
+}
+RECORDS_PATH = f"/api/zones/{DEFAULT_ORIGIN}/records"
+
+
+class Client:
+    """
+    Sends requests from one thread over a connection of its own, keeping track of the records it created, so that the
+    records it updates and deletes aren't changed by other clients.
+    """
+
+    def __init__(self, port: int, *, client_id: int, records: int):
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.records = records
+        self.created = []
+        self._names = (f"load{client_id}-{i}" for i in itertools.count())
+
+    def request(self, method: str, path: str, *, body: dict = None) -> int:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        payload = json.dumps(body) if body is not None else None
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return 0
+        return response.status
+
+    def home(self):
+        return self.request("GET", "/")
+
+    def zone_page(self):
+        return self.request("GET", f"/zone/{DEFAULT_ORIGIN}")
+
+    def list_records(self):
+        return self.request("GET", RECORDS_PATH)
+
+    def get_record(self):
+        # names in the synthetic zone are numbered, one for each record
+        return self.request("GET", f"{RECORDS_PATH}/n{random.randrange(self.records)}")
+
+    def create_record(self):
+        name = next(self._names)
+        status = self.request(
+            "POST",
+            RECORDS_PATH,
+            body={
+                "name": name,
+                "type": "A",
+                "ttl": 300,
+                "data": {"address": "192.0.2.1"},
+            },
+        )
+        if status == 200:
+            self.created.append(name)
+        return status
+
+    def update_record(self):
+        if not self.created:
+            return self.create_record()
+        return self.request(
+            "PUT",
+            f"{RECORDS_PATH}/{random.choice(self.created)}",
+            body={
+                "type": "A",
+                "ttl": 300,
+                "data": {"address": "192.0.2.1"},
+                "index": 0,
+            },
+        )
+
+    def delete_record(self):
+        if not self.created:
+            return self.create_record()
+        return self.request(
+            "DELETE",
+            f"{RECORDS_PATH}/{self.created.pop()}",
+            body={"type": "A", "data": {"address": "192.0.2.1"}, "index": 0},
+        )
+
+
+def parse_mix(mix_text: str) -> dict:
+    """
+    Parses an operation mix such as "list_records=3,get_record=1" into a mapping of operation to weight.
+    """
+    mix = {}
+    for item in mix_text.split(","):
+        operation, _, weight = item.partition("=")
+        operation = operation.strip()
+        if operation not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(
+                f"Unknown operation '{operation}', expected one of {list(DEFAULT_MIX)}"
+            )
+        mix[operation] = float(weight or 1)
+    return mix
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(folder: str, *, workers: int):
+    """
+    Serves the production app with gunicorn from a zone folder, returning the process and its port once it's listening.
+    """
+    port = _free_port()
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "app:production",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        env=os.environ | {"ZONE_FILE_FOLDER": folder},
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited before serving the app")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("gunicorn didn't start listening within 30 seconds")
+
+
+def start_threaded(folder: str):
+    """
+    Serves the app with the multi-threaded development server from a zone folder, returning the server and its port.
+    """
+    os.environ["ZONE_FILE_FOLDER"] = folder
+    # imported here so that gunicorn runs aren't slowed by the app in this process too
+    from app import create_app  # pylint: disable=import-outside-toplevel
+
+    # without a level, werkzeug logs every request
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_port
+
+
+# pylint: disable=too-many-arguments
+def run_load(
+    port: int,
+    *,
+    mix: dict,
+    records: int,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+) -> dict:
+    """
+    Replays the operation mix from concurrency clients for warmup and then duration seconds, returning the latencies and
+    statuses of each operation's requests after the warmup.
+    """
+    operations = list(mix)
+    weights = [mix[operation] for operation in operations]
+    samples = {operation: [] for operation in operations}
+    statuses = {operation: {} for operation in operations}
+    lock = threading.Lock()
+    start = time.monotonic() + warmup
+    deadline = start + duration
+
+    def run_client(client: Client):
+        while (now := time.monotonic()) < deadline:
+            operation = random.choices(operations, weights)[0]
+            sent = time.perf_counter()
+            status = getattr(client, operation)()
+            latency = time.perf_counter() - sent
+            if now < start:
+                continue
+            with lock:
+                samples[operation].append(latency)
+                statuses[operation][status] = statuses[operation].get(status, 0) + 1
+
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(Client(port, client_id=client_id, records=records),),
+        )
+        for client_id in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"samples": samples, "statuses": statuses}
+
+
+# pylint: enable=too-many-arguments
+
+
+def report(load: dict, *, duration: float) -> list[dict]:
+    results = []
+    for operation, samples in load["samples"].items():
+        if not samples:
+            continue
+        statuses = load["statuses"][operation]
+        results.append(
+            {
+                "operation": operation,
+                "requests": len(samples),
+                "errors": sum(
+                    count
+                    for status, count in statuses.items()
+                    if not 200 <= status < 400
+                ),
+                "throughput": len(samples) / duration,
+                "p50": percentile(samples, 0.5),
+                "p95": percentile(samples, 0.95),
+                "p99": percentile(samples, 0.99),
+                "statuses": {str(status): count for status, count in statuses.items()},
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument(
+        "--server", choices=("gunicorn", "threaded"), default="gunicorn"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="gunicorn worker processes"
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=2,
+        help="seconds of load before latencies are recorded",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help=f"operations and their weights, from {','.join(DEFAULT_MIX)}",
+    )
+    parser.add_argument("--output", help="file to write the JSON results to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_synthetic_zone(folder, records=args.records)
+        if args.server == "gunicorn":
+            server, port = start_gunicorn(folder, workers=args.workers)
+        else:
+            server, port = start_threaded(folder)
+        try:
+            load = run_load(
+                port,
+                mix=args.mix,
+                records=args.records,
+                concurrency=args.concurrency,
+                duration=args.duration,
+                warmup=args.warmup,
+            )
+        finally:
+            if args.server == "gunicorn":
+                server.terminate()
+                server.wait()
+            else:
+                server.shutdown()
+
+    results = report(load, duration=args.duration)
+    print(
+        f"{'operation':<14} {'requests':>9} {'errors':>7} {'req/sec':>9}"
+        f" {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for result in results:
+        print(
+            f"{result['operation']:<14} {result['requests']:>9} {result['errors']:>7}"
+            f" {result['throughput']:>9.1f} {result['p50'] * 1000:>9.2f}"
+            f" {result['p95'] * 1000:>9.2f} {result['p99'] * 1000:>9.2f}"
+        )
+    total = sum(result["requests"] for result in results)
+    print(f"\n{total / args.duration:.1f} requests/sec in total")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"parameters": vars(args), "results": results},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
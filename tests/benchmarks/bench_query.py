@@ -0,0 +1,108 @@
+"""
+Measures the throughput of the authoritative query responder, in queries per second.
+
+The responder is benchmarked as served by ZoneForge's DNS listener, and, for comparison, hosted in the nanonameserver
+test harness bundled with the tests:
+
+    python -m tests.benchmarks.bench_query --records 10000 --clients 8 --duration 5
+"""
+
+import argparse
+import random
+import tempfile
+import dns.exception
+import dns.message
+import dns.query
+import dns.zone
+from tests.functional.dnspython.tests.nanonameserver import (
+    ConnectionType as NanoConnectionType,
+    Server,
+)
+from tests.benchmarks import ORIGIN, run_clients
+from tests.benchmarks.zonegen import write_synthetic_zone
+from zoneforge.core.store import ZoneStore
+from zoneforge.server import ConnectionType, DnsServer, Request
+from zoneforge.server.query import QueryHandler
+
+
+class HandlerNanoNameserver(Server):
+    """
+    Serves the first of a list of ZoneForge request handlers from the nanonameserver test harness, like a DnsServer.
+    """
+
+    def __init__(self, handlers: list):
+        super().__init__(protocols=(NanoConnectionType.UDP, NanoConnectionType.TCP))
+        self.handler = handlers[0]
+
+    def handle(self, request):
+        return self.handler.handle(
+            Request(
+                request.message,
+                wire=request.wire,
+                peer=request.peer,
+                connection_type=ConnectionType(request.connection_type),
+            )
+        )
+
+
+def query_sender(address: tuple, qnames: list[str]):
+    """
+    Returns a function that sends a query for a random one of qnames, returning whether it was answered.
+    """
+
+    def send():
+        query = dns.message.make_query(random.choice(qnames), "A")
+        try:
+            dns.query.udp(query, address[0], port=address[1], timeout=2)
+        except dns.exception.Timeout:
+            return False
+        return True
+
+    return send
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument(
+        "--nxdomain-ratio",
+        type=float,
+        default=0.1,
+        help="share of queries for names that don't exist",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = write_synthetic_zone(
+            folder, records=args.records, origin=ORIGIN, mix={"A": 1}
+        )
+        names = [
+            name.to_text()
+            for name in dns.zone.from_file(path, origin=ORIGIN, relativize=False)
+        ]
+        missing = [f"missing{i}.{ORIGIN}" for i in range(len(names))]
+        qnames = names + missing[: int(len(names) * args.nxdomain_ratio)]
+
+        for label, server_class in (
+            ("zoneforge", DnsServer),
+            ("nanonameserver", HandlerNanoNameserver),
+        ):
+            handler = QueryHandler(
+                ZoneStore(folder, revalidate_interval=1), cache_size=len(qnames)
+            )
+            with server_class([handler]) as server:
+                answered, failed = run_clients(
+                    query_sender(server.udp_address, qnames),
+                    clients=args.clients,
+                    duration=args.duration,
+                )
+            print(
+                f"{label:>15}: {answered / args.duration:10.0f} queries/sec"
+                f" ({answered} answered, {failed} timed out)"
+            )
+
+
+if __name__ == "__main__":
+    main()
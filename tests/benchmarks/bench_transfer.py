@@ -0,0 +1,145 @@
+"""
+Measures inbound zone transfers of synthetic zones, from the nanonameserver test harness bundled with the tests.
+
+Each transfer runs zone_from_zone_transfer in a fresh process, so that its peak RSS isn't raised by earlier ones. The time
+spent transferring the zone is reported separately from the time spent writing it to its zone file:
+
+    python -m tests.benchmarks.bench_transfer --records 1000,10000,100000 --repeat 3
+    python -m tests.benchmarks.bench_transfer --records 100000 --modes tcp --rrset-width 50
+
+A first transfer into an empty zone is always an AXFR, which dnspython only sends over TCP, so in the udp-try-first mode the
+UDP attempt is skipped as it would be for a new secondary zone.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import dns.name
+from tests.benchmarks.bench_query import HandlerNanoNameserver
+from tests.benchmarks.zonegen import (
+    DEFAULT_ORIGIN,
+    add_zone_arguments,
+    write_synthetic_zone,
+    zone_arguments,
+)
+from zoneforge.core.store import ZoneStore
+from zoneforge.server.xfr import XfrHandler
+
+MODES = {"tcp": False, "udp-try-first": True}
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is kept across exec on Linux, so it would include the size of the parent process when it forked
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # in KiB on Linux, but bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _transfer(address: tuple, *, use_udp: bool, results):
+    # imported in the transfer's own process, so that its baseline RSS includes the modules it needs
+    from zoneforge.core.transfer import (  # pylint: disable=import-outside-toplevel
+        zone_from_zone_transfer,
+    )
+
+    rss_before = _peak_rss()
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        zone = zone_from_zone_transfer(
+            zone_name=dns.name.from_text(DEFAULT_ORIGIN),
+            zonefile_folder=folder,
+            nameserver_ip=address[0],
+            nameserver_port=address[1],
+            use_udp=use_udp,
+            write=False,
+        )
+        transferred = time.perf_counter()
+        zone.write_to_file()
+        written = time.perf_counter()
+        records = sum(len(rdataset) for _, rdataset in zone.iterate_rdatasets())
+    results.put(
+        {
+            "records": records,
+            "transfer": transferred - start,
+            "write": written - transferred,
+            "rss_before": rss_before,
+            "peak_rss": _peak_rss(),
+        }
+    )
+
+
+def measure(address: tuple, *, use_udp: bool, repeat: int) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    runs = []
+    for _ in range(repeat):
+        process = context.Process(
+            target=_transfer,
+            args=(address,),
+            kwargs={"use_udp": use_udp, "results": results},
+        )
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Transfer process exited with {process.exitcode}")
+        runs.append(results.get())
+    transfer = statistics.fmean(run["transfer"] for run in runs)
+    return {
+        "records": runs[0]["records"],
+        "transfer": transfer,
+        "write": statistics.fmean(run["write"] for run in runs),
+        "records_per_sec": runs[0]["records"] / transfer,
+        "rss_before": max(run["rss_before"] for run in runs),
+        "peak_rss": max(run["peak_rss"] for run in runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--records",
+        type=lambda text: [int(size) for size in text.split(",")],
+        default=[1000, 10000, 100000],
+        help="comma separated zone sizes",
+    )
+    parser.add_argument(
+        "--modes", type=lambda text: text.split(","), default=list(MODES)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    add_zone_arguments(parser)
+    args = parser.parse_args()
+
+    for records in args.records:
+        with tempfile.TemporaryDirectory() as folder:
+            write_synthetic_zone(folder, records=records, **zone_arguments(args))
+            store = ZoneStore(folder)
+            handler = XfrHandler(store)
+            # renders and caches the transfer's messages, so the first mode measured doesn't include it
+            handler.axfr_messages(store.get(dns.name.from_text(DEFAULT_ORIGIN)))
+            with HandlerNanoNameserver([handler]) as server:
+                for mode in args.modes:
+                    result = measure(
+                        server.tcp_address, use_udp=MODES[mode], repeat=args.repeat
+                    )
+                    print(
+                        f"{mode:>13} {result['records']:>8} records:"
+                        f" {result['records_per_sec']:10.0f} records/sec,"
+                        f" transfer {result['transfer'] * 1000:10.1f} ms,"
+                        f" write {result['write'] * 1000:10.1f} ms,"
+                        f" peak RSS {result['peak_rss'] / 2**20:7.1f} MiB"
+                        f" (from {result['rss_before'] / 2**20:.1f} MiB)"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Measures the throughput of dynamic updates to a single zone, in updates per second.
+
+    python -m tests.benchmarks.bench_update --records 10000 --clients 32 --duration 5
+"""
+
+import argparse
+import ipaddress
+import itertools
+import tempfile
+import dns.exception
+import dns.query
+import dns.rcode
+import dns.update
+from tests.benchmarks import ORIGIN, run_clients
+from tests.benchmarks.zonegen import write_synthetic_zone
+from zoneforge.core.store import zone_store
+from zoneforge.server import DnsServer
+from zoneforge.server.update import UpdateHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--write-delay", type=float, default=1)
+    parser.add_argument("--batch-window", type=float, default=0.002)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        write_synthetic_zone(folder, records=args.records, origin=ORIGIN, mix={"A": 1})
+        handler = UpdateHandler(
+            zone_store(folder, max_versions=10),
+            allowed_networks=[ipaddress.ip_network("127.0.0.1/32")],
+            write_delay=args.write_delay,
+            batch_window=args.batch_window,
+        )
+        serials = itertools.count()
+        with DnsServer([handler]) as server:
+            address, port = server.udp_address[:2]
+
+            def send():
+                update = dns.update.UpdateMessage(ORIGIN)
+                update.add(f"dyn{next(serials)}", 300, "A", "10.255.0.1")
+                try:
+                    response = dns.query.udp(update, address, port=port, timeout=5)
+                except dns.exception.Timeout:
+                    return False
+                return response.rcode() == dns.rcode.NOERROR
+
+            applied, failed = run_clients(
+                send, clients=args.clients, duration=args.duration
+            )
+            handler.flush()
+        print(
+            f"{applied / args.duration:10.0f} updates/sec"
+            f" ({applied} applied, {failed} failed, {handler.commits} commits,"
+            f" {handler.writes} zone file writes)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Generates deterministic synthetic zone files for benchmarks.
+
+The same arguments always produce the same zone, so results can be compared between runs:
+
+    python -m tests.benchmarks.zonegen --records 100000 --mix A=60,AAAA=20,TXT=10,MX=5,SRV=5 ./zones
+    python -m tests.benchmarks.zonegen --records 100000 --rrset-width 50 --txt-length 1000 ./zones
+"""
+
+import argparse
+import random
+from os.path import join
+
+DEFAULT_ORIGIN = "synthetic.example."
+DEFAULT_MIX = {"A": 50, "AAAA": 20, "CNAME": 10, "TXT": 10, "MX": 5, "SRV": 5}
+# CNAMEs can't share their name with other records, so they are never grouped into wider RRsets
+SINGLETON_TYPES = {"CNAME"}
+TXT_STRING_LENGTH = 255
+
+
+def parse_mix(mix_text: str) -> dict:
+    """
+    Parses a record type mix such as "A=60,AAAA=20,TXT=20" into a mapping of record type to weight.
+    """
+    mix = {}
+    for item in mix_text.split(","):
+        record_type, _, weight = item.partition("=")
+        mix[record_type.strip().upper()] = float(weight or 1)
+    return mix
+
+
+# pylint: disable=too-many-arguments
+def write_synthetic_zone(
+    folder: str,
+    *,
+    records: int,
+    origin: str = DEFAULT_ORIGIN,
+    mix: dict = None,
+    rrset_width: int = 1,
+    txt_length: int = 40,
+    seed: int = 0,
+) -> str:
+    """
+    Writes a zone of about the provided number of records, returning the path of its zone file.
+
+    Record types are picked from mix by weight. Each RRset holds rrset_width records, so a width of 1 gives as many names as
+    records, and larger widths give fewer names with wide RRsets. TXT records hold txt_length characters, split into
+    strings of at most 255 characters.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    path = join(folder, f"{origin}zone")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"$ORIGIN {origin}\n")
+        f.write("@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300\n")
+        f.write("@ 3600 IN NS ns1\n")
+        f.write("ns1 3600 IN A 10.0.0.1\n")
+        index = 0
+        for rrset, record_type in enumerate(_record_types(rng, mix)):
+            if index >= records:
+                break
+            width = 1 if record_type in SINGLETON_TYPES else rrset_width
+            for index in range(index, min(index + width, records)):
+                rdata = _rdata(rng, record_type, index=index, txt_length=txt_length)
+                f.write(f"n{rrset} 3600 IN {record_type} {rdata}\n")
+            index += 1
+    return path
+
+
+# pylint: enable=too-many-arguments
+
+
+def _record_types(rng: random.Random, mix: dict):
+    record_types = list(mix)
+    weights = [mix[record_type] for record_type in record_types]
+    while True:
+        yield rng.choices(record_types, weights)[0]
+
+
+def _rdata(rng: random.Random, record_type: str, *, index: int, txt_length: int):
+    # the index keeps records within an RRset distinct, since duplicates would be merged
+    if record_type == "A":
+        return f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+    if record_type == "AAAA":
+        return f"fd00::{index >> 16 & 0xffff:x}:{index & 0xffff:x}"
+    if record_type == "CNAME":
+        return f"target{rng.randrange(1000)}"
+    if record_type == "MX":
+        return f"{index % 65536} mail{rng.randrange(100)}"
+    if record_type == "SRV":
+        return f"{rng.randrange(100)} {rng.randrange(100)} {index % 65536} srv{rng.randrange(100)}"
+    if record_type == "TXT":
+        text = "".join(
+            rng.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=txt_length - 8)
+        )
+        text = f"{index:08x}{text}"
+        return " ".join(
+            f'"{text[i:i + TXT_STRING_LENGTH]}"'
+            for i in range(0, len(text), TXT_STRING_LENGTH)
+        )
+    raise ValueError(f"Unsupported record type '{record_type}' in the mix")
+
+
+def add_zone_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the options shaping synthetic zones to a command line parser.
+    """
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="record types and their weights, e.g. A=60,AAAA=20,TXT=20",
+    )
+    parser.add_argument("--rrset-width", type=int, default=1)
+    parser.add_argument("--txt-length", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def zone_arguments(args: argparse.Namespace) -> dict:
+    """
+    Returns the keyword arguments for write_synthetic_zone from options added by add_zone_arguments.
+    """
+    return {
+        "mix": args.mix,
+        "rrset_width": args.rrset_width,
+        "txt_length": args.txt_length,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("folder")
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--origin", default=DEFAULT_ORIGIN)
+    add_zone_arguments(parser)
+    args = parser.parse_args()
+    path = write_synthetic_zone(
+        args.folder, records=args.records, origin=args.origin, **zone_arguments(args)
+    )
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
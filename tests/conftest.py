@@ -110,3 +110,21 @@ def client_single_zone(app_with_single_zone):
 @pytest.fixture()
 def client_multi_zone(app_with_multi_zones):
     return app_with_multi_zones.test_client()
+
+
+@pytest.fixture()
+def app_auth(tmp_path, monkeypatch):
+    monkeypatch.setenv("ZONE_FILE_FOLDER", str(tmp_path))
+    monkeypatch.setenv("AUTH_ENABLED", "true")
+    monkeypatch.setenv("AUTH_DB_URI", f"sqlite:///{tmp_path / 'zoneinfo.db'}")
+    monkeypatch.setenv("AUTH_BCRYPT_ROUNDS", "4")
+
+    app = create_app()
+    app.config.update({"TESTING": True})
+    app.app_context().push()
+    yield app
+
+
+@pytest.fixture()
+def client_auth(app_auth):
+    return app_auth.test_client()
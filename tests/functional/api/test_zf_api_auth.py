@@ -0,0 +1,341 @@
+import jwt
+import sqlalchemy
+from werkzeug.exceptions import ServiceUnavailable
+import zoneforge.api
+import zoneforge.passwords
+from tests.benchmarks.zonegen import write_synthetic_zone
+from zoneforge.api import PERMISSION_BITS, token_cache, user_cache
+from zoneforge.db import db
+from zoneforge.db.db_model import Group, Role, User
+
+
+def _login(client, username, *, roles=()):
+    client.post("/api/auth/signup", json={"username": username, "password": "secret"})
+    user = db.session.execute(db.select(User).filter_by(username=username)).scalar_one()
+    group = Group(name=f"{username}_group", roles=[Role(name=role) for role in roles])
+    db.session.add(group)
+    user.group = group
+    db.session.commit()
+    res = client.post(
+        "/api/auth/login", json={"username": username, "password": "secret"}
+    )
+    return {"Authorization": f"Bearer {res.json['token']}"}
+
+
+def test_zf_api_auth_cached(client_auth):
+    """
+    GIVEN a user with permission to read groups
+    WHEN the user makes repeated requests with the same token
+    THEN check that the token is verified and the user looked up only once, and invalid tokens are rejected
+    """
+    headers = _login(client_auth, "reader", roles=["group_read"])
+    token_hits, user_hits = token_cache.hits, user_cache.hits
+    for _ in range(3):
+        res = client_auth.get("/api/rbac/group", headers=headers)
+        assert res.status_code == 200
+    assert token_cache.hits - token_hits == 2
+    assert user_cache.hits - user_hits == 2
+
+    res = client_auth.post("/api/rbac/group", json={"name": "x"}, headers=headers)
+    assert res.status_code == 403
+    res = client_auth.get(
+        "/api/rbac/group", headers={"Authorization": "Bearer invalid"}
+    )
+    assert res.status_code == 401
+    res = client_auth.get("/api/rbac/group")
+    assert res.status_code == 401
+
+
+def test_zf_api_auth_permissions(app_auth, client_auth):
+    """
+    GIVEN a user in a group with roles
+    WHEN the user logs in, before and after another role is assigned to the group
+    THEN check that the token carries the group's permissions as a bitset, and a repeated login costs a single query
+    """
+    headers = _login(client_auth, "writer", roles=["roleAssignGroup_read"])
+    claims = jwt.decode(
+        headers["Authorization"].removeprefix("Bearer "),
+        app_auth.config["TOKEN_SECRET"],
+        algorithms="HS256",
+    )
+    assert claims["permissions"] == PERMISSION_BITS["roleAssignGroup_read"]
+
+    statements = []
+    sqlalchemy.event.listen(
+        db.engine,
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+    res = client_auth.post(
+        "/api/auth/login", json={"username": "writer", "password": "secret"}
+    )
+    assert res.status_code == 200
+    assert len(statements) == 1
+
+    role = Role(name="group_create")
+    db.session.add(role)
+    db.session.commit()
+    group_id = db.session.execute(
+        db.select(Group.id).filter_by(name="writer_group")
+    ).scalar_one()
+    res = client_auth.post(
+        f"/api/rbac/group/{group_id}/role/{role.id}", headers=headers
+    )
+    assert res.status_code == 201
+    res = client_auth.post("/api/rbac/group", json={"name": "new"}, headers=headers)
+    assert res.status_code == 403
+
+    res = client_auth.post(
+        "/api/auth/login", json={"username": "writer", "password": "secret"}
+    )
+    headers = {"Authorization": f"Bearer {res.json['token']}"}
+    res = client_auth.post("/api/rbac/group", json={"name": "new"}, headers=headers)
+    assert res.status_code == 201
+
+
+def test_zf_api_auth_passwords(client_auth, mocker):
+    """
+    GIVEN a user whose password was hashed with a lower bcrypt cost
+    WHEN the user logs in after the cost is raised, when the upgrade can't be done, and when no password work can be accepted
+    THEN check that the hash is upgraded to the new cost, a failed upgrade still logs in, and logins are turned away with 503 when busy
+    """
+    _login(client_auth, "hashed")
+    zoneforge.passwords.configure(rounds=5)
+    credentials = {"username": "hashed", "password": "secret"}
+    res = client_auth.post("/api/auth/login", json=credentials)
+    assert res.status_code == 200
+    user = db.session.execute(db.select(User).filter_by(username="hashed")).scalar_one()
+    assert user.password.startswith("$2b$05$")
+
+    # a correct password still logs in when there's no capacity left to upgrade its hash
+    hasher = zoneforge.passwords.configure(rounds=6)
+    mocker.patch.object(hasher, "hash", side_effect=ServiceUnavailable("busy"))
+    res = client_auth.post("/api/auth/login", json=credentials)
+    assert res.status_code == 200
+    db.session.refresh(user)
+    assert user.password.startswith("$2b$05$")
+
+    zoneforge.passwords.configure(rounds=5, max_concurrent=0)
+    res = client_auth.post("/api/auth/login", json=credentials)
+    assert res.status_code == 503
+
+
+def test_zf_api_auth_sqlite_pragmas(client_auth):
+    """
+    GIVEN an app with a SQLite authentication database
+    WHEN a connection is opened
+    THEN check that it uses WAL and enforces foreign keys, so deleting a group leaves its users without one
+    """
+    assert db.session.execute(sqlalchemy.text("PRAGMA journal_mode")).scalar() == "wal"
+    assert db.session.execute(sqlalchemy.text("PRAGMA foreign_keys")).scalar() == 1
+
+    _login(client_auth, "member")
+    group = db.session.execute(db.select(Group)).scalar_one()
+    db.session.execute(sqlalchemy.delete(Group).where(Group.id == group.id))
+    db.session.commit()
+    user = db.session.execute(db.select(User).filter_by(username="member")).scalar_one()
+    assert user.group_id is None
+
+
+def test_zf_api_rbac_pages(client_auth):
+    """
+    GIVEN groups with members
+    WHEN groups and a group's members are listed a page at a time
+    THEN check that following next_after_id visits every entry once
+    """
+    headers = _login(client_auth, "lister", roles=["group_read"])
+    group = Group(name="big")
+    db.session.add(group)
+    db.session.add_all(
+        [User(username=f"member{i}", password="x", group=group) for i in range(5)]
+    )
+    db.session.commit()
+
+    names, after_id = [], 0
+    while after_id is not None:
+        res = client_auth.get(
+            f"/api/rbac/group?limit=1&after_id={after_id}", headers=headers
+        )
+        assert res.status_code == 200
+        names += [group["group_name"] for group in res.json["groups"]]
+        after_id = res.json["next_after_id"]
+    assert names == ["lister_group", "big"]
+
+    res = client_auth.get(f"/api/rbac/group/{group.id}/user?limit=3", headers=headers)
+    assert [user["username"] for user in res.json["users"]] == [
+        "member0",
+        "member1",
+        "member2",
+    ]
+    res = client_auth.get(
+        f"/api/rbac/group/{group.id}/user?limit=3"
+        f"&after_id={res.json['next_after_id']}",
+        headers=headers,
+    )
+    assert [user["username"] for user in res.json["users"]] == ["member3", "member4"]
+    assert res.json["next_after_id"] is None
+
+
+def test_zf_api_zone_grants(app_auth, client_auth):
+    """
+    GIVEN a user whose group is granted read on every zone below example.com. and write on one of them
+    WHEN zones and records are listed and changed
+    THEN check that listings only include granted zones, changes require the write permission, and pages need the read permission
+    """
+    admin = _login(client_auth, "admin", roles=["zoneGrant_create"])
+    headers = _login(client_auth, "editor")
+    group_id = db.session.execute(
+        db.select(Group.id).filter_by(name="editor_group")
+    ).scalar_one()
+    for zone_pattern, permissions in (
+        ("*.example.com", ["read"]),
+        ("a.example.com", ["write"]),
+    ):
+        res = client_auth.post(
+            f"/api/rbac/group/{group_id}/zone",
+            json={"zone_pattern": zone_pattern, "permissions": permissions},
+            headers=admin,
+        )
+        assert res.status_code == 201
+    for zone_name in ("a.example.com.", "b.example.com.", "example.org."):
+        write_synthetic_zone(
+            app_auth.config["ZONE_FILE_FOLDER"], records=0, origin=zone_name
+        )
+
+    res = client_auth.get("/api/zones", headers=headers)
+    assert sorted(zone["name"] for zone in res.json) == [
+        "a.example.com.",
+        "b.example.com.",
+    ]
+    assert client_auth.get("/api/zones").status_code == 401
+
+    record = {"name": "www", "type": "A", "ttl": 300, "data": {"address": "10.0.0.1"}}
+    for zone_name, status_code in (("a.example.com.", 200), ("b.example.com.", 403)):
+        res = client_auth.post(
+            f"/api/zones/{zone_name}/records", json=record, headers=headers
+        )
+        assert res.status_code == status_code
+    res = client_auth.get("/api/zones/example.org./records", headers=headers)
+    assert res.status_code == 403
+    # errors raised by the resource itself aren't taken for authorization errors
+    res = client_auth.get("/api/zones/a.example.com./records/missing", headers=headers)
+    assert res.status_code == 404
+
+    # the web UI sends a user without a login to the login page, and refuses a logged in user without the permission
+    assert client_auth.get("/zone/a.example.com.", headers=headers).status_code == 200
+    assert client_auth.get("/zone/example.org.", headers=headers).status_code == 403
+    res = client_auth.get("/zone/example.org.")
+    assert res.status_code == 302
+    assert res.location.endswith("/login")
+
+
+def test_zf_api_auth_logout(client_auth):
+    """
+    GIVEN a logged in user
+    WHEN the user logs out
+    THEN check that both of the session's tokens are refused, without looking up tokens the revocation filter doesn't match
+    """
+    client_auth.post(
+        "/api/auth/signup", json={"username": "leaver", "password": "secret"}
+    )
+    tokens = client_auth.post(
+        "/api/auth/login", json={"username": "leaver", "password": "secret"}
+    ).json
+    other_tokens = client_auth.post(
+        "/api/auth/login", json={"username": "leaver", "password": "secret"}
+    ).json
+    headers = {"Authorization": f"Bearer {tokens['token']}"}
+    refresh_headers = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+    res = client_auth.post("/api/auth/refresh", headers=refresh_headers)
+    assert res.status_code == 200
+
+    res = client_auth.post("/api/auth/logout", headers=headers)
+    assert res.status_code == 200
+    assert len(zoneforge.api.revocation_list) == 1
+    res = client_auth.post("/api/auth/logout", headers=headers)
+    assert res.status_code == 401
+    res = client_auth.post("/api/auth/refresh", headers=refresh_headers)
+    assert res.status_code == 401
+
+    statements = []
+    sqlalchemy.event.listen(
+        db.engine,
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+    res = client_auth.post(
+        "/api/auth/refresh",
+        headers={"Authorization": f"Bearer {other_tokens['refresh_token']}"},
+    )
+    assert res.status_code == 200
+    assert not any("revoked_token" in statement for statement in statements)
+
+
+def test_zf_api_auth_login_throttled(client_auth, monkeypatch):
+    """
+    GIVEN a user
+    WHEN logins with a wrong password are repeated
+    THEN check that further attempts are refused with 429 without checking the password, even with the right one
+    """
+    client_auth.post(
+        "/api/auth/signup", json={"username": "target", "password": "secret"}
+    )
+    checks = []
+    check = zoneforge.passwords.hasher.check
+    monkeypatch.setattr(
+        zoneforge.passwords.hasher,
+        "check",
+        lambda *args: checks.append(args) or check(*args),
+    )
+    for _ in range(10):
+        res = client_auth.post(
+            "/api/auth/login", json={"username": "target", "password": "wrong!"}
+        )
+        assert res.status_code == 401
+    res = client_auth.post(
+        "/api/auth/login", json={"username": "target", "password": "secret"}
+    )
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) > 0
+    assert len(checks) == 10
+
+
+def test_zf_api_auth_status_diagnostics(app_auth, client_auth):
+    """
+    GIVEN users with and without the serverDiagnostics_read role, and a metrics scrape token
+    WHEN they request NOTIFY statistics and metrics
+    THEN only the user with the role, or the scrape token for metrics, gets past authorization
+    """
+    headers = _login(client_auth, "reader", roles=["group_read"])
+    assert client_auth.get("/api/status/notify", headers=headers).status_code == 403
+    assert client_auth.get("/api/status/metrics", headers=headers).status_code == 403
+
+    headers = _login(client_auth, "admin", roles=["serverDiagnostics_read"])
+    assert client_auth.get("/api/status/notify", headers=headers).status_code == 200
+    # metrics are disabled by default
+    assert client_auth.get("/api/status/metrics", headers=headers).status_code == 404
+
+    app_auth.config["METRICS_SCRAPE_TOKEN"] = "scrape-secret"
+    headers = {"Authorization": "Bearer scrape-secret"}
+    assert client_auth.get("/api/status/metrics", headers=headers).status_code == 404
+    assert client_auth.get("/api/status/notify", headers=headers).status_code == 401
+    headers = {"Authorization": "Bearer wrong-secret"}
+    assert client_auth.get("/api/status/metrics", headers=headers).status_code == 401
+
+
+def test_zf_api_auth_memory_diagnostics(client_auth):
+    """
+    GIVEN users with and without the serverDiagnostics_read role
+    WHEN they request the server's memory use
+    THEN only the user with the role gets it
+    """
+    headers = _login(client_auth, "reader", roles=["group_read"])
+    res = client_auth.get("/api/status/memory", headers=headers)
+    assert res.status_code == 403
+    res = client_auth.post("/api/status/memory", headers=headers)
+    assert res.status_code == 403
+
+    headers = _login(client_auth, "admin", roles=["serverDiagnostics_read"])
+    res = client_auth.get("/api/status/memory", headers=headers)
+    assert res.status_code == 200
+    assert res.json["tracing"] is False
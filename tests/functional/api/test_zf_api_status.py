@@ -1,3 +1,22 @@
+import json
+import subprocess
+import sys
+import pytest
+import zoneforge.metrics
+
+
+# pylint: disable=redefined-outer-name
+@pytest.fixture()
+def metrics_directory(tmp_path, monkeypatch):
+    directory = tmp_path / "metrics"
+    monkeypatch.setenv("METRICS_ENABLED", "true")
+    monkeypatch.setenv("METRICS_DIR", str(directory))
+    yield directory
+    # the metrics directory is removed along with tmp_path
+    zoneforge.metrics.writer.stop()
+    zoneforge.metrics.writer = None
+
+
 def test_zf_api_status(client_new):
     """
     GIVEN a web client for a newly initialized server
@@ -19,3 +38,109 @@ def test_zf_api_version(client_new):
     assert res.status_code == 200
     assert res.json["version"] is not None
     assert isinstance(res.json["version"], str)
+
+
+def test_zf_api_notify_stats(client_new):
+    """
+    GIVEN a web client for a newly initialized server
+    WHEN NOTIFY statistics are requested
+    THEN returns a list of per-target statistics
+    """
+    res = client_new.get("/api/status/notify")
+    assert res.status_code == 200
+    assert isinstance(res.json, list)
+
+
+def test_zf_api_metrics(metrics_directory, client_single_zone):
+    """
+    GIVEN a web client for a server with a zone, and metrics written by another worker and by one that has exited
+    WHEN metrics are requested after requests for the zone, twice
+    THEN returns Prometheus text with zone, cache and request metrics, request counts added up across every worker once,
+    and gauges of running workers only
+    """
+    client_single_zone.get("/api/zones/example.com.")
+    other_worker = zoneforge.metrics.snapshot()
+    other_worker["zoneforge_http_requests_total"]["values"] = [
+        [["GET", "/api/zones/<string:zone_name>", "200"], 5]
+    ]
+    (metrics_directory / "1.json").write_text(
+        json.dumps(other_worker), encoding="utf-8"
+    )
+    with subprocess.Popen([sys.executable, "-c", ""]) as exited_worker:
+        exited_worker.wait()
+    exited_worker_path = metrics_directory / f"{exited_worker.pid}.json"
+    other_worker["zoneforge_zone_file_bytes"]["values"] = [
+        [["exited.example."], [100, 0]]
+    ]
+    exited_worker_path.write_text(json.dumps(other_worker), encoding="utf-8")
+
+    res = client_single_zone.get("/api/status/metrics")
+    assert res.status_code == 200
+    assert res.mimetype == "text/plain"
+    lines = res.get_data(as_text=True).splitlines()
+    assert (
+        'zoneforge_http_requests_total{method="GET",endpoint="/api/zones/<string:zone_name>",status="200"} 11'
+        in lines
+    )
+    assert "# TYPE zoneforge_http_request_duration_seconds histogram" in lines
+    assert any(
+        line.startswith('zoneforge_zone_file_bytes{zone="example.com."}')
+        for line in lines
+    )
+    assert any(
+        line.startswith('zoneforge_cache_hits_total{cache="token"}') for line in lines
+    )
+    assert not any(
+        line.startswith('zoneforge_zone_file_bytes{zone="exited.') for line in lines
+    )
+    # the exited worker's counters are kept, and only counted once
+    assert not exited_worker_path.exists()
+    lines = client_single_zone.get("/api/status/metrics").get_data(as_text=True)
+    assert (
+        'zoneforge_http_requests_total{method="GET",endpoint="/api/zones/<string:zone_name>",status="200"} 11'
+        in lines.splitlines()
+    )
+
+
+def test_zf_api_memory(client_single_zone, monkeypatch):
+    """
+    GIVEN a web client for a server with a zone
+    WHEN memory use is requested after the zone was loaded, and while allocations are traced once tracing is enabled
+    THEN returns the worker's RSS and the zone's estimated footprint, then allocation sites in zoneforge code
+    """
+    client_single_zone.get("/api/zones/example.com.")
+    res = client_single_zone.get("/api/status/memory")
+    assert res.status_code == 200
+    assert res.json["rss_bytes"] > 0
+    assert res.json["tracing"] is False
+    (zone,) = [zone for zone in res.json["zones"] if zone["zone"] == "example.com."]
+    assert zone["names"] > 0
+    assert zone["total_bytes"] == (
+        zone["names_bytes"] + zone["rdatasets_bytes"] + zone["rdata_bytes"]
+    )
+    assert res.json["interning"]["references"] >= zone["names"]
+
+    assert client_single_zone.post("/api/status/memory").status_code == 404
+    monkeypatch.setitem(
+        client_single_zone.application.config, "MEMORY_TRACE_ENABLED", True
+    )
+    assert client_single_zone.post("/api/status/memory").json["tracing"] is True
+    try:
+        client_single_zone.post(
+            "/api/zones/example.com./records",
+            json={
+                "name": "traced",
+                "type": "TXT",
+                "ttl": 300,
+                "data": {"strings": "traced"},
+            },
+        )
+        res = client_single_zone.get("/api/status/memory?top=5")
+        assert res.json["tracing"] is True
+        assert 0 < len(res.json["allocations"]) <= 5
+        assert all(
+            site["module"].startswith("zoneforge.") for site in res.json["allocations"]
+        )
+    finally:
+        res = client_single_zone.delete("/api/status/memory")
+    assert res.json["tracing"] is False
@@ -2,6 +2,7 @@ from datetime import datetime
 import dns.rdatatype
 import dns.xfr
 from tests.functional.dnspython.tests.nanonameserver import Server
+from zoneforge.core import next_serial
 
 today_serial = datetime.now().strftime("%Y%m%d")
 XFR_RESPONSE = f"""id 1
@@ -43,7 +44,8 @@ def test_zf_api_zone_get_single(client_single_zone, zfzone_common_data):
     assert zone["soa"]["ttl"] == 36000
     assert zone["soa"]["data"]["mname"] == expected_soa.mname.to_text()
     assert zone["soa"]["data"]["rname"] == expected_soa.rname.to_text()
-    assert zone["soa"]["data"]["serial"] == expected_soa.serial
+    # the zone file was written with the serial following the zone's
+    assert zone["soa"]["data"]["serial"] == next_serial(expected_soa.serial)
     assert zone["soa"]["data"]["refresh"] == expected_soa.refresh
     assert zone["soa"]["data"]["retry"] == expected_soa.retry
     assert zone["soa"]["data"]["expire"] == expected_soa.expire
@@ -65,7 +67,8 @@ def test_zf_api_zone_get_single_specific(client_single_zone, zfzone_common_data)
     assert zone["soa"]["ttl"] == 36000
     assert zone["soa"]["data"]["mname"] == expected_soa.mname.to_text()
     assert zone["soa"]["data"]["rname"] == expected_soa.rname.to_text()
-    assert zone["soa"]["data"]["serial"] == expected_soa.serial
+    # the zone file was written with the serial following the zone's
+    assert zone["soa"]["data"]["serial"] == next_serial(expected_soa.serial)
     assert zone["soa"]["data"]["refresh"] == expected_soa.refresh
     assert zone["soa"]["data"]["retry"] == expected_soa.retry
     assert zone["soa"]["data"]["expire"] == expected_soa.expire
@@ -1,3 +1,8 @@
+import json
+import pytest
+from app import create_app
+
+
 def test_zf_app_home(client_new):
     """
     GIVEN a web client for a newly initialized server
@@ -44,3 +49,166 @@ def test_zf_app_signup(client_new):
     assert res.status_code == 200
     assert "text/html" in res.headers.get("Content-Type")
     assert "html" in res.text
+
+
+@pytest.mark.parametrize(
+    "profile_format", [("cprofile", "prof"), ("sampler", "collapsed")]
+)
+def test_zf_app_profiled(tmp_path, monkeypatch, profile_format):
+    """
+    GIVEN a server with profiling enabled
+    WHEN zone pages are requested, one of them with the profiling header, then several more with it
+    THEN only that request is profiled, and its profile is written with the request's details, keeping the latest profiles
+    """
+    mode, extension = profile_format
+    profile_dir = tmp_path / "profiles"
+    monkeypatch.setenv("ZONE_FILE_FOLDER", str(tmp_path))
+    monkeypatch.setenv("PROFILE_ENABLED", "true")
+    monkeypatch.setenv("PROFILE_DIR", str(profile_dir))
+    monkeypatch.setenv("PROFILE_MODE", mode)
+    monkeypatch.setenv("PROFILE_SAMPLE_INTERVAL", "0.0001")
+    monkeypatch.setenv("PROFILE_MAX_FILES", "2")
+    client = create_app().test_client()
+
+    res = client.get("/")
+    assert res.status_code == 200
+    assert not profile_dir.exists()
+    res = client.get("/", headers={"X-ZoneForge-Profile": "1"})
+    assert res.status_code == 200
+
+    (metadata_path,) = profile_dir.glob("*.json")
+    metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+    assert metadata["path"] == "/"
+    assert metadata["status"] == 200
+    assert metadata["trigger"] == "header"
+    assert metadata_path.with_suffix(f".{extension}").exists()
+
+    for _ in range(3):
+        client.get("/", headers={"X-ZoneForge-Profile": "1"})
+    assert len(list(profile_dir.glob("*.json"))) == 2
+    assert len(list(profile_dir.glob(f"*.{extension}"))) == 2
+
+
+def test_zf_app_access_log(tmp_path, monkeypatch, caplog):
+    """
+    GIVEN a server with the access log enabled and a slow request threshold below any request's duration
+    WHEN a zone page is requested and a record is created
+    THEN each request is logged as JSON with its phase timings and zone size, and also logged as a slow request
+    """
+    access_log = tmp_path / "access.log"
+    monkeypatch.setenv("ZONE_FILE_FOLDER", str(tmp_path))
+    monkeypatch.setenv("ACCESS_LOG_ENABLED", "true")
+    monkeypatch.setenv("ACCESS_LOG_FILE", str(access_log))
+    monkeypatch.setenv("SLOW_REQUEST_THRESHOLD", "0.000001")
+    (tmp_path / "example.com.zone").write_text(
+        "$ORIGIN example.com.\n@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300\n"
+        "@ 3600 IN NS ns1\nns1 3600 IN A 192.0.2.1\n",
+        encoding="utf-8",
+    )
+    client = create_app().test_client()
+
+    res = client.get("/zone/example.com.")
+    assert res.status_code == 200
+    res = client.post(
+        "/api/zones/example.com./records",
+        json={"name": "www", "type": "A", "ttl": 300, "data": {"address": "192.0.2.2"}},
+    )
+    assert res.status_code == 200
+
+    page, record = [
+        json.loads(line) for line in access_log.read_text(encoding="utf-8").splitlines()
+    ]
+    assert page["path"] == "/zone/example.com."
+    assert page["status"] == 200
+    assert page["zone"] == "example.com."
+    assert page["zone_records"] == 2
+    assert {"zone_load", "serialize", "render"} <= set(page["phases_ms"])
+    assert record["endpoint"] == "/api/zones/<string:zone_name>/records"
+    assert {"auth", "parse", "zone_load", "mutation", "file_write", "serialize"} <= set(
+        record["phases_ms"]
+    )
+    assert record["duration_ms"] >= sum(record["phases_ms"].values())
+    slow = [r for r in caplog.records if r.getMessage().startswith("Slow request")]
+    assert len(slow) == 2
+
+
+def test_zf_app_tracing(tmp_path, monkeypatch):
+    """
+    GIVEN a server with tracing enabled and exported to a directory
+    WHEN a record is created, and then recent traces are requested
+    THEN the request's trace holds the spans of the core functions it called, and the exported file holds the same spans
+    """
+    export_dir = tmp_path / "traces"
+    monkeypatch.setenv("ZONE_FILE_FOLDER", str(tmp_path))
+    monkeypatch.setenv("TRACING_ENABLED", "true")
+    monkeypatch.setenv("TRACE_EXPORT_DIR", str(export_dir))
+    (tmp_path / "example.com.zone").write_text(
+        "$ORIGIN example.com.\n@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300\n"
+        "@ 3600 IN NS ns1\nns1 3600 IN A 192.0.2.1\n",
+        encoding="utf-8",
+    )
+    client = create_app().test_client()
+
+    res = client.post(
+        "/api/zones/example.com./records",
+        json={"name": "www", "type": "A", "ttl": 300, "data": {"address": "192.0.2.2"}},
+    )
+    assert res.status_code == 200
+    res = client.get("/api/status/traces?limit=1")
+    assert res.status_code == 200
+    (trace,) = res.json["traces"]
+    assert trace["name"] == "POST /api/zones/<string:zone_name>/records"
+    root, *spans = trace["spans"]
+    assert root["parent_id"] is None
+    assert root["attributes"]["status"] == 200
+    assert {"core.get_zones", "core.request_to_rdata", "core.write_to_file"} <= {
+        span["name"] for span in spans
+    }
+    assert all(span["parent_id"] is not None for span in spans)
+
+    (export_file,) = export_dir.iterdir()
+    # the array of events is left open, as the trace event format allows
+    events = json.loads(f"[{export_file.read_text(encoding='utf-8').strip()[1:-1]}]")
+    # followed by the trace of the request listing traces
+    assert [event["name"] for event in events[: len(trace["spans"])]] == [
+        span["name"] for span in trace["spans"]
+    ]
+    assert all(event["ph"] == "X" for event in events)
+
+    assert client.delete("/api/status/traces").status_code == 200
+    # only the request discarding them finished afterwards
+    traces = client.get("/api/status/traces").json["traces"]
+    assert [trace["name"] for trace in traces] == ["DELETE /api/status/traces"]
+
+
+def test_zf_app_compact_zones(tmp_path, monkeypatch):
+    """
+    GIVEN a server listing zones and records from compact zones
+    WHEN the zone's records are listed before and after one is created
+    THEN the new record is listed, and the compact zone's memory is reported
+    """
+    monkeypatch.setenv("ZONE_FILE_FOLDER", str(tmp_path))
+    monkeypatch.setenv("COMPACT_ZONES", "true")
+    (tmp_path / "example.com.zone").write_text(
+        "$ORIGIN example.com.\n@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300\n"
+        "@ 3600 IN NS ns1\nns1 3600 IN A 192.0.2.1\n",
+        encoding="utf-8",
+    )
+    client = create_app().test_client()
+
+    res = client.get("/api/zones")
+    assert [zone["record_count"] for zone in res.json] == [2]
+    assert len(client.get("/api/zones/example.com./records").json) == 2
+    res = client.post(
+        "/api/zones/example.com./records",
+        json={"name": "www", "type": "A", "ttl": 300, "data": {"address": "192.0.2.2"}},
+    )
+    assert res.status_code == 200
+    res = client.get("/api/zones/example.com./records/www")
+    assert res.json[0]["data"] == {"address": "192.0.2.2"}
+    assert client.get("/api/zones/example.com./records/missing").status_code == 404
+    assert client.get("/zone/example.com.").status_code == 200
+
+    (compact,) = client.get("/api/status/memory").json["compact_zones"]
+    assert compact["zone"] == "example.com."
+    assert compact["rdata"] == 4
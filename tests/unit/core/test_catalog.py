@@ -0,0 +1,122 @@
+import os
+import time
+import dns.name
+import dns.zone
+import pytest
+from werkzeug.exceptions import Forbidden
+from zoneforge.core import create_zone, delete_zone, get_zones, update_catalog
+from zoneforge.core.catalog import catalog_members, is_catalog, new_catalog_zone
+from zoneforge.core.store import ZoneStore
+from zoneforge.core.transfer import sync_catalog
+from zoneforge.server import DnsServer
+from zoneforge.server.xfr import XfrHandler
+
+CATALOG = dns.name.from_text("catalog.invalid.")
+MEMBER_ZONE = """
+$ORIGIN {origin}
+@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300
+@ 86400 IN NS ns1
+ns1 86400 IN A 192.168.1.10
+"""
+
+
+def _write_member(folder, origin):
+    zone = dns.zone.from_text(MEMBER_ZONE.format(origin=origin), origin=origin)
+    zone.to_file(os.path.join(folder, f"{origin}zone"))
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def _write_catalog(folder, members, *, serial=1):
+    catalog = new_catalog_zone(CATALOG, members, serial=serial)
+    # replaced rather than rewritten, so the change is seen within the file timestamp granularity
+    path = os.path.join(folder, f"{CATALOG}zone")
+    catalog.to_file(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def test_catalog_maintained(app_with_single_zone, zfzone_common_data):
+    """
+    GIVEN a folder with an existing zone
+    WHEN zones are created and deleted with a catalog zone configured
+    THEN check that the catalog is created listing every zone, and updated incrementally with a new serial
+    """
+    folder = app_with_single_zone.config["ZONE_FILE_FOLDER"]
+    soa = zfzone_common_data.get_rrset("@", "SOA")
+    ns = zfzone_common_data.get_rrset("@", "NS")
+    new_name = dns.name.from_text("example.org.")
+    create_zone(
+        zone_name=new_name,
+        zonefile_folder=folder,
+        soa_rrset=soa,
+        ns_rrset=ns,
+        catalog_zone=CATALOG,
+    )
+    catalog = get_zones(folder, CATALOG)[0]
+    assert is_catalog(catalog)
+    assert catalog_members(catalog) == {zfzone_common_data.origin, new_name}
+    assert catalog.get_soa().serial == 1
+
+    delete_zone(zfzone_common_data.origin, folder, catalog_zone=CATALOG)
+    catalog = get_zones(folder, CATALOG)[0]
+    assert catalog_members(catalog) == {new_name}
+    assert catalog.get_soa().serial == 2
+
+    # unchanged membership leaves the catalog alone
+    update_catalog(catalog_zone=CATALOG, zonefile_folder=folder, added=[new_name])
+    assert get_zones(folder, CATALOG)[0].get_soa().serial == 2
+
+
+def test_catalog_sync(app_new, tmp_path_factory):
+    """
+    GIVEN a primary serving a catalog zone and its member zones
+    WHEN the catalog is synced, and again after its membership changes, by a user who may not and then may delete zones
+    THEN check that the sync is refused without changes if a member can't be deleted, otherwise only new members are
+    transferred and removed members are deleted locally
+    """
+    folder = app_new.config["ZONE_FILE_FOLDER"]
+    primary = str(tmp_path_factory.mktemp("primary"))
+    names = [dns.name.from_text(f"zone{i}.example.") for i in range(3)]
+    for name in names:
+        _write_member(primary, name)
+    _write_catalog(primary, names[:2])
+
+    with DnsServer([XfrHandler(ZoneStore(primary))]) as server:
+        address, port = server.tcp_address[:2]
+        res = sync_catalog(
+            catalog_name=CATALOG,
+            zonefile_folder=folder,
+            nameserver_ip=address,
+            nameserver_port=port,
+        )
+        assert res["added"] == ["zone0.example.", "zone1.example."]
+        assert not res["removed"]
+        assert _wait_for(lambda: len(get_zones(folder)) == 3)
+
+        _write_catalog(primary, names[1:], serial=2)
+        with pytest.raises(Forbidden):
+            sync_catalog(
+                catalog_name=CATALOG,
+                zonefile_folder=folder,
+                nameserver_ip=address,
+                nameserver_port=port,
+                authorize=lambda zone_name, permission: permission != "delete",
+            )
+        assert len(get_zones(folder)) == 3
+
+        res = sync_catalog(
+            catalog_name=CATALOG,
+            zonefile_folder=folder,
+            nameserver_ip=address,
+            nameserver_port=port,
+        )
+        assert res["added"] == ["zone2.example."]
+        assert res["removed"] == ["zone0.example."]
+        assert _wait_for(lambda: len(get_zones(folder)) == 3)
+    local = {zone.origin for zone in get_zones(folder)}
+    assert local == {CATALOG, names[1], names[2]}
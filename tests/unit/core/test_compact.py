@@ -0,0 +1,105 @@
+import pytest
+import dns.zone
+from zoneforge.core import create_record, get_records, get_zones, record_to_response
+from zoneforge.core.compact import CompactZone
+from zoneforge.core.store import VersionedZone, zone_store
+from zoneforge.memory import zone_footprint
+
+
+@pytest.mark.parametrize(
+    "record_name,record_type",
+    [(None, None), (None, "A"), (None, "SOA"), ("www2", None), ("@", "MX")],
+)
+def test_compact_zone_records(app_with_single_zone, record_name, record_type):
+    """
+    GIVEN a zone with records of several types
+    WHEN its records are listed from a compact zone, optionally by name and type
+    THEN they're the same as those converted from the parsed zone
+    """
+    folder = app_with_single_zone.config["ZONE_FILE_FOLDER"]
+    zone = get_zones(folder, "example.com.")[0]
+    compact = CompactZone(zone)
+    include_soa = record_type == "SOA"
+    records = get_records(
+        "example.com.",
+        folder,
+        record_name=record_name,
+        record_type=record_type,
+        include_soa=include_soa,
+    )
+    assert compact.records(
+        record_name=record_name, record_type=record_type, include_soa=include_soa
+    ) == record_to_response(records)
+    assert compact.to_response() == zone.to_response()
+
+
+def test_compact_zone_records_case_insensitive():
+    """
+    GIVEN a zone with names in mixed case
+    WHEN records are listed from a compact zone by a name in another case
+    THEN the records of the name are returned, as DNS names compare case-insensitively
+    """
+    zone = dns.zone.from_text(
+        "@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300\n@ 3600 IN NS ns1\n"
+        "Mail 300 IN A 192.0.2.1\nalpha 300 IN A 192.0.2.2\nwww 300 IN A 192.0.2.3\n",
+        origin="example.com.",
+        zone_factory=VersionedZone,
+    )
+    compact = CompactZone(zone)
+    for record_name, address in (
+        ("WWW", "192.0.2.3"),
+        ("mail", "192.0.2.1"),
+        ("MAIL.Example.COM.", "192.0.2.1"),
+        ("Alpha", "192.0.2.2"),
+    ):
+        records = compact.records(record_name=record_name)
+        assert [record["data"] for record in records] == [{"address": address}]
+    with pytest.raises(KeyError):
+        compact.records(record_name="WWW2")
+
+
+def test_compact_zone_footprint():
+    """
+    GIVEN a zone of a thousand records parsed in memory
+    WHEN a compact zone is built from it
+    THEN it takes a fraction of the parsed zone's memory
+    """
+    zone = dns.zone.from_text(
+        "@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300\n@ 3600 IN NS ns1\n"
+        + "".join(
+            f'host{i} 300 IN A 192.0.2.{i % 250}\nhost{i} 300 IN TXT "host {i}"\n'
+            for i in range(500)
+        ),
+        origin="example.com.",
+        zone_factory=VersionedZone,
+    )
+    compact = CompactZone(zone)
+    assert compact.footprint()["rdata"] == len(compact) == 1002
+    assert compact.footprint()["total_bytes"] * 5 < zone_footprint(zone)["total_bytes"]
+
+
+def test_store_read_copy(app_with_single_zone):
+    """
+    GIVEN a zone store with no parsed zones
+    WHEN a compact copy of a zone is requested, before and after a record is created
+    THEN the zone isn't kept parsed for the copy, and the copy is rebuilt once the zone file changed
+    """
+    folder = app_with_single_zone.config["ZONE_FILE_FOLDER"]
+    store = zone_store(folder)
+    compact = store.read_copy("example.com.", build=CompactZone)
+    assert not store.cached()
+    assert store.read_copy("example.com.", build=CompactZone) is compact
+    assert store.read_copy("missing.example.", build=CompactZone) is None
+
+    create_record(
+        record_name="compact",
+        record_type="A",
+        record_data={"address": "192.0.2.1"},
+        record_ttl=300,
+        zonefile_folder=folder,
+        zone_name="example.com.",
+    )
+    updated = store.read_copy("example.com.", build=CompactZone)
+    assert updated is not compact
+    assert updated.records(record_name="compact")[0]["data"] == {"address": "192.0.2.1"}
+    assert store.cached_copies() == [updated]
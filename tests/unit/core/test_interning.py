@@ -0,0 +1,74 @@
+import dns.name
+import dns.zone
+from zoneforge.core import get_zones
+from zoneforge.core.interning import NameInterner
+
+
+def test_interned_names_shared_between_zones(app_with_multi_zones):
+    """
+    GIVEN two zones with the same relative names and nameserver names
+    WHEN both zones are loaded
+    THEN equal names are the same object, in the zones' nodes and within their rdata
+    """
+    folder = app_with_multi_zones.config["ZONE_FILE_FOLDER"]
+    zone = get_zones(folder, "example.com.")[0]
+    sub_zone = get_zones(folder, "sub.example.com.")[0]
+
+    ns1 = dns.name.from_text("ns1", None)
+    (zone_ns1,) = [name for name in zone.nodes if name == ns1]
+    (sub_zone_ns1,) = [name for name in sub_zone.nodes if name == ns1]
+    assert zone_ns1 is sub_zone_ns1
+    assert all(
+        any(rdata.target is name for name in sub_zone.nodes)
+        for rdata in sub_zone.find_rdataset("@", "NS")
+    )
+    assert sub_zone.find_rdataset("@", "SOA")[0].mname is sub_zone_ns1
+
+
+def test_interner_keeps_case_and_drops_unused_names():
+    """
+    GIVEN a name interner with room for two names
+    WHEN names differing only in case are interned, then more names than there's room for
+    THEN names keep their case, names no longer held elsewhere make room for new ones, and their labels are released
+    """
+    interner = NameInterner(capacity=2)
+    www = interner.name(dns.name.from_text("www", None))
+    assert interner.name(dns.name.from_text("www", None)) is www
+    upper_www = interner.name(dns.name.from_text("WWW", None))
+    assert upper_www is not www
+    assert upper_www.to_text() == "WWW"
+
+    del upper_www
+    mail = interner.name(dns.name.from_text("mail", None))
+    assert interner.name(dns.name.from_text("mail", None)) is mail
+    assert interner.name(dns.name.from_text("www", None)) is www
+    assert len(interner) == 2
+    assert interner.usage()["labels"] == 2
+
+    del www, mail
+    assert interner.usage()["names"] == interner.usage()["labels"] == 0
+    assert len(interner) == 0
+
+
+def test_interner_usage():
+    """
+    GIVEN a zone whose records point to the same name
+    WHEN the names within its rdata are interned
+    THEN they're shared, and the memory saved is estimated from the references handed out to them
+    """
+    interner = NameInterner()
+    text = (
+        "@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300\n@ 3600 IN NS ns1\n"
+        + "".join(f"host{i} 300 IN MX 10 mail.provider.example.\n" for i in range(100))
+    )
+    zone = dns.zone.from_text(text, origin="example.com.")
+    rdatasets = [
+        interner.rdataset(rdataset) for _, rdataset in zone.iterate_rdatasets("MX")
+    ]
+    exchanges = {id(rdataset[0].exchange) for rdataset in rdatasets}
+    assert len(exchanges) == 1
+    usage = interner.usage()
+    assert usage["names"] == 1
+    assert usage["labels"] == 3
+    assert usage["references"] == 100
+    assert usage["saved_bytes"] > 0
@@ -0,0 +1,112 @@
+import time
+import dns.message
+import dns.opcode
+import dns.zone
+from zoneforge.core.notify import NotifyScheduler
+from zoneforge.server import DnsServer
+
+ZONE_WITH_SECONDARY = """
+$ORIGIN example.com.
+@ 36000 IN SOA ns1 hostmaster 20250116 28800 1800 2592000 86400
+@ 86400 IN NS ns1
+@ 86400 IN NS ns2
+ns1 86400 IN A 192.0.2.1
+ns2 86400 IN A 127.0.0.1
+"""
+
+
+class NotifyRecorder:
+    def __init__(self):
+        self.notifies = []
+
+    def accepts(self, request):
+        return request.opcode == dns.opcode.NOTIFY
+
+    def handle(self, request):
+        self.notifies.append(request.message)
+        return [dns.message.make_response(request.message)]
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_notify_debounced():
+    """
+    GIVEN a zone with a secondary nameserver
+    WHEN the zone is written many times in quick succession
+    THEN check that the secondary receives a single NOTIFY, and its latency is recorded
+    """
+    zone = dns.zone.from_text(ZONE_WITH_SECONDARY)
+    recorder = NotifyRecorder()
+    with DnsServer([recorder]) as server:
+        port = server.udp_address[1]
+        scheduler = NotifyScheduler(delay=0.2, port=port, timeout=1)
+        for _ in range(500):
+            scheduler.schedule(zone)
+        assert _wait_for(lambda: f"127.0.0.1:{port}" in scheduler.stats)
+        assert _wait_for(lambda: scheduler.stats[f"127.0.0.1:{port}"].sent == 1)
+        time.sleep(0.3)
+
+    assert len(recorder.notifies) == 1
+    notify = recorder.notifies[0]
+    assert notify.question[0].name == zone.origin
+    assert notify.answer[0][0].serial == 20250116
+    stats = scheduler.stats[f"127.0.0.1:{port}"].to_response()
+    assert stats["failed"] == 0
+    assert stats["last_latency_ms"] is not None
+    # the primary nameserver from the SOA isn't notified
+    assert "192.0.2.1:53" not in scheduler.stats
+
+
+def test_notify_extra_target_retries():
+    """
+    GIVEN an extra NOTIFY target that never answers, which is also the address of one of the zone's nameservers
+    WHEN a zone is written
+    THEN check that the target is notified once, retried and then counted as failed
+    """
+    zone = dns.zone.from_text(ZONE_WITH_SECONDARY)
+    with DnsServer([]) as server:
+        unused_port = server.udp_address[1]
+    scheduler = NotifyScheduler(
+        delay=0,
+        extra_targets=[f"127.0.0.1:{unused_port}"],
+        port=unused_port,
+        retries=1,
+        timeout=0.1,
+    )
+    scheduler.schedule(zone)
+    target = f"127.0.0.1:{unused_port}"
+    assert _wait_for(
+        lambda: target in scheduler.stats and scheduler.stats[target].failed == 1
+    )
+    time.sleep(0.5)
+    assert list(scheduler.stats) == [target]
+    assert scheduler.stats[target].sent == 0
+    assert scheduler.stats[target].failed == 1
+    assert scheduler.stats[target].retries == 1
+
+
+def test_notify_round_error(monkeypatch):
+    """
+    GIVEN a NOTIFY scheduler whose round fails with an unexpected error
+    WHEN the zone is written again afterwards
+    THEN check that the next round is still sent
+    """
+    zone = dns.zone.from_text(ZONE_WITH_SECONDARY)
+    scheduler = NotifyScheduler(delay=0)
+    rounds = []
+
+    def notify_zone(notify_info):
+        rounds.append(notify_info["origin"])
+        if len(rounds) == 1:
+            raise OSError("unexpected")
+
+    monkeypatch.setattr(scheduler, "notify_zone", notify_zone)
+    scheduler.schedule(zone)
+    assert _wait_for(lambda: len(rounds) == 1)
+    scheduler.schedule(zone)
+    assert _wait_for(lambda: len(rounds) == 2)
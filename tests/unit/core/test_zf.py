@@ -14,6 +14,8 @@ from zoneforge.core import (
     create_record,
     update_record,
     delete_record,
+    record_to_response,
+    next_serial,
 )
 
 ZONE_DATA_LIGHT = """
@@ -86,6 +88,25 @@ def test_zfzone_get_records(tmp_path):
     assert len(new_zf_zone.get_all_records(record_type="A")) == 0
 
 
+def test_zfzone_iter_records(zfzone_common_data):
+    """
+    GIVEN a zfzone object with records of several types
+    WHEN its records are iterated over as views
+    THEN they hold the same records as get_all_records, and convert to the same response
+    """
+    views = list(zfzone_common_data.iter_records())
+    rrsets = zfzone_common_data.get_all_records()
+    assert len(views) == sum(len(rrset) for rrset in rrsets)
+    assert record_to_response(views) == record_to_response(rrsets)
+    assert zfzone_common_data.count_rrsets() == len(rrsets)
+
+    a_views = list(zfzone_common_data.iter_records(record_type="A"))
+    assert {view.rdtype for view in a_views} == {dns.rdatatype.A}
+    assert [view.index for view in a_views if view.name.to_text() == "www2"] == [0, 1]
+    soa_views = list(zfzone_common_data.iter_records(record_type="SOA"))
+    assert len(soa_views) == 1
+
+
 # get_zones()
 def test_zf_get_zones_new(app_new):
     with app_new.app_context():
@@ -541,3 +562,20 @@ def test_zf_delete_single_record_under_rrset(app_with_single_zone, zfzone_common
             zonefile_folder=app_with_single_zone.config["ZONE_FILE_FOLDER"],
         )
     assert len(after_records[0].items) == original_length - 1
+
+
+def test_zf_write_serial(app_with_single_zone):
+    """
+    GIVEN a zone written earlier today
+    WHEN it's written again, and when serials are ahead of or wrapped around today's date
+    THEN check that each write increases the serial in serial number arithmetic
+    """
+    folder = app_with_single_zone.config["ZONE_FILE_FOLDER"]
+    zone = get_zones(folder, "example.com.")[0]
+    serial = zone.get_soa().serial
+    zone.write_to_file()
+    assert get_zones(folder, "example.com.")[0].get_soa().serial == serial + 1
+    today = next_serial(0)
+    assert today % 100 == 0
+    assert next_serial(today) == today + 1
+    assert next_serial(2**32 - 1) == today
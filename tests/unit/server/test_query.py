@@ -0,0 +1,141 @@
+import os
+import dns.flags
+import dns.message
+import dns.name
+import dns.query
+import dns.rcode
+import dns.rdatatype
+from zoneforge.core.store import ZoneStore
+from zoneforge.server import DnsServer, parse_tsig_keys
+from zoneforge.server.query import QueryHandler
+
+ZONE = """
+$ORIGIN example.com.
+@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300
+@ 86400 IN NS ns1
+@ 3600 IN MX 10 mail
+ns1 86400 IN A 192.168.1.10
+mail 3600 IN A 192.168.1.20
+www 3600 IN A 192.168.10.20
+alias 3600 IN CNAME www
+external 3600 IN CNAME www.example.net.
+host.empty 3600 IN A 192.168.10.30
+*.wild 3600 IN TXT "wildcard"
+sub 86400 IN NS ns.sub
+ns.sub 86400 IN A 192.168.20.10
+"""
+
+
+def _write_zone(folder, text):
+    with open(os.path.join(folder, "example.com.zone"), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _query(server, qname, rdtype, *, tcp=False, keyring=None):
+    query = dns.message.make_query(qname, rdtype)
+    if keyring:
+        query.use_tsig(keyring)
+    if tcp:
+        address, port = server.tcp_address[:2]
+        return dns.query.tcp(query, address, port=port, timeout=5)
+    address, port = server.udp_address[:2]
+    return dns.query.udp(query, address, port=port, timeout=5)
+
+
+def test_query_answers(tmp_path):
+    """
+    GIVEN a zone file folder served by the query handler
+    WHEN names with different kinds of answers are queried
+    THEN check that each is answered authoritatively, or referred for delegated names
+    """
+    _write_zone(tmp_path, ZONE)
+    with DnsServer([QueryHandler(ZoneStore(str(tmp_path)))]) as server:
+        res = _query(server, "www.example.com.", "A")
+        assert res.rcode() == dns.rcode.NOERROR
+        assert res.flags & dns.flags.AA
+        assert res.answer[0].to_text() == "www.example.com. 3600 IN A 192.168.10.20"
+
+        res = _query(server, "alias.example.com.", "A", tcp=True)
+        assert [rrset.rdtype for rrset in res.answer] == [
+            dns.rdatatype.CNAME,
+            dns.rdatatype.A,
+        ]
+        assert res.answer[1].name == dns.name.from_text("www.example.com.")
+
+        res = _query(server, "external.example.com.", "A")
+        assert len(res.answer) == 1
+        assert res.answer[0].rdtype == dns.rdatatype.CNAME
+
+        res = _query(server, "missing.example.com.", "A")
+        assert res.rcode() == dns.rcode.NXDOMAIN
+        assert res.authority[0].rdtype == dns.rdatatype.SOA
+        assert res.authority[0].ttl == 300
+
+        # empty non-terminals exist, they just have no records
+        res = _query(server, "empty.example.com.", "A")
+        assert res.rcode() == dns.rcode.NOERROR
+        assert not res.answer
+        assert res.authority[0].rdtype == dns.rdatatype.SOA
+
+        res = _query(server, "anything.wild.example.com.", "TXT")
+        assert res.answer[0].name == dns.name.from_text("anything.wild.example.com.")
+
+        res = _query(server, "host.sub.example.com.", "A")
+        assert res.rcode() == dns.rcode.NOERROR
+        assert not res.flags & dns.flags.AA
+        assert res.authority[0].rdtype == dns.rdatatype.NS
+        assert (
+            res.additional[0].to_text()
+            == "ns.sub.example.com. 86400 IN A 192.168.20.10"
+        )
+
+        res = _query(server, "example.com.", "MX")
+        assert res.additional[0].name == dns.name.from_text("mail.example.com.")
+
+        res = _query(server, "example.org.", "A")
+        assert res.rcode() == dns.rcode.REFUSED
+
+
+def test_query_cache_invalidated(tmp_path):
+    """
+    GIVEN a query handler that has answered a question
+    WHEN the question is asked again, before and after the zone file changes
+    THEN check that the cached answer is reused only until the zone changes
+    """
+    _write_zone(tmp_path, ZONE)
+    handler = QueryHandler(ZoneStore(str(tmp_path)))
+    with DnsServer([handler]) as server:
+        first = _query(server, "www.example.com.", "A")
+        second = _query(server, "www.example.com.", "A")
+        assert first.answer == second.answer
+        zone = handler.store.get("example.com.")
+        assert handler.zone_state(zone).cache.hits == 1
+
+        _write_zone(tmp_path, ZONE.replace("192.168.10.20", "192.168.10.99"))
+        res = _query(server, "www.example.com.", "A")
+        assert res.answer[0].to_text() == "www.example.com. 3600 IN A 192.168.10.99"
+        # the dropped cache still counts towards the handler's totals
+        assert handler.zone_state(zone).cache.hits == 0
+        assert (handler.hits, handler.misses) == (1, 2)
+
+
+def test_query_tsig(tmp_path):
+    """
+    GIVEN a query handler and server with a TSIG keyring
+    WHEN the same question is asked with signed queries, with an unsigned query, then signed again
+    THEN check that each signed query gets a response signed for it, and the unsigned query an unsigned response
+    """
+    _write_zone(tmp_path, ZONE)
+    keyring = parse_tsig_keys("query-key.:c2VjcmV0LXNlY3JldC1zZWNyZXQ=")
+    handler = QueryHandler(ZoneStore(str(tmp_path)))
+    with DnsServer([handler], keyring=keyring) as server:
+        for _ in range(2):
+            res = _query(server, "www.example.com.", "A", keyring=keyring)
+            assert res.had_tsig
+            assert res.answer[0][0].address == "192.168.10.20"
+        res = _query(server, "www.example.com.", "A")
+        assert not res.had_tsig
+        assert res.answer[0][0].address == "192.168.10.20"
+        res = _query(server, "www.example.com.", "A", keyring=keyring, tcp=True)
+        assert res.had_tsig
+    assert (handler.hits, handler.misses) == (0, 1)
@@ -0,0 +1,222 @@
+import os
+import ipaddress
+import socket
+import threading
+import time
+import dns.message
+import dns.name
+import dns.query
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.update
+import dns.zone
+from zoneforge.core.store import ZoneStore
+from zoneforge.server import DnsServer, parse_tsig_keys
+from zoneforge.server.update import UpdateHandler
+
+ZONE = """
+$ORIGIN example.com.
+@ 3600 IN SOA ns1 hostmaster 1 28800 1800 2592000 300
+@ 86400 IN NS ns1
+ns1 86400 IN A 192.168.1.10
+www 3600 IN A 192.168.10.20
+"""
+LOCALHOST = [ipaddress.ip_network("127.0.0.1/32")]
+
+
+def _write_zone(folder, text):
+    with open(os.path.join(folder, "example.com.zone"), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _send(server, update):
+    address, port = server.udp_address[:2]
+    return dns.query.udp(update, address, port=port, timeout=5)
+
+
+def test_update_prerequisites(tmp_path):
+    """
+    GIVEN a zone file folder served by the update handler
+    WHEN updates are sent with prerequisites that do and don't hold
+    THEN check that only updates whose prerequisites hold are applied to the zone
+    """
+    _write_zone(tmp_path, ZONE)
+    store = ZoneStore(str(tmp_path))
+    handler = UpdateHandler(store, allowed_networks=LOCALHOST, write_delay=60)
+    with DnsServer([handler]) as server:
+        update = dns.update.UpdateMessage("example.com.")
+        update.present("www", "A", "192.168.10.20")
+        update.add("api", 300, "CNAME", "www.example.com.")
+        update.delete("www", "A", "192.168.10.20")
+        update.add("www", 300, "A", "192.168.10.21")
+        assert _send(server, update).rcode() == dns.rcode.NOERROR
+
+        update = dns.update.UpdateMessage("example.com.")
+        update.absent("www")
+        update.add("www", 300, "A", "192.168.10.22")
+        assert _send(server, update).rcode() == dns.rcode.YXDOMAIN
+
+        update = dns.update.UpdateMessage("example.com.")
+        update.add("www.example.org.", 300, "A", "192.168.10.22")
+        assert _send(server, update).rcode() == dns.rcode.NOTZONE
+
+        update = dns.update.UpdateMessage("example.org.")
+        update.add("www", 300, "A", "192.168.10.22")
+        assert _send(server, update).rcode() == dns.rcode.NOTAUTH
+
+        # RFC 2136 section 3.4.1.3: ANY can only be deleted by name
+        update = dns.update.UpdateMessage("example.com.")
+        update.find_rrset(
+            update.update,
+            dns.name.from_text("www.example.com."),
+            dns.rdataclass.IN,
+            dns.rdatatype.ANY,
+            deleting=dns.rdataclass.NONE,
+            create=True,
+        )
+        assert _send(server, update).rcode() == dns.rcode.FORMERR
+
+    zone = store.get("example.com.")
+    www = zone.get_rdataset("www", dns.rdatatype.A)
+    assert [rdata.to_text() for rdata in www] == ["192.168.10.21"]
+    assert zone.get_rdataset("api", dns.rdatatype.CNAME)[0].target.to_text() == "www"
+    assert handler.writes == 0
+
+
+def test_update_coalesced(tmp_path):
+    """
+    GIVEN an update handler with a write delay
+    WHEN many updates are sent to a zone within the delay
+    THEN check that they are written to the zone file together, and peers outside the allowed networks are refused
+    """
+    _write_zone(tmp_path, ZONE)
+    store = ZoneStore(str(tmp_path))
+    handler = UpdateHandler(store, allowed_networks=LOCALHOST, write_delay=60)
+    with DnsServer([handler]) as server:
+        for i in range(200):
+            update = dns.update.UpdateMessage("example.com.")
+            update.add(f"host{i}", 300, "A", f"10.0.0.{i}")
+            assert _send(server, update).rcode() == dns.rcode.NOERROR
+        handler.flush()
+
+        handler.allowed_networks = [ipaddress.ip_network("192.0.2.0/24")]
+        update = dns.update.UpdateMessage("example.com.")
+        update.add("refused", 300, "A", "10.1.0.1")
+        assert _send(server, update).rcode() == dns.rcode.REFUSED
+
+    assert handler.updates == 200
+    assert handler.writes == 1
+    written = dns.zone.from_file(
+        os.path.join(tmp_path, "example.com.zone"), origin="example.com."
+    )
+    assert written.get_rdataset("host199", dns.rdatatype.A)[0].address == "10.0.0.199"
+    assert written.get_node("refused") is None
+
+
+def test_update_survives_zone_file_change(tmp_path):
+    """
+    GIVEN an update handler with a write delay
+    WHEN an update is committed, and the zone file is changed by someone else before the update is written
+    THEN check that the update increased the serial, and both the update and the file's change are written
+    """
+    _write_zone(tmp_path, ZONE)
+    store = ZoneStore(str(tmp_path))
+    handler = UpdateHandler(store, allowed_networks=LOCALHOST, write_delay=60)
+    with DnsServer([handler]) as server:
+        update = dns.update.UpdateMessage("example.com.")
+        update.add("api", 300, "A", "192.168.10.30")
+        assert _send(server, update).rcode() == dns.rcode.NOERROR
+        assert store.get("example.com.").get_soa().serial == 2
+
+        _write_zone(tmp_path, ZONE + "ftp 3600 IN A 192.168.10.40\n")
+        zone = store.get("example.com.")
+        assert zone.get_rdataset("api", dns.rdatatype.A)
+        assert zone.get_rdataset("ftp", dns.rdatatype.A)
+        assert zone.get_soa().serial == 3
+        handler.flush()
+
+    written = dns.zone.from_file(
+        os.path.join(tmp_path, "example.com.zone"), origin="example.com."
+    )
+    assert written.get_rdataset("api", dns.rdatatype.A)[0].address == "192.168.10.30"
+    assert written.get_rdataset("ftp", dns.rdatatype.A)[0].address == "192.168.10.40"
+    assert written.get_rdataset("www", dns.rdatatype.A)[0].address == "192.168.10.20"
+    assert written.get_soa().serial > 3
+
+
+def test_update_tsig(tmp_path):
+    """
+    GIVEN an update handler and server with a TSIG keyring
+    WHEN updates are sent unsigned, signed with a key from the keyring, and signed with an unknown key
+    THEN check that only the update signed with a key from the keyring is applied
+    """
+    _write_zone(tmp_path, ZONE)
+    store = ZoneStore(str(tmp_path))
+    keyring = parse_tsig_keys("update-key.:c2VjcmV0LXNlY3JldC1zZWNyZXQ=")
+    handler = UpdateHandler(
+        store, allowed_networks=LOCALHOST, keyring=keyring, write_delay=60
+    )
+    with DnsServer([handler], keyring=keyring) as server:
+        update = dns.update.UpdateMessage("example.com.")
+        update.add("unsigned", 300, "A", "10.0.0.1")
+        assert _send(server, update).rcode() == dns.rcode.REFUSED
+
+        update = dns.update.UpdateMessage("example.com.", keyring=keyring)
+        update.add("signed", 300, "A", "10.0.0.2")
+        response = _send(server, update)
+        assert response.rcode() == dns.rcode.NOERROR
+        assert response.had_tsig
+
+        other_keyring = parse_tsig_keys("other-key.:b3RoZXItb3RoZXItb3RoZXI=")
+        update = dns.update.UpdateMessage("example.com.", keyring=other_keyring)
+        update.add("other", 300, "A", "10.0.0.3")
+        address, port = server.udp_address[:2]
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(5)
+            sock.sendto(update.to_wire(), (address, port))
+            response = dns.message.from_wire(sock.recv(65535))
+        assert response.rcode() == dns.rcode.NOTAUTH
+
+    zone = store.get("example.com.")
+    assert zone.get_node("unsigned") is None
+    assert zone.get_rdataset("signed", dns.rdatatype.A)[0].address == "10.0.0.2"
+    assert zone.get_node("other") is None
+
+
+def test_update_timeout(tmp_path):
+    """
+    GIVEN an update handler whose commits are held up by another write to a zone
+    WHEN an update being committed and an update still waiting both time out
+    THEN check that the waiting update is cancelled, and the other is answered once it's committed
+    """
+    _write_zone(tmp_path, ZONE)
+    with open(os.path.join(tmp_path, "example.org.zone"), "w", encoding="utf-8") as f:
+        f.write(ZONE.replace("example.com.", "example.org."))
+    store = ZoneStore(str(tmp_path))
+    handler = UpdateHandler(
+        store, allowed_networks=LOCALHOST, write_delay=60, timeout=0.5
+    )
+    responses = {}
+
+    def send(zone_name):
+        update = dns.update.UpdateMessage(zone_name)
+        update.add("late", 300, "A", "10.0.0.1")
+        responses[zone_name] = _send(server, update)
+
+    blocking = store.get("example.com.").writer()
+    with DnsServer([handler]) as server:
+        threads = []
+        for zone_name in ("example.com.", "example.org."):
+            threads.append(threading.Thread(target=send, args=(zone_name,)))
+            threads[-1].start()
+            time.sleep(0.1)
+        time.sleep(1)
+        blocking.rollback()
+        for thread in threads:
+            thread.join()
+
+    assert responses["example.com."].rcode() == dns.rcode.NOERROR
+    assert store.get("example.com.").get_node("late") is not None
+    assert responses["example.org."].rcode() == dns.rcode.SERVFAIL
+    assert store.get("example.org.").get_node("late") is None
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import pytest
+import dns.message
+import dns.name
+import dns.query
+import dns.rcode
+import dns.rdatatype
+import dns.versioned
+import dns.xfr
+import dns.zone
+from zoneforge.core.store import ZoneStore
+from zoneforge.server import DnsServer, parse_tsig_keys
+from zoneforge.server.xfr import XfrHandler
+
+ZONE_SERIAL_1 = """
+$ORIGIN example.com.
+@ 36000 IN SOA ns1 hostmaster 1 28800 1800 2592000 86400
+@ 86400 IN NS ns1
+ns1 86400 IN A 192.168.1.10
+www 86400 IN A 192.168.10.20
+"""
+ZONE_SERIAL_2 = """
+$ORIGIN example.com.
+@ 36000 IN SOA ns1 hostmaster 2 28800 1800 2592000 86400
+@ 86400 IN NS ns1
+ns1 86400 IN A 192.168.1.10
+www 86400 IN A 192.168.10.30
+mail 86400 IN A 192.168.2.10
+"""
+
+
+def _write_zone(folder, text):
+    with open(os.path.join(folder, "example.com.zone"), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _transfer(server, zone, **kwargs):
+    address, port = server.tcp_address[:2]
+    dns.query.inbound_xfr(address, zone, port=port, lifetime=5, **kwargs)
+
+
+def test_xfr_axfr(tmp_path):
+    """
+    GIVEN a zone file folder served by the XFR handler
+    WHEN a secondary requests the zone twice, and again after the zone file changed
+    THEN check that it receives the full zone, and only the unchanged zone is served from the cache
+    """
+    _write_zone(tmp_path, ZONE_SERIAL_1)
+    handler = XfrHandler(ZoneStore(str(tmp_path)))
+    with DnsServer([handler]) as server:
+        for _ in range(2):
+            secondary = dns.versioned.Zone("example.com.")
+            _transfer(
+                server, secondary, query=dns.message.make_query("example.com.", "AXFR")
+            )
+            assert secondary == dns.zone.from_text(ZONE_SERIAL_1)
+        assert handler.cache.hits == 1
+
+        # a zone reloaded from its file starts its version ids over, and must not be served from the cache
+        os.remove(os.path.join(tmp_path, "example.com.zone"))
+        _write_zone(tmp_path, ZONE_SERIAL_2)
+        secondary = dns.versioned.Zone("example.com.")
+        _transfer(
+            server, secondary, query=dns.message.make_query("example.com.", "AXFR")
+        )
+        assert secondary == dns.zone.from_text(ZONE_SERIAL_2)
+
+
+def test_xfr_ixfr(tmp_path):
+    """
+    GIVEN a secondary holding an older serial of a zone
+    WHEN it requests an IXFR after the zone file changed
+    THEN check that it receives only the differences, and ends up with the current zone
+    """
+    _write_zone(tmp_path, ZONE_SERIAL_1)
+    store = ZoneStore(str(tmp_path), max_versions=5)
+    handler = XfrHandler(store)
+    with DnsServer([handler]) as server:
+        secondary = dns.versioned.Zone("example.com.")
+        _transfer(
+            server, secondary, query=dns.message.make_query("example.com.", "AXFR")
+        )
+
+        _write_zone(tmp_path, ZONE_SERIAL_2)
+        zone = store.get("example.com.")
+        ixfr = dns.message.from_wire(
+            handler.ixfr_messages(zone, client_serial=1)[0], one_rr_per_rrset=True
+        )
+        # an incremental response starts its first difference sequence with the client's SOA
+        assert ixfr.answer[1].rdtype == dns.rdatatype.SOA
+        assert ixfr.answer[1][0].serial == 1
+        assert len(ixfr.answer) == 7
+
+        _transfer(server, secondary)
+        assert secondary == dns.zone.from_text(ZONE_SERIAL_2)
+
+
+def test_xfr_errors(tmp_path):
+    """
+    GIVEN the XFR handler
+    WHEN a transfer is requested over UDP, or for a zone that doesn't exist
+    THEN check that the request is answered with an error
+    """
+    _write_zone(tmp_path, ZONE_SERIAL_1)
+    with DnsServer([XfrHandler(ZoneStore(str(tmp_path)))]) as server:
+        address, port = server.udp_address[:2]
+        axfr_udp = dns.query.udp(
+            dns.message.make_query("example.com.", "AXFR"),
+            address,
+            port=port,
+            timeout=5,
+        )
+        assert axfr_udp.rcode() == dns.rcode.FORMERR
+
+        address, port = server.tcp_address[:2]
+        unknown_zone = dns.query.tcp(
+            dns.message.make_query("example.net.", "AXFR"),
+            address,
+            port=port,
+            timeout=5,
+        )
+        assert unknown_zone.rcode() == dns.rcode.NOTAUTH
+
+
+def test_xfr_tsig(tmp_path):
+    """
+    GIVEN the XFR handler and server with a TSIG keyring, and a zone spanning several messages
+    WHEN the zone is transferred with signed AXFR and IXFR requests, and with an unsigned request
+    THEN check that each signed transfer's messages are signed in sequence for it, and the unsigned one is refused
+    """
+    records = "".join(f'host{i} 300 IN TXT "{"x" * 60}"\n' for i in range(2000))
+    _write_zone(tmp_path, ZONE_SERIAL_1 + records)
+    store = ZoneStore(str(tmp_path), max_versions=5)
+    keyring = parse_tsig_keys("xfr-key.:c2VjcmV0LXNlY3JldC1zZWNyZXQ=")
+    handler = XfrHandler(store, keyring=keyring)
+    with DnsServer([handler], keyring=keyring) as server:
+        for _ in range(2):
+            secondary = dns.versioned.Zone("example.com.")
+            query = dns.message.make_query("example.com.", "AXFR")
+            query.use_tsig(keyring)
+            _transfer(server, secondary, query=query)
+            assert secondary == dns.zone.from_text(ZONE_SERIAL_1 + records)
+        assert len(handler.axfr_messages(store.get("example.com."))) > 1
+        assert handler.cache.hits == 0
+
+        _write_zone(tmp_path, ZONE_SERIAL_2 + records)
+        query, _ = dns.xfr.make_query(secondary, keyring=keyring)
+        _transfer(server, secondary, query=query)
+        assert secondary == dns.zone.from_text(ZONE_SERIAL_2 + records)
+
+        with pytest.raises(dns.xfr.TransferError):
+            _transfer(
+                server,
+                dns.versioned.Zone("example.com."),
+                query=dns.message.make_query("example.com.", "AXFR"),
+            )
+
+
+def test_xfr_zone_name_outside_folder(tmp_path):
+    """
+    GIVEN the XFR handler, and a zone file outside of its zone file folder
+    WHEN a transfer is requested for a zone name that is the path of that zone file
+    THEN check that the zone file isn't served
+    """
+    _write_zone(tmp_path, ZONE_SERIAL_1)
+    with tempfile.TemporaryDirectory(dir="/tmp") as outside:
+        _write_zone(outside, ZONE_SERIAL_1)
+        zone_name = dns.name.from_text(os.path.join(outside, "example.com."))
+        store = ZoneStore(str(tmp_path))
+        assert store.get(zone_name) is None
+        with DnsServer([XfrHandler(store)]) as server:
+            address, port = server.tcp_address[:2]
+            response = dns.query.tcp(
+                dns.message.make_query(zone_name, "AXFR"),
+                address,
+                port=port,
+                timeout=5,
+            )
+        assert response.rcode() == dns.rcode.NOTAUTH
+        assert not response.answer
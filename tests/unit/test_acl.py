@@ -0,0 +1,42 @@
+import dns.name
+import pytest
+from zoneforge.acl import ZONE_PERMISSION_BITS, ZoneAclIndex, normalize_zone_pattern
+
+READ = ZONE_PERMISSION_BITS["read"]
+WRITE = ZONE_PERMISSION_BITS["write"]
+
+
+def test_acl_index_lookup():
+    """
+    GIVEN grants of exact zones and wildcard patterns to groups
+    WHEN the permissions of groups on zones are looked up
+    THEN check that exact grants apply to their zone only, wildcards to every zone below their suffix, and grants combine
+    """
+    index = ZoneAclIndex(
+        [
+            (1, "example.com.", READ | WRITE),
+            (1, "*.Example.ORG", READ),
+            (1, "sub.example.org.", WRITE),
+            (2, "*", READ),
+        ]
+    )
+    assert index.permissions(1, dns.name.from_text("EXAMPLE.com.")) == READ | WRITE
+    assert index.permissions(1, dns.name.from_text("sub.example.com.")) == 0
+    assert index.permissions(1, dns.name.from_text("example.org.")) == 0
+    assert index.permissions(1, dns.name.from_text("a.b.example.org.")) == READ
+    assert index.permissions(1, dns.name.from_text("sub.example.org.")) == READ | WRITE
+    assert index.permissions(2, dns.name.from_text("example.net.")) == READ
+    assert index.permissions(3, dns.name.from_text("example.com.")) == 0
+
+
+def test_acl_pattern_normalized():
+    """
+    GIVEN zone patterns as entered by users
+    WHEN they are normalized
+    THEN check that they become absolute and lowercase, and wildcards elsewhere than the first label are rejected
+    """
+    assert normalize_zone_pattern("Example.com") == "example.com."
+    assert normalize_zone_pattern("*.Example.com") == "*.example.com."
+    assert normalize_zone_pattern("*.") == "*"
+    with pytest.raises(ValueError):
+        normalize_zone_pattern("a.*.example.com")
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+import zoneforge
+from zoneforge.passwords import PasswordHasher
+
+HOLD_SLOT = """
+import sys
+from zoneforge.passwords import ProcessSlots
+
+with ProcessSlots(sys.argv[1], 1).hold():
+    print("held", flush=True)
+    sys.stdin.readline()
+"""
+
+
+def test_password_slots_shared_between_processes(tmp_path):
+    """
+    GIVEN a password hasher allowing one hash at a time, and another worker process hashing a password
+    WHEN a password is hashed while the other worker holds the only slot, and once it's done
+    THEN check that the hash is refused with a 503 straight away, then succeeds
+    """
+    worker = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-c", HOLD_SLOT, str(tmp_path)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        env=os.environ | {"PYTHONPATH": os.path.dirname(zoneforge.__path__[0])},
+    )
+    try:
+        assert worker.stdout.readline() == "held\n"
+        hasher = PasswordHasher(
+            rounds=4, max_concurrent=1, slots_directory=str(tmp_path)
+        )
+        with pytest.raises(ServiceUnavailable):
+            hasher.hash("secret")
+    finally:
+        worker.communicate("\n", timeout=10)
+    assert hasher.check("secret", hasher.hash("secret"))
@@ -0,0 +1,51 @@
+from zoneforge.revocation import BloomFilter, RevocationList
+
+
+def test_bloom_filter():
+    """
+    GIVEN a Bloom filter sized for a thousand items
+    WHEN a thousand items are added
+    THEN check that every one of them is matched, and few others are
+    """
+    bloom_filter = BloomFilter(1000)
+    for i in range(1000):
+        bloom_filter.add(f"revoked{i}")
+    assert all(f"revoked{i}" in bloom_filter for i in range(1000))
+    false_positives = sum(f"valid{i}" in bloom_filter for i in range(10000))
+    assert false_positives < 50
+
+
+def test_revocation_list_versions():
+    """
+    GIVEN a revocation list
+    WHEN revocations are added past its capacity, and the list is reset
+    THEN check that it tracks the latest version, reports when it needs rebuilding, and is resized when reset
+    """
+    revocations = RevocationList(capacity=2)
+    revocations.add([(1, "a"), (3, "c"), (2, "b")])
+    assert revocations.version == 3
+    assert revocations.might_be_revoked("b")
+    assert revocations.full()
+
+    revocations.reset([(2, "b"), (3, "c")])
+    assert revocations.version == 3
+    assert len(revocations) == 2
+    assert not revocations.full()
+    assert revocations.refresh_due()
+    assert not revocations.refresh_due()
+
+
+def test_revocation_list_lookback():
+    """
+    GIVEN a revocation list that looks back two versions
+    WHEN revocations are loaded again from within the window, including one committed after a later version
+    THEN check that only the new one is added, and the window follows the latest version
+    """
+    revocations = RevocationList(lookback=2)
+    assert revocations.add([(1, "a"), (3, "c")]) == ["a", "c"]
+    assert revocations.since == 1
+    assert revocations.add([(2, "b"), (3, "c")]) == ["b"]
+    assert revocations.might_be_revoked("b")
+    assert len(revocations) == 3
+    assert revocations.add([(2, "b"), (3, "c"), (4, "d")]) == ["d"]
+    assert revocations.since == 2
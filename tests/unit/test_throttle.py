@@ -0,0 +1,39 @@
+from zoneforge.throttle import LoginThrottle, MemoryBuckets, SQLiteBuckets
+
+
+def test_throttle_failed_attempts():
+    """
+    GIVEN a login throttle allowing three failed attempts per username
+    WHEN attempts are made, some of them successful
+    THEN check that only attempts that aren't given back count, and other usernames are unaffected
+    """
+    login_throttle = LoginThrottle(user_burst=3, user_rate=1, address_burst=0)
+    for _ in range(5):
+        assert not login_throttle.acquire("alice", "192.0.2.1")
+        login_throttle.release("alice", "192.0.2.1")
+    for _ in range(3):
+        assert not login_throttle.acquire("alice", "192.0.2.1")
+    wait = login_throttle.acquire("alice", "192.0.2.1")
+    assert 0 < wait <= 60
+    assert not login_throttle.acquire("bob", "192.0.2.1")
+
+
+def test_throttle_bounded_and_shared(tmp_path):
+    """
+    GIVEN login throttles with a bounded number of buckets, one of them sharing buckets through a SQLite file
+    WHEN attempts are made from many addresses, and through two throttles sharing a file
+    THEN check that memory stays bounded, and attempts through either shared throttle count against both
+    """
+    store = MemoryBuckets(maxsize=10)
+    login_throttle = LoginThrottle(store=store, user_burst=0, address_burst=1)
+    for i in range(100):
+        assert not login_throttle.acquire("alice", f"192.0.2.{i}")
+    assert len(store) == 10
+
+    path = str(tmp_path / "throttle.db")
+    first = LoginThrottle(store=SQLiteBuckets(path), user_burst=2, address_burst=0)
+    second = LoginThrottle(store=SQLiteBuckets(path), user_burst=2, address_burst=0)
+    assert not first.acquire("alice", "192.0.2.1")
+    assert not second.acquire("alice", "192.0.2.1")
+    assert first.acquire("alice", "192.0.2.1")
+    assert len(second.store) == 1
@@ -0,0 +1,131 @@
+import contextlib
+import contextvars
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+from flask import before_render_template, request, template_rendered
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+access_logger = logging.getLogger("zoneforge.access")
+
+# the timings of the request being handled, if any
+_timings = contextvars.ContextVar("zoneforge_request_timings", default=None)
+
+
+# pylint: disable=too-few-public-methods
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        # seconds spent in each phase, and details such as the size of the zone involved
+        self.phases = {}
+        self.fields = {}
+        self.render_start = None
+
+
+# pylint: enable=too-few-public-methods
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """
+    Adds the time spent within it to a phase of the current request, if any. It can also decorate a function.
+    Phases may hold other phases, but not one of the same name, which would be counted twice.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.phases[name] = timings.phases.get(name, 0) + time.perf_counter() - start
+
+
+def annotate(**fields):
+    """
+    Adds details to the access log entry of the current request, if any.
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings.fields.update(fields)
+
+
+def init_app(app, *, log_requests: bool, slow_threshold: float, log_file: str = ""):
+    """
+    Times the phases of each request to a Flask app. Every request is logged as a line of JSON if log_requests is set, and
+    requests taking longer than slow_threshold seconds are logged as warnings, unless it's 0.
+    """
+    if log_requests:
+        for handler in access_logger.handlers:
+            handler.close()
+        handler = (
+            logging.FileHandler(log_file)
+            if log_file
+            else logging.StreamHandler(sys.stdout)
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        access_logger.handlers = [handler]
+        access_logger.setLevel(logging.INFO)
+        # access log entries are already formatted, and shouldn't be formatted again by the application's handlers
+        access_logger.propagate = False
+
+    @app.before_request
+    def start_timings():
+        _timings.set(RequestTimings())
+
+    @app.after_request
+    def log_request(response):
+        timings = _timings.get()
+        if timings is None:
+            return response
+        duration = time.perf_counter() - timings.start
+        slow = slow_threshold and duration >= slow_threshold
+        if not log_requests and not slow:
+            return response
+        entry = {
+            "time": datetime.now(tz=timezone.utc).isoformat(),
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "endpoint": request.url_rule.rule if request.url_rule else None,
+            "status": response.status_code,
+            "bytes": response.calculate_content_length(),
+            "remote_addr": request.remote_addr,
+            "duration_ms": round(duration * 1000, 3),
+            "phases_ms": {
+                name: round(seconds * 1000, 3)
+                for name, seconds in timings.phases.items()
+            },
+        } | timings.fields
+        line = json.dumps(entry)
+        if log_requests:
+            access_logger.info(line)
+        if slow:
+            logger.warning("Slow request: %s", line)
+        return response
+
+    @app.teardown_request
+    def clear_timings(_):
+        _timings.set(None)
+
+    # templates are rendered by the routes themselves, so their time is taken from Flask's signals
+    def start_render(*_, **__):
+        timings = _timings.get()
+        if timings is not None:
+            timings.render_start = time.perf_counter()
+
+    def end_render(*_, **__):
+        timings = _timings.get()
+        if timings is not None and timings.render_start is not None:
+            timings.phases["render"] = (
+                timings.phases.get("render", 0)
+                + time.perf_counter()
+                - timings.render_start
+            )
+            timings.render_start = None
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(end_render, app, weak=False)
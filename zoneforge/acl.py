@@ -0,0 +1,104 @@
+import dns.exception
+import dns.name
+
+# Each zone permission is represented by a bit, in this order. Grants are stored as these bitsets, so new permissions must be appended.
+ZONE_PERMISSIONS = ("read", "write", "delete")
+ZONE_PERMISSION_BITS = {
+    permission: 1 << bit for bit, permission in enumerate(ZONE_PERMISSIONS)
+}
+WILDCARD = "*"
+
+
+def zone_permission_bits(permissions: list[str]) -> int:
+    bits = 0
+    for permission in permissions:
+        bits |= ZONE_PERMISSION_BITS[permission]
+    return bits
+
+
+def zone_permission_names(bits: int) -> list[str]:
+    return [
+        permission
+        for permission in ZONE_PERMISSIONS
+        if bits & ZONE_PERMISSION_BITS[permission]
+    ]
+
+
+def normalize_zone_pattern(pattern: str) -> str:
+    """
+    Returns the canonical form of a zone pattern, which is either a zone name, '*.' followed by a zone name to match every zone
+    below it, or '*' to match every zone. Raises ValueError for anything else.
+    """
+    pattern = pattern.strip()
+    if pattern in (WILDCARD, f"{WILDCARD}."):
+        return WILDCARD
+    prefix = ""
+    if pattern.startswith(f"{WILDCARD}."):
+        prefix, pattern = f"{WILDCARD}.", pattern[2:]
+    if WILDCARD in pattern:
+        raise ValueError(f"Wildcards are only supported as the first label: {pattern}")
+    try:
+        return prefix + _canonical_name(pattern).to_text()
+    except dns.exception.DNSException as e:
+        raise ValueError(str(e)) from e
+
+
+# pylint: disable=too-few-public-methods
+class _TrieNode:
+    __slots__ = ("children", "grants")
+
+    def __init__(self):
+        self.children = {}
+        self.grants = {}
+
+
+# pylint: enable=too-few-public-methods
+
+
+class ZoneAclIndex:
+    """
+    The zone permissions granted to each group, compiled for lookups that don't touch the database.
+
+    Grants for a single zone are kept in a map keyed by group and zone name. Wildcard grants are kept in a trie of labels,
+    from the root down to the suffix the wildcard applies below, so a lookup walks at most one node per label of the zone name.
+    """
+
+    def __init__(self, grants: list[tuple[int, str, int]]):
+        self._exact = {}
+        self._root = _TrieNode()
+        for group_id, pattern, bits in grants:
+            self.add(group_id, pattern, bits=bits)
+
+    def add(self, group_id: int, pattern: str, *, bits: int):
+        pattern = normalize_zone_pattern(pattern)
+        if pattern == WILDCARD:
+            node = self._root
+        elif pattern.startswith(f"{WILDCARD}."):
+            node = self._root
+            for label in reversed(dns.name.from_text(pattern[2:]).labels[:-1]):
+                node = node.children.setdefault(label, _TrieNode())
+        else:
+            key = (group_id, dns.name.from_text(pattern))
+            self._exact[key] = self._exact.get(key, 0) | bits
+            return
+        node.grants[group_id] = node.grants.get(group_id, 0) | bits
+
+    def permissions(self, group_id: int, zone_name: dns.name.Name) -> int:
+        """
+        Returns the permission bitset granted to the group on a zone.
+        """
+        zone_name = _canonical_name(zone_name)
+        bits = self._exact.get((group_id, zone_name), 0)
+        node = self._root
+        bits |= node.grants.get(group_id, 0)
+        # wildcards apply below their suffix, so the zone's own first label is never walked
+        for label in reversed(zone_name.labels[1:-1]):
+            node = node.children.get(label)
+            if node is None:
+                break
+            bits |= node.grants.get(group_id, 0)
+        return bits
+
+
+def _canonical_name(name) -> dns.name.Name:
+    return dns.name.from_text(str(name)).canonicalize()
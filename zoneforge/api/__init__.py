@@ -1,12 +1,86 @@
+import functools
+import hashlib
+import hmac
+import time
+from datetime import datetime, timezone
+import dns.name
 import jwt
-from flask import current_app, g
+from flask import current_app, g, request
 from flask_restx import reqparse
 from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
 
+from zoneforge import metrics
+from zoneforge.accesslog import phase
+from zoneforge.acl import ZONE_PERMISSION_BITS, ZoneAclIndex
+from zoneforge.cache import LRUCache
 from zoneforge.db import db
-from zoneforge.db.db_model import User
+from zoneforge.db.db_model import (
+    RevokedToken,
+    Role,
+    User,
+    ZoneGrant,
+    group_assign_roles,
+)
+from zoneforge.revocation import RevocationList
+
+TOKEN_CACHE_SIZE = 4096
+USER_CACHE_SIZE = 4096
+GROUP_CACHE_SIZE = 1024
+REVOCATION_CACHE_SIZE = 1024
+
+# Each permission is represented by a bit, in this order. Tokens carry the permissions of the user's group as a bitset,
+# so new permissions must be appended to keep the meaning of tokens already issued.
+PERMISSIONS = (
+    "group_read",
+    "group_create",
+    "group_update",
+    "group_delete",
+    "role_read",
+    "role_create",
+    "role_update",
+    "role_delete",
+    "userAssignGroup_read",
+    "userAssignGroup_update",
+    "userAssignGroup_delete",
+    "roleAssignGroup_read",
+    "roleAssignGroup_delete",
+    "zoneGrant_read",
+    "zoneGrant_create",
+    "zoneGrant_delete",
+    "serverDiagnostics_read",
+)
+PERMISSION_BITS = {permission: 1 << bit for bit, permission in enumerate(PERMISSIONS)}
+
+# digests of verified tokens, mapped to their claims until the token expires
+token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+# user ids, mapped to whether the user exists and their group. Entries expire so changes made by other workers are picked up
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=30)
+# group ids, mapped to the permission bitset of the group's roles
+group_cache = LRUCache(maxsize=GROUP_CACHE_SIZE, ttl=30)
+# the compiled zone grants of every group, under a single key
+zone_acl_cache = LRUCache(maxsize=1, ttl=30)
+# ids of revoked tokens, mirrored from the database
+revocation_list = RevocationList()
+# token ids matched by the revocation list's filter, mapped to whether they are actually revoked
+revocation_cache = LRUCache(maxsize=REVOCATION_CACHE_SIZE)
+metrics.watch_cache("token", token_cache)
+metrics.watch_cache("user", user_cache)
+metrics.watch_cache("group", group_cache)
+metrics.watch_cache("zone_acl", zone_acl_cache)
+metrics.watch_cache("revocation", revocation_cache)
+
+
+class RequestParser(reqparse.RequestParser):
+    """
+    A RequestParser that times parsing as a phase of the request.
+    """
 
-token_parser = reqparse.RequestParser(bundle_errors=True)
+    def parse_args(self, req=None, strict=False):
+        with phase("parse"):
+            return super().parse_args(req=req, strict=strict)
+
+
+token_parser = RequestParser(bundle_errors=True)
 token_parser.add_argument(
     "Authorization",
     type=str,
@@ -19,46 +93,315 @@ token_parser.add_argument(
 )
 
 
+def verify_token(token: str) -> dict:
+    """
+    Returns the claims of a valid access token. Tokens are decoded and verified once, then served from the token cache until they expire.
+    """
+    if not token:
+        raise jwt.InvalidTokenError("Token is missing")
+    secret = current_app.config["TOKEN_SECRET"]
+    # the secret is part of the digest, so tokens signed with a previous secret are never served from the cache
+    digest = hashlib.sha256(f"{secret}\0{token}".encode("utf-8")).digest()
+    claims = token_cache.get(digest)
+    if claims is None:
+        claims = jwt.decode(token, secret, algorithms="HS256")
+        ttl = claims["exp"] - time.time() if "exp" in claims else None
+        token_cache.set(digest, claims, ttl=ttl)
+    return claims
+
+
+def configure_revocations(**kwargs) -> RevocationList:
+    """
+    Replaces the revocation list for this process with an empty one created with the provided arguments.
+    """
+    global revocation_list  # pylint: disable=global-statement
+    revocation_list = RevocationList(**kwargs)
+    revocation_cache.clear()
+    return revocation_list
+
+
+def refresh_revocations():
+    """
+    Loads the revocations made since the list was last refreshed, or every unexpired one if the list needs rebuilding.
+    """
+    if revocation_list.full():
+        revocations = db.session.execute(
+            db.select(RevokedToken.id, RevokedToken.jti).where(
+                RevokedToken.expires_at >= datetime.now(tz=timezone.utc)
+            )
+        ).all()
+        revocation_list.reset(revocations)
+        revocation_cache.clear()
+        return
+    # revocations committed out of order may have a lower id than the latest one loaded
+    revocations = db.session.execute(
+        db.select(RevokedToken.id, RevokedToken.jti)
+        .where(RevokedToken.id > revocation_list.since)
+        .order_by(RevokedToken.id)
+    ).all()
+    # ids checked before they were revoked may be cached as valid
+    for token_id in revocation_list.add(revocations):
+        revocation_cache.pop(token_id)
+
+
+def token_revoked(claims: dict) -> bool:
+    """
+    Returns whether the token with the provided claims was revoked. Only tokens matched by the revocation list's filter are looked up.
+    """
+    token_id = claims.get("jti")
+    if token_id is None:
+        return False
+    if revocation_list.refresh_due():
+        refresh_revocations()
+    if not revocation_list.might_be_revoked(token_id):
+        return False
+    revoked = revocation_cache.get(token_id)
+    if revoked is None:
+        revoked = (
+            db.session.execute(
+                db.select(RevokedToken.id).where(RevokedToken.jti == token_id)
+            ).first()
+            is not None
+        )
+        revocation_cache.set(token_id, revoked)
+    return revoked
+
+
+def revoke_token(claims: dict):
+    """
+    Revokes the token with the provided claims, along with every other token sharing its id, until it expires.
+    """
+    if token_revoked(claims):
+        return
+    now = datetime.now(tz=timezone.utc)
+    db.session.add(
+        RevokedToken(
+            jti=claims["jti"],
+            expires_at=datetime.fromtimestamp(claims["exp"], tz=timezone.utc),
+        )
+    )
+    # revocations of expired tokens are no longer needed
+    db.session.execute(db.delete(RevokedToken).where(RevokedToken.expires_at < now))
+    db.session.commit()
+    refresh_revocations()
+
+
+def _cached_user(user_id: int) -> tuple[bool, int]:
+    entry = user_cache.get(user_id)
+    if entry is None:
+        row = db.session.execute(
+            db.select(User.group_id).where(User.id == user_id)
+        ).one_or_none()
+        entry = (True, row.group_id) if row else (False, None)
+        user_cache.set(user_id, entry)
+    return entry
+
+
+def user_exists(user_id: int) -> bool:
+    return _cached_user(user_id)[0]
+
+
+def user_group(user_id: int) -> int:
+    """
+    Returns the id of the user's current group, or None.
+    """
+    return _cached_user(user_id)[1]
+
+
+def invalidate_user_cache(user_id: int = None):
+    """
+    Drops cached user state after a user changes, or for every user if no id is provided.
+    """
+    if user_id is None:
+        user_cache.clear()
+    else:
+        user_cache.pop(user_id)
+
+
+def permission_bits(role_names: list[str]) -> int:
+    """
+    Returns the permission bitset for a set of role names. Roles that aren't a known permission grant nothing.
+    """
+    bits = 0
+    for role_name in role_names:
+        bits |= PERMISSION_BITS.get(role_name, 0)
+    return bits
+
+
+def group_permissions(group_id: int) -> int:
+    if group_id is None:
+        return 0
+    bits = group_cache.get(group_id)
+    if bits is None:
+        role_names = db.session.execute(
+            db.select(Role.name)
+            .join(group_assign_roles)
+            .where(group_assign_roles.c.group_id == group_id)
+        ).scalars()
+        bits = permission_bits(role_names)
+        group_cache.set(group_id, bits)
+    return bits
+
+
+def invalidate_group_cache(group_id: int = None):
+    """
+    Drops the cached permissions of a group after its roles change, or of every group if no id is provided.
+    """
+    if group_id is None:
+        group_cache.clear()
+    else:
+        group_cache.pop(group_id)
+
+
+def zone_acl() -> ZoneAclIndex:
+    """
+    Returns the compiled zone grants, compiling them with a single query when they changed or the cached index expired.
+    """
+    index = zone_acl_cache.get("index")
+    if index is None:
+        grants = db.session.execute(
+            db.select(ZoneGrant.group_id, ZoneGrant.zone_pattern, ZoneGrant.permissions)
+        ).all()
+        index = ZoneAclIndex(grants)
+        zone_acl_cache.set("index", index)
+    return index
+
+
+def invalidate_zone_acl():
+    zone_acl_cache.clear()
+
+
+def zone_allowed(zone_name: dns.name.Name, permission: str) -> bool:
+    """
+    Returns whether the current request may use the zone with the provided zone permission. Always true when authentication is disabled.
+    """
+    if not current_app.config["AUTH_ENABLED"]:
+        return True
+    group_id = g.get("zone_group_id")
+    if group_id is None:
+        return False
+    return bool(
+        zone_acl().permissions(group_id, zone_name) & ZONE_PERMISSION_BITS[permission]
+    )
+
+
+def _authenticate() -> dict:
+    """
+    Returns the claims of the request's access token, after checking that its user still exists.
+    """
+    token = (
+        request.headers.get("Authorization", "").split(" ")[-1]
+        or request.cookies.get("access_token")
+        or None
+    )
+    user_token_data = verify_token(token)
+    if token_revoked(user_token_data):
+        raise jwt.InvalidTokenError("Token revoked")
+    if not user_exists(user_token_data["id"]):
+        raise NotFound("User not found")
+    return user_token_data
+
+
+@phase("auth")
+def request_permitted(permission: str) -> bool:
+    """
+    Returns whether the user of the current request has a permission, without failing the request if not. Always true when
+    authentication is disabled.
+    """
+    if not current_app.config["AUTH_ENABLED"]:
+        return True
+    try:
+        user_token_data = _authenticate()
+    except (jwt.InvalidTokenError, NotFound):
+        return False
+    return bool(user_token_data.get("permissions", 0) & PERMISSION_BITS[permission])
+
+
+def _guarded(func, authorize):
+    """
+    Wraps a resource method so authorize(kwargs) runs first, and its authentication and permission errors become responses.
+    Errors raised by the method itself are left to the API's handlers, such as a 404 for a missing record.
+    """
+
+    @functools.wraps(func)
+    def decorated(*args, **kwargs):
+        try:
+            with phase("auth"):
+                authorize(kwargs)
+
+        except jwt.ExpiredSignatureError:
+            return {"message": "Token expired"}, 401
+
+        except jwt.InvalidTokenError:
+            return {"message": "Invalid token"}, 401
+
+        except Forbidden as permission_denied:
+            return {"message": permission_denied.description}, 403
+
+        except NotFound as user_not_found:
+            return {"message": user_not_found.description}, 404
+
+        return func(*args, **kwargs)
+
+    return decorated
+
+
 # Decorator to validate JWT token and user permission
 def release_access(permission: str = None):
-    def wrapper(func):
-        def decorated(*args, **kwargs):
-            try:
-                g.args = token_parser.parse_args()
-                token = (
-                    g.args.get("Authorization").split(" ")[-1]
-                    or g.args.get("access_token")
-                    or None
-                )
-
-                user_token_data = jwt.decode(
-                    token, current_app.config["TOKEN_SECRET"], algorithms="HS256"
-                )
+    permission_bit = PERMISSION_BITS[permission] if permission else 0
 
-                if permission and permission not in user_token_data["roles"]:
-                    raise Forbidden(
-                        "User do not have the required permissions to access this resource"
-                    )
+    def authorize(_):
+        user_token_data = _authenticate()
+        granted = user_token_data.get("permissions", 0)
+        if permission_bit and not permission_bit & granted:
+            raise Forbidden(
+                "User do not have the required permissions to access this resource"
+            )
 
-                current_user = db.get_or_404(User, user_token_data["id"])
+    return lambda func: _guarded(func, authorize)
 
-                if not current_user:
-                    raise NotFound("User not found")
 
-                return func(*args, **kwargs)
+# Decorator to validate JWT token and zone permission, when authentication is enabled
+def status_access(permission: str, *, token_setting: str = None):
+    """
+    Requires a permission like release_access, but only when authentication is enabled, for routes that are also available
+    without it, such as the server diagnostics. If the app setting named by token_setting holds a token, requests bearing it
+    are allowed too, for clients that can't log in such as a Prometheus scraper.
+    """
+    permission_bit = PERMISSION_BITS[permission]
 
-            except jwt.ExpiredSignatureError:
-                return {"message": "Token expired"}, 401
+    def authorize(_):
+        if not current_app.config["AUTH_ENABLED"]:
+            return
+        static_token = current_app.config.get(token_setting) if token_setting else ""
+        if static_token and hmac.compare_digest(
+            request.headers.get("Authorization", "").split(" ")[-1].encode(),
+            static_token.encode(),
+        ):
+            return
+        if not permission_bit & _authenticate().get("permissions", 0):
+            raise Forbidden(
+                "User do not have the required permissions to access this resource"
+            )
 
-            except jwt.InvalidTokenError:
-                return {"message": "Invalid token"}, 401
+    return lambda func: _guarded(func, authorize)
 
-            except Forbidden as permission_denied:
-                return {"message": permission_denied.description}, 403
 
-            except NotFound as user_not_found:
-                return {"message": user_not_found.description}, 404
+def zone_access(permission: str):
+    """
+    Requires the zone permission on the zone_name of the route. Routes without a zone name check zone_allowed() themselves.
+    """
+    if permission not in ZONE_PERMISSION_BITS:
+        raise ValueError(f"Unknown zone permission '{permission}'")
 
-        return decorated
+    def authorize(kwargs):
+        if not current_app.config["AUTH_ENABLED"]:
+            return
+        g.zone_group_id = user_group(_authenticate()["id"])
+        zone_name = kwargs.get("zone_name")
+        if zone_name is not None and not zone_allowed(zone_name, permission):
+            raise Forbidden(
+                f"User do not have the {permission} permission for this zone"
+            )
 
-    return wrapper
+    return lambda func: _guarded(func, authorize)
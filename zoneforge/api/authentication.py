@@ -1,17 +1,32 @@
+import logging
+import math
+import uuid
 from datetime import datetime, timedelta, timezone
-import bcrypt
 import jwt
-from flask import current_app
-from flask_restx import Namespace, Resource, reqparse
+from flask import current_app, request
+from flask_restx import Namespace, Resource
 from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
 import zoneforge.db.db_model as model
+from zoneforge import passwords, throttle
 from zoneforge.db import db
-from zoneforge.api import token_parser
+from zoneforge.api import (
+    RequestParser,
+    group_permissions,
+    invalidate_user_cache,
+    release_access,
+    revoke_token,
+    token_parser,
+    token_revoked,
+    verify_token,
+)
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
 
 api = Namespace("auth", description="Authentication operations")
 
 # Parsers
-login_parser = reqparse.RequestParser(bundle_errors=True)
+login_parser = RequestParser(bundle_errors=True)
 login_parser.add_argument("username", type=str, help="Missing username", required=True)
 login_parser.add_argument("password", type=str, help="Missing password", required=True)
 
@@ -26,18 +41,16 @@ def _generate_token(user_id):
             model.User, user_id, description=f"User id '{user_id}' not found"
         )
 
-        group_roles = (
-            [role.name for role in user_entity.group.roles] if user_entity.group else []
-        )
-
         token_payload = {
             "username": user_entity.username,
-            "roles": group_roles,
+            "permissions": group_permissions(user_entity.group_id),
             "exp": datetime.now(tz=timezone.utc) + timedelta(minutes=30),
         }
 
+        # both tokens share an id, so revoking it ends the session
         refresh_token_payload = {
             "id": user_entity.id,
+            "jti": uuid.uuid4().hex,
             "exp": datetime.now(tz=timezone.utc) + timedelta(minutes=60),
         }
 
@@ -65,18 +78,39 @@ class LoginResource(Resource):
         try:
             args = login_parser.parse_args()
             username = args.get("username")
-            password = args.get("password").encode(encoding="utf-8")
+            password = args.get("password")
+
+            # checked before the password, so throttled attempts cost no hashing
+            address = request.remote_addr
+            wait = throttle.login_throttle.acquire(username, address)
+            if wait:
+                raise TooManyRequests(
+                    "Too many failed login attempts, please try again later.",
+                    retry_after=math.ceil(wait),
+                )
 
             user_entity = db.one_or_404(
                 db.select(model.User).filter_by(username=username),
                 description=f"User '{username}' not found",
             )
 
-            if not user_entity or not bcrypt.checkpw(
-                password, user_entity.password.encode(encoding="utf-8")
+            if not user_entity or not passwords.hasher.check(
+                password, user_entity.password
             ):
                 raise Unauthorized("Username and password not match")
 
+            # upgrade hashes made with a previous cost, now that we have the password
+            if passwords.hasher.needs_rehash(user_entity.password):
+                try:
+                    user_entity.password = passwords.hasher.hash(password)
+                    db.session.commit()
+                except ServiceUnavailable:
+                    # the password is correct, so the upgrade waits for a less busy login
+                    logger.warning(
+                        "Too busy to upgrade the password hash of user '%s'", username
+                    )
+
+            throttle.login_throttle.release(username, address)
             return _generate_token(user_entity.id), 200
 
         except NotFound as user_not_found:
@@ -85,6 +119,18 @@ class LoginResource(Resource):
         except Unauthorized as wrong_credentials:
             return {"message": wrong_credentials.description}, 401
 
+        except TooManyRequests as throttled:
+            return (
+                {"message": throttled.description},
+                429,
+                {"Retry-After": str(throttled.retry_after)},
+            )
+
+        except ServiceUnavailable as busy:
+            # the password wasn't checked, so the attempt doesn't count
+            throttle.login_throttle.release(username, address)
+            return {"message": busy.description}, 503
+
 
 @api.route("/refresh")
 class RefreshTokenResource(Resource):
@@ -96,13 +142,40 @@ class RefreshTokenResource(Resource):
             or None
         )
 
-        user_refresh_token_data = jwt.decode(
-            token, current_app.config["REFRESH_TOKEN_SECRET"], algorithms="HS256"
-        )
+        try:
+            user_refresh_token_data = jwt.decode(
+                token, current_app.config["REFRESH_TOKEN_SECRET"], algorithms="HS256"
+            )
+            if token_revoked(user_refresh_token_data):
+                raise jwt.InvalidTokenError("Token revoked")
+
+        except jwt.ExpiredSignatureError:
+            return {"message": "Token expired"}, 401
+
+        except jwt.InvalidTokenError:
+            return {"message": "Invalid token"}, 401
 
         return _generate_token(user_refresh_token_data["id"]), 200
 
 
+@api.route("/logout")
+class LogoutResource(Resource):
+    @release_access()
+    def post(self):
+        """
+        Revokes the access token and its refresh token.
+        """
+        args = token_parser.parse_args()
+        token = (
+            args.get("Authorization").split(" ")[-1] or args.get("access_token") or None
+        )
+        claims = verify_token(token)
+        if "jti" not in claims:
+            raise BadRequest("Token predates revocation support and can't be revoked")
+        revoke_token(claims)
+        return {"message": "Logged out"}, 200
+
+
 @api.route("/signup")
 class SignupResource(Resource):
     def post(self):
@@ -125,9 +198,7 @@ class SignupResource(Resource):
             if user_exists:
                 raise Conflict("Username already exists")
 
-            hashed_password = bcrypt.hashpw(
-                password.encode(encoding="utf-8"), bcrypt.gensalt()
-            ).decode("utf-8")
+            hashed_password = passwords.hasher.hash(password)
 
             user = model.User(
                 username=username,
@@ -136,8 +207,13 @@ class SignupResource(Resource):
 
             db.session.add(user)
             db.session.commit()
+            # the id may have been cached as not existing, e.g. if it belonged to a deleted user
+            invalidate_user_cache(user.id)
 
             return {"message": "User created successfully"}, 200
 
         except Conflict as user_exist:
             return {"message": user_exist.description}, 409
+
+        except ServiceUnavailable as busy:
+            return {"message": busy.description}, 503
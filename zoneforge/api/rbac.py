@@ -1,27 +1,101 @@
-from flask_restx import Namespace, Resource, reqparse
+from flask_restx import Namespace, Resource, inputs
+from sqlalchemy.orm import selectinload
 from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
 
-from zoneforge.api import release_access
+from zoneforge.acl import (
+    ZONE_PERMISSIONS,
+    normalize_zone_pattern,
+    zone_permission_bits,
+    zone_permission_names,
+)
+from zoneforge.api import (
+    RequestParser,
+    invalidate_group_cache,
+    invalidate_user_cache,
+    invalidate_zone_acl,
+    release_access,
+)
 from zoneforge.db import db
-from zoneforge.db.db_model import Group, Role, User
+from zoneforge.db.db_model import Group, Role, User, ZoneGrant
 
 api = Namespace("rbac", description="RBAC Manager")
 
 # Parsers
-rbac_parser = reqparse.RequestParser(bundle_errors=True)
+rbac_parser = RequestParser(bundle_errors=True)
 rbac_parser.add_argument("name", type=str, help="Missing name", required=True)
 
+zone_grant_parser = RequestParser(bundle_errors=True)
+zone_grant_parser.add_argument(
+    "zone_pattern",
+    type=str,
+    help="Zone name, '*.' followed by a zone name for every zone below it, or '*' for every zone",
+    required=True,
+)
+zone_grant_parser.add_argument(
+    "permissions",
+    type=str,
+    action="append",
+    choices=ZONE_PERMISSIONS,
+    help=f"Zone permissions to grant, any of {', '.join(ZONE_PERMISSIONS)}",
+    required=True,
+)
+
+MAX_PAGE_SIZE = 1000
+
+page_parser = RequestParser(bundle_errors=True)
+page_parser.add_argument(
+    "after_id",
+    type=int,
+    default=0,
+    help="Only list entries with a greater id, i.e. the next_after_id of the previous page",
+    location="args",
+)
+page_parser.add_argument(
+    "limit",
+    type=inputs.int_range(1, MAX_PAGE_SIZE),
+    default=100,
+    help=f"Maximum number of entries to list, up to {MAX_PAGE_SIZE}",
+    location="args",
+)
+
+
+def _page(select, id_column) -> tuple[list, int]:
+    """
+    Returns a page of the selected entities in id order, using keyset pagination on the id column,
+    along with the after_id to request the next page with, or None if this is the last page.
+    """
+    args = page_parser.parse_args()
+    entities = (
+        db.session.execute(
+            select.where(id_column > args["after_id"])
+            .order_by(id_column)
+            .limit(args["limit"])
+        )
+        .scalars()
+        .all()
+    )
+    next_after_id = entities[-1].id if len(entities) == args["limit"] else None
+    return entities, next_after_id
+
 
 @api.route("/group")
 class GroupResource(Resource):
     @release_access("group_read")
     def get(self):
-        group_entities = db.paginate(db.select(Group))
+        group_entities, next_after_id = _page(
+            db.select(Group).options(selectinload(Group.roles)), Group.id
+        )
 
         return {
             "groups": [
-                {"id": group.id, "group_name": group.name} for group in group_entities
-            ]
+                {
+                    "id": group.id,
+                    "group_name": group.name,
+                    "roles": [role.name for role in group.roles],
+                }
+                for group in group_entities
+            ],
+            "next_after_id": next_after_id,
         }, 200
 
     @release_access("group_create")
@@ -75,6 +149,10 @@ class SpecificGroupResource(Resource):
 
         db.session.delete(group_entity)
         db.session.commit()
+        # the group's users are left without a group, and its zone grants are deleted with it
+        invalidate_user_cache()
+        invalidate_group_cache(group_id)
+        invalidate_zone_acl()
 
         return {"message": "Group deleted"}, 200
 
@@ -83,10 +161,13 @@ class SpecificGroupResource(Resource):
 class RoleResource(Resource):
     @release_access("role_read")
     def get(self):
-        role_entities = db.paginate(db.select(Role))
+        role_entities, next_after_id = _page(db.select(Role), Role.id)
 
         return {
-            "roles": [{"id": role.id, "role_name": role.name} for role in role_entities]
+            "roles": [
+                {"id": role.id, "role_name": role.name} for role in role_entities
+            ],
+            "next_after_id": next_after_id,
         }
 
     @release_access("role_create")
@@ -131,6 +212,7 @@ class SpecificRoleResource(Resource):
         current_role.name = role_name
 
         db.session.commit()
+        invalidate_group_cache()
 
         return {"message": "Role updated successfully"}, 200
 
@@ -140,10 +222,96 @@ class SpecificRoleResource(Resource):
 
         db.session.delete(role_entity)
         db.session.commit()
+        invalidate_group_cache()
 
         return {"message": "Role deleted"}, 200
 
 
+@api.route("/group/<int:group_id>/user")
+class GroupMembersResource(Resource):
+    @release_access("group_read")
+    def get(self, group_id: int = None):
+        db.get_or_404(Group, group_id, description="Group id not exist")
+        user_entities, next_after_id = _page(
+            db.select(User).where(User.group_id == group_id), User.id
+        )
+
+        return {
+            "users": [
+                {"id": user.id, "username": user.username} for user in user_entities
+            ],
+            "next_after_id": next_after_id,
+        }, 200
+
+
+@api.route("/group/<int:group_id>/zone")
+class GroupZoneGrantResource(Resource):
+    @release_access("zoneGrant_read")
+    def get(self, group_id: int = None):
+        db.get_or_404(Group, group_id, description="Group id not exist")
+        grant_entities, next_after_id = _page(
+            db.select(ZoneGrant).where(ZoneGrant.group_id == group_id), ZoneGrant.id
+        )
+
+        return {
+            "zone_grants": [
+                {
+                    "id": grant.id,
+                    "zone_pattern": grant.zone_pattern,
+                    "permissions": zone_permission_names(grant.permissions),
+                }
+                for grant in grant_entities
+            ],
+            "next_after_id": next_after_id,
+        }, 200
+
+    @release_access("zoneGrant_create")
+    def post(self, group_id: int = None):
+        args = zone_grant_parser.parse_args()
+        db.get_or_404(Group, group_id, description="Group id not exist")
+        try:
+            zone_pattern = normalize_zone_pattern(args["zone_pattern"])
+        except ValueError as e:
+            raise BadRequest(f"Invalid zone pattern: {e}") from e
+
+        grant_entity = db.session.execute(
+            db.select(ZoneGrant).filter_by(group_id=group_id, zone_pattern=zone_pattern)
+        ).scalar_one_or_none()
+
+        if grant_entity:
+            raise Conflict("Zone pattern already granted to this group")
+
+        grant = ZoneGrant(
+            group_id=group_id,
+            zone_pattern=zone_pattern,
+            permissions=zone_permission_bits(args["permissions"]),
+        )
+
+        db.session.add(grant)
+        db.session.commit()
+        invalidate_zone_acl()
+
+        return {"message": "Zone grant created successfully", "id": grant.id}, 201
+
+
+@api.route("/group/<int:group_id>/zone/<int:grant_id>")
+class SpecificGroupZoneGrantResource(Resource):
+    @release_access("zoneGrant_delete")
+    def delete(self, group_id: int = None, grant_id: int = None):
+        grant_entity = db.get_or_404(
+            ZoneGrant, grant_id, description="Zone grant id not exist"
+        )
+
+        if grant_entity.group_id != group_id:
+            raise NotFound("Zone grant id not exist")
+
+        db.session.delete(grant_entity)
+        db.session.commit()
+        invalidate_zone_acl()
+
+        return {"message": "Zone grant deleted"}, 200
+
+
 @api.route("/group/<int:group_id>/user/<int:user_id>")
 class UserAssignGroupResource(Resource):
     @release_access("userAssignGroup_read")
@@ -157,6 +325,7 @@ class UserAssignGroupResource(Resource):
         user_entity.group_id = group_id
 
         db.session.commit()
+        invalidate_user_cache(user_id)
 
         return {"message": "User assign to a group successfully"}, 200
 
@@ -174,6 +343,7 @@ class UserAssignGroupResource(Resource):
         user_entity.group_id = group_id
 
         db.session.commit()
+        invalidate_user_cache(user_id)
 
         return {"message": "User assign to the new group"}, 200
 
@@ -191,6 +361,7 @@ class UserAssignGroupResource(Resource):
         user_entity.group_id = None
 
         db.session.commit()
+        invalidate_user_cache(user_id)
 
         return {"message": "User association from this group deleted"}, 200
 
@@ -199,7 +370,12 @@ class UserAssignGroupResource(Resource):
 class RoleAssignGroupResource(Resource):
     @release_access("roleAssignGroup_read")
     def post(self, group_id: int = None, role_id: int = None):
-        group_entity = db.get_or_404(Group, group_id, description="Group id not exist")
+        group_entity = db.get_or_404(
+            Group,
+            group_id,
+            description="Group id not exist",
+            options=[selectinload(Group.roles)],
+        )
         role_entity = db.get_or_404(Role, role_id, description="Role id not exist")
 
         for role in group_entity.roles:
@@ -209,12 +385,18 @@ class RoleAssignGroupResource(Resource):
         group_entity.roles.append(role_entity)
 
         db.session.commit()
+        invalidate_group_cache(group_id)
 
         return {"message": "Role assign to group successfully"}, 201
 
     @release_access("roleAssignGroup_delete")
     def delete(self, group_id: str = None, role_id: str = None):
-        group_entity = db.get_or_404(Group, group_id, description="Group id not exist")
+        group_entity = db.get_or_404(
+            Group,
+            group_id,
+            description="Group id not exist",
+            options=[selectinload(Group.roles)],
+        )
         role_entity = db.get_or_404(Role, role_id, description="Role id not exist")
 
         if role_entity not in group_entity.roles:
@@ -223,5 +405,6 @@ class RoleAssignGroupResource(Resource):
         group_entity.roles.remove(role_entity)
 
         db.session.commit()
+        invalidate_group_cache(group_id)
 
         return {"message": "Role association from this group deleted"}, 200
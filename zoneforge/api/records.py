@@ -1,17 +1,18 @@
-from flask_restx import Resource, Namespace, reqparse, fields
+from flask_restx import Resource, Namespace, fields
 from flask import current_app
 from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
+from zoneforge.api import RequestParser, zone_access
 from zoneforge.core import (
-    get_records,
     create_record,
     update_record,
     delete_record,
     record_to_response,
 )
+from zoneforge.core.compact import get_record_responses
 
 api = Namespace("records", description="DNS record related operations", path="/")
 
-record_get_parser = reqparse.RequestParser()
+record_get_parser = RequestParser()
 record_get_parser.add_argument(
     "name", type=str, help="Name of the DNS record", required=False
 )
@@ -86,6 +87,7 @@ dns_record_model = api.model(
 
 @api.route("/zones/<string:zone_name>/records")
 class DnsRecord(Resource):
+    @zone_access("read")
     @api.expect(record_get_parser)
     @api.marshal_with(dns_record_model, as_list=True)
     def get(self, zone_name: str):
@@ -99,17 +101,17 @@ class DnsRecord(Resource):
         record_type = args.get("type")
         include_soa = record_type == "SOA"
 
-        records = get_records(
+        records_response = get_record_responses(
             zone_name=zone_name,
             zonefile_folder=current_app.config["ZONE_FILE_FOLDER"],
             record_name=record_name,
             record_type=record_type,
             include_soa=include_soa,
         )
-        records_response = record_to_response(records=records)
 
         return records_response
 
+    @zone_access("write")
     @api.expect(record_post_parser)
     @api.marshal_with(dns_record_model)
     def post(self, zone_name: str):
@@ -132,6 +134,7 @@ class DnsRecord(Resource):
 
 @api.route("/zones/<string:zone_name>/records/<string:record_name>")
 class SpecificDnsRecord(Resource):
+    @zone_access("read")
     @api.expect(record_get_parser)
     @api.marshal_with(dns_record_model, as_list=True)
     def get(self, zone_name: str, record_name: str):
@@ -145,19 +148,19 @@ class SpecificDnsRecord(Resource):
         record_type = args.get("type")
         include_soa = record_type == "SOA"
 
-        records = get_records(
+        records_response = get_record_responses(
             zone_name=zone_name,
             zonefile_folder=current_app.config["ZONE_FILE_FOLDER"],
             record_name=record_name,
             record_type=record_type,
             include_soa=include_soa,
         )
-        records_response = record_to_response(records=records)
 
-        if not records:
+        if not records_response:
             raise NotFound
         return records_response
 
+    @zone_access("write")
     @api.expect(record_put_parser)
     @api.marshal_with(dns_record_model)
     def put(self, zone_name: str, record_name: str):
@@ -181,6 +184,7 @@ class SpecificDnsRecord(Resource):
         updated_record_response = record_to_response(updated_record)[0]
         return updated_record_response
 
+    @zone_access("write")
     @api.expect(record_delete_parser)
     def delete(self, zone_name, record_name: str):
         """
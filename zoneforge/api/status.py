@@ -1,5 +1,16 @@
-from flask_restx import Resource, Namespace, fields
-from flask import current_app
+import os
+import tracemalloc
+from flask_restx import Resource, Namespace, fields, inputs
+from flask import Response, current_app
+from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
+import zoneforge.core.interning
+import zoneforge.core.notify
+import zoneforge.memory
+import zoneforge.metrics
+import zoneforge.tracing
+from zoneforge.api import RequestParser, status_access
+from zoneforge.core.compact import CompactZone
+from zoneforge.core.store import zone_store
 
 api = Namespace("status", description="Retrieve server status information")
 
@@ -21,6 +32,196 @@ version_res_fields = api.model(
     },
 )
 
+notify_target_res_fields = api.model(
+    "NotifyTargetStats",
+    {
+        "target": fields.String(
+            description="Address and port NOTIFY messages are sent to",
+            example="192.0.2.1:53",
+        ),
+        "sent": fields.Integer(description="Acknowledged NOTIFY messages"),
+        "failed": fields.Integer(
+            description="NOTIFY messages that went unacknowledged after all retries"
+        ),
+        "retries": fields.Integer(description="Retransmitted NOTIFY messages"),
+        "last_latency_ms": fields.Float(
+            description="Round trip time of the last acknowledged NOTIFY"
+        ),
+        "avg_latency_ms": fields.Float(
+            description="Average round trip time of acknowledged NOTIFY messages"
+        ),
+        "max_latency_ms": fields.Float(
+            description="Longest round trip time of an acknowledged NOTIFY"
+        ),
+    },
+)
+
+memory_get_parser = RequestParser()
+memory_get_parser.add_argument(
+    "top",
+    type=inputs.int_range(1, 100),
+    default=10,
+    help="How many allocation sites to list, while allocations are traced",
+    location="args",
+)
+
+zone_memory_res_fields = api.model(
+    "ZoneMemory",
+    {
+        "zone": fields.String(example="example.com."),
+        "versions": fields.Integer(description="Versions of the zone kept in memory"),
+        "names": fields.Integer(),
+        "rdatasets": fields.Integer(),
+        "rdata": fields.Integer(),
+        "names_bytes": fields.Integer(
+            description="Estimated size of the zone's names, and its mapping of them to nodes"
+        ),
+        "rdatasets_bytes": fields.Integer(
+            description="Estimated size of the zone's nodes and rdatasets"
+        ),
+        "rdata_bytes": fields.Integer(
+            description="Estimated size of the zone's rdata, including the names within them"
+        ),
+        "total_bytes": fields.Integer(),
+        "sampled": fields.Boolean(
+            description="Whether sizes were extrapolated from a sample of the zone's names"
+        ),
+    },
+)
+
+allocation_res_fields = api.model(
+    "AllocationSite",
+    {
+        "module": fields.String(example="zoneforge.core.store"),
+        "line": fields.Integer(),
+        "size_bytes": fields.Integer(
+            description="Memory allocated from this line and still held"
+        ),
+        "size_diff_bytes": fields.Integer(
+            description="Change in size_bytes since allocations were last listed"
+        ),
+        "count": fields.Integer(),
+        "count_diff": fields.Integer(),
+    },
+)
+
+compact_zone_memory_res_fields = api.model(
+    "CompactZoneMemory",
+    {
+        "zone": fields.String(example="example.com."),
+        "names": fields.Integer(),
+        "rdata": fields.Integer(),
+        "total_bytes": fields.Integer(
+            description="Size of the compact zone's columns and names"
+        ),
+    },
+)
+
+interning_res_fields = api.model(
+    "NameInterning",
+    {
+        "names": fields.Integer(description="Names shared between zones"),
+        "labels": fields.Integer(description="Labels shared between those names"),
+        "references": fields.Integer(
+            description="Times the shared names were handed out to zones and records"
+        ),
+        "table_bytes": fields.Integer(
+            description="Size of the tables of shared names and labels"
+        ),
+        "saved_bytes": fields.Integer(
+            description="Estimated memory saved by sharing names, less that held by the shared names and their tables"
+        ),
+    },
+)
+
+memory_res_fields = api.model(
+    "ServerMemory",
+    {
+        "pid": fields.Integer(description="Process of the worker that answered"),
+        "rss_bytes": fields.Integer(description="Resident set size of the worker"),
+        "peak_rss_bytes": fields.Integer(
+            description="Largest resident set size of the worker so far"
+        ),
+        "zones": fields.List(fields.Nested(zone_memory_res_fields)),
+        "compact_zones": fields.List(
+            fields.Nested(compact_zone_memory_res_fields),
+            description="Compact zones records are listed from, with COMPACT_ZONES",
+        ),
+        "interning": fields.Nested(interning_res_fields),
+        "tracing": fields.Boolean(
+            description="Whether the worker is tracing allocations"
+        ),
+        "allocations": fields.List(
+            fields.Nested(allocation_res_fields),
+            description="Allocation sites in ZoneForge code that grew the most since the last listing, while tracing",
+        ),
+    },
+)
+
+traces_get_parser = RequestParser()
+traces_get_parser.add_argument(
+    "limit",
+    type=inputs.int_range(1, 1000),
+    default=20,
+    help="How many of the most recent traces to list",
+    location="args",
+)
+traces_get_parser.add_argument(
+    "min_duration_ms",
+    type=float,
+    default=0,
+    help="Only list traces lasting at least this long",
+    location="args",
+)
+
+span_res_fields = api.model(
+    "TraceSpan",
+    {
+        "span_id": fields.Integer(),
+        "parent_id": fields.Integer(
+            description="Span this one was started within, if any"
+        ),
+        "name": fields.String(example="core.get_zones"),
+        "start_ms": fields.Float(description="Start of the span within its trace"),
+        "duration_ms": fields.Float(),
+        "attributes": fields.Raw(
+            description="Details of the span, such as the zone or statement involved"
+        ),
+    },
+)
+
+trace_res_fields = api.model(
+    "Trace",
+    {
+        "trace_id": fields.String(),
+        "name": fields.String(
+            description="Name of the trace's first span", example="GET /api/zones"
+        ),
+        "started_at": fields.DateTime(dt_format="iso8601"),
+        "duration_ms": fields.Float(),
+        "dropped_spans": fields.Integer(
+            description="Spans beyond the limit kept for a single trace"
+        ),
+        "spans": fields.List(fields.Nested(span_res_fields)),
+    },
+)
+
+traces_res_fields = api.model(
+    "ServerTraces",
+    {
+        "pid": fields.Integer(description="Process of the worker that answered"),
+        "capacity": fields.Integer(description="Most recent traces kept by the worker"),
+        "traces": fields.List(fields.Nested(trace_res_fields)),
+    },
+)
+
+
+def _require_tracer() -> zoneforge.tracing.Tracer:
+    tracer = zoneforge.tracing.tracer
+    if tracer is None:
+        raise NotFound("Tracing is disabled")
+    return tracer
+
 
 @api.route("")
 class ServerStatus(Resource):
@@ -40,3 +241,120 @@ class ServerVersion(Resource):
         Gets the current webserver's version.
         """
         return {"version": current_app.config["VERSION"]}
+
+
+@api.route("/notify")
+class ServerNotifyStats(Resource):
+    @status_access("serverDiagnostics_read")
+    @api.marshal_with(notify_target_res_fields, as_list=True)
+    def get(self):
+        """
+        Gets NOTIFY delivery and latency statistics for each secondary nameserver notified by this worker.
+        """
+        scheduler = zoneforge.core.notify.scheduler
+        if scheduler is None:
+            return []
+        return [
+            {"target": target} | stats.to_response()
+            for target, stats in scheduler.stats.items()
+        ]
+
+
+@api.route("/metrics")
+class ServerMetrics(Resource):
+    @status_access("serverDiagnostics_read", token_setting="METRICS_SCRAPE_TOKEN")
+    @api.produces(["text/plain"])
+    def get(self):
+        """
+        Gets request, zone, cache, lock and transfer metrics, added up across every worker, in the Prometheus text format.
+        """
+        writer = zoneforge.metrics.writer
+        if writer is None:
+            raise NotFound("Metrics are disabled")
+        # other workers' metrics are as of their last write, but this worker's are current
+        writer.write()
+        return Response(
+            zoneforge.metrics.render(zoneforge.metrics.aggregate(writer.directory)),
+            mimetype="text/plain; version=0.0.4",
+        )
+
+
+@api.route("/memory")
+class ServerMemory(Resource):
+    @status_access("serverDiagnostics_read")
+    @api.expect(memory_get_parser)
+    @api.marshal_with(memory_res_fields)
+    def get(self):
+        """
+        Gets the memory use of the worker that answers, with an estimate for each zone it keeps in memory.
+        While allocations are traced, also lists the lines of ZoneForge code whose allocations grew the most since the previous request.
+        """
+        args = memory_get_parser.parse_args()
+        store = zone_store(current_app.config["ZONE_FILE_FOLDER"])
+        zones = [zoneforge.memory.zone_footprint(zone) for zone in store.cached()]
+        compact_zones = [
+            compact.footprint()
+            for compact in store.cached_copies()
+            if isinstance(compact, CompactZone)
+        ]
+        tracing = tracemalloc.is_tracing()
+        return zoneforge.memory.process_memory() | {
+            "pid": os.getpid(),
+            "zones": sorted(zones, key=lambda zone: zone["total_bytes"], reverse=True),
+            "compact_zones": sorted(
+                compact_zones, key=lambda zone: zone["total_bytes"], reverse=True
+            ),
+            "interning": zoneforge.core.interning.interner.usage(),
+            "tracing": tracing,
+            "allocations": (
+                zoneforge.memory.allocation_diff(top=args["top"]) if tracing else []
+            ),
+        }
+
+    @status_access("serverDiagnostics_read")
+    def post(self):
+        """
+        Starts tracing the allocations of the worker that answers, which slows it down until tracing is stopped.
+        Only available when MEMORY_TRACE_ENABLED is set.
+        """
+        if not current_app.config["MEMORY_TRACE_ENABLED"]:
+            raise NotFound("Allocation tracing is disabled")
+        zoneforge.memory.start_tracing(frames=current_app.config["MEMORY_TRACE_FRAMES"])
+        return {"pid": os.getpid(), "tracing": True}
+
+    @status_access("serverDiagnostics_read")
+    def delete(self):
+        """
+        Stops tracing the allocations of the worker that answers.
+        """
+        zoneforge.memory.stop_tracing()
+        return {"pid": os.getpid(), "tracing": False}
+
+
+@api.route("/traces")
+class ServerTraces(Resource):
+    @status_access("serverDiagnostics_read")
+    @api.expect(traces_get_parser)
+    @api.marshal_with(traces_res_fields)
+    def get(self):
+        """
+        Gets the most recent traces of the worker that answers, most recent first.
+        """
+        tracer = _require_tracer()
+        args = traces_get_parser.parse_args()
+        traces = tracer.recent(
+            limit=args["limit"], min_duration=args["min_duration_ms"] / 1000
+        )
+        return {
+            "pid": os.getpid(),
+            "capacity": tracer.capacity,
+            "traces": [trace.to_response() for trace in traces],
+        }
+
+    @status_access("serverDiagnostics_read")
+    def delete(self):
+        """
+        Discards the traces kept by the worker that answers.
+        """
+        _require_tracer().clear()
+        return {"pid": os.getpid()}
@@ -1,8 +1,9 @@
 import dns.name
 from flask import current_app
-from flask_restx import Namespace, Resource, fields, reqparse
+from flask_restx import Namespace, Resource, fields
 from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
 
+from zoneforge.api import RequestParser, zone_access, zone_allowed
 from zoneforge.api.records import dns_record_model
 from zoneforge.core import (
     create_record,
@@ -12,11 +13,12 @@ from zoneforge.core import (
     get_zones,
     update_record,
 )
-from zoneforge.core.transfer import zone_from_zone_transfer
+from zoneforge.core.compact import get_zone_responses
+from zoneforge.core.transfer import sync_catalog, zone_from_zone_transfer
 
 api = Namespace("zones", description="DNS zone related operations")
 
-zone_parser = reqparse.RequestParser()
+zone_parser = RequestParser()
 zone_parser.add_argument("name", type=str, help="Name of the DNS Zone", required=False)
 
 zone_post_parser = zone_parser.copy()
@@ -127,7 +129,7 @@ zone_model = api.model(
     },
 )
 
-zone_transfer_parser = reqparse.RequestParser()
+zone_transfer_parser = RequestParser()
 zone_transfer_parser.add_argument(
     "zone_name",
     type=str,
@@ -159,22 +161,58 @@ zone_transfer_parser.add_argument(
     required=False,
 )
 
+catalog_sync_parser = RequestParser()
+catalog_sync_parser.add_argument(
+    "catalog_name",
+    type=str,
+    help="Name of the catalog zone to sync member zones from.",
+    required=True,
+)
+catalog_sync_parser.add_argument(
+    "primary_ns_ip",
+    type=str,
+    help="IP of the nameserver to transfer the catalog zone and its member zones from.",
+    required=True,
+)
+catalog_sync_parser.add_argument(
+    "primary_ns_port",
+    type=str,
+    help="Port to connect to for the zone transfers. If not provided, port 53 is assumed.",
+    required=False,
+)
+catalog_sync_parser.add_argument(
+    "transfer_timeout",
+    type=str,
+    help="How long to wait, in seconds, for each transfer to complete. 60s by default.",
+    required=False,
+)
+
+catalog_sync_model = api.model(
+    "DnsCatalogZoneSync",
+    {
+        "name": fields.String(example="catalog.invalid."),
+        "added": fields.List(fields.String, example=["example.com."]),
+        "removed": fields.List(fields.String, example=["example.org."]),
+    },
+)
+
 
 @api.route("")
 class DnsZone(Resource):
+    @zone_access("read")
     @api.marshal_with(zone_model, as_list=True)
     def get(self):
         """
         Gets a list of all DNS Zones known to the server.
         """
-        zones_response = []
-
-        dns_name = None
-        zones = get_zones(current_app.config["ZONE_FILE_FOLDER"], dns_name)
-        for zone in zones:
-            zones_response.append(zone.to_response())
-        return zones_response
-
+        zones = get_zone_responses(current_app.config["ZONE_FILE_FOLDER"])
+        return [
+            zone
+            for zone in zones
+            if zone_allowed(dns.name.from_text(zone["name"]), "read")
+        ]
+
+    @zone_access("write")
     @api.expect(zone_post_parser)
     @api.marshal_with(zone_model)
     def post(self):
@@ -185,6 +223,8 @@ class DnsZone(Resource):
 
         zone_name = args.get("name")
         dns_name = dns.name.from_text(zone_name)
+        if not zone_allowed(dns_name, "write"):
+            raise Forbidden("User do not have the write permission for this zone")
 
         zones = get_zones(current_app.config["ZONE_FILE_FOLDER"], dns_name)
         if len(zones) != 0:
@@ -247,6 +287,7 @@ class DnsZone(Resource):
             soa_rrset=soa_rrset,
             ns_rrset=primary_ns_rrset,
             ns_a_rrset=primary_ns_a_rrset,
+            catalog_zone=current_app.config["CATALOG_ZONE"],
         )
 
         return new_zone.to_response()
@@ -254,6 +295,7 @@ class DnsZone(Resource):
 
 @api.route("/<string:zone_name>")
 class SpecificDnsZone(Resource):
+    @zone_access("read")
     @api.marshal_with(zone_model)
     def get(self, zone_name: str):
         """
@@ -261,14 +303,15 @@ class SpecificDnsZone(Resource):
         """
         dns_name = dns.name.from_text(zone_name)
 
-        zone = get_zones(
+        zones = get_zone_responses(
             zonefile_folder=current_app.config["ZONE_FILE_FOLDER"], zone_name=dns_name
-        )[0]
-        if not zone:
+        )
+        if not zones:
             raise NotFound("A zone with that name does not exist.")
 
-        return zone.to_response()
+        return zones[0]
 
+    @zone_access("write")
     @api.marshal_with(zone_model)
     def put(self, zone_name: str):
         """
@@ -314,6 +357,7 @@ class SpecificDnsZone(Resource):
         update_zone_response = update_zone[0].to_response()
         return update_zone_response
 
+    @zone_access("delete")
     @api.marshal_with(zone_model)
     def delete(self, zone_name: str):
         """
@@ -322,7 +366,9 @@ class SpecificDnsZone(Resource):
         dns_name = dns.name.from_text(zone_name)
 
         if delete_zone(
-            zonefile_folder=current_app.config["ZONE_FILE_FOLDER"], zone_name=dns_name
+            zonefile_folder=current_app.config["ZONE_FILE_FOLDER"],
+            zone_name=dns_name,
+            catalog_zone=current_app.config["CATALOG_ZONE"],
         ):
             return {}
         raise NotFound("A zone with that name does not exist.")
@@ -330,6 +376,7 @@ class SpecificDnsZone(Resource):
 
 @api.route("/transfer")
 class DnsZoneInboundTransfer(Resource):
+    @zone_access("write")
     @api.expect(zone_transfer_parser)
     @api.marshal_with(zone_model)
     def post(self):
@@ -338,6 +385,8 @@ class DnsZoneInboundTransfer(Resource):
         """
         args = zone_transfer_parser.parse_args()
         zone_name_clean = str(dns.name.from_text(args["zone_name"]))
+        if not zone_allowed(zone_name_clean, "write"):
+            raise Forbidden("User do not have the write permission for this zone")
 
         kw_args = {}
         primary_ns_ip = args.get("primary_ns_ip")
@@ -356,6 +405,39 @@ class DnsZoneInboundTransfer(Resource):
         new_zone = zone_from_zone_transfer(
             zone_name=zone_name_clean,
             zonefile_folder=current_app.config["ZONE_FILE_FOLDER"],
+            catalog_zone=current_app.config["CATALOG_ZONE"],
             **kw_args,
         )
         return new_zone.to_response()
+
+
+@api.route("/catalog/sync")
+class DnsCatalogZoneSync(Resource):
+    @zone_access("write")
+    @api.expect(catalog_sync_parser)
+    @api.marshal_with(catalog_sync_model)
+    def post(self):
+        """
+        Transfers a catalog zone (RFC 9432) from a primary nameserver, then transfers its new member zones and deletes its removed ones.
+        """
+        args = catalog_sync_parser.parse_args()
+        catalog_name = dns.name.from_text(args["catalog_name"])
+        if not zone_allowed(catalog_name, "write"):
+            raise Forbidden("User do not have the write permission for this zone")
+
+        kw_args = {}
+        primary_ns_port_str = args.get("primary_ns_port")
+        if primary_ns_port_str:
+            kw_args["nameserver_port"] = int(primary_ns_port_str)
+        xfr_timeout = args.get("transfer_timeout")
+        if xfr_timeout:
+            kw_args["transfer_timeout"] = int(xfr_timeout)
+
+        return sync_catalog(
+            catalog_name=catalog_name,
+            zonefile_folder=current_app.config["ZONE_FILE_FOLDER"],
+            nameserver_ip=args["primary_ns_ip"],
+            catalog_zone=current_app.config["CATALOG_ZONE"],
+            authorize=zone_allowed,
+            **kw_args,
+        )
@@ -1,11 +1,11 @@
-import glob
 import re
 import importlib
 import logging
+import threading
 from datetime import datetime
-from os import remove
-from os.path import join, exists, basename
-from typing import Type
+from os import getpid, remove, replace
+from os.path import join, exists, getsize
+from typing import Iterator, NamedTuple, Type
 import dns.immutable
 import dns.node
 import dns.name
@@ -18,6 +18,18 @@ import dns.rrset
 import dns.versioned
 import dns.transaction
 from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
+from zoneforge import metrics
+from zoneforge.accesslog import annotate, phase
+from zoneforge.tracing import set_attributes, traced
+from zoneforge.core.catalog import (
+    add_member,
+    catalog_members,
+    is_catalog,
+    new_catalog_zone,
+    remove_member,
+)
+from zoneforge.core.notify import schedule_notify
+from zoneforge.core.store import zone_store
 
 RECORD_FIELDS_TO_RELATIVIZE = [
     "target",
@@ -25,11 +37,26 @@ RECORD_FIELDS_TO_RELATIVIZE = [
     "exchange",
 ]
 ZFZONE_CUSTOM_ATTRS = ["_zone", "record_count"]
+# serializes catalog zone changes, which read the serial they increment
+catalog_lock = threading.Lock()
 
 # Assume we have a logger setup for us already
 logger = logging.getLogger()
 
 
+class RecordView(NamedTuple):
+    """
+    A single record of a zone, read from the zone's node without copying its rdataset into a new RRset.
+    """
+
+    name: dns.name.Name
+    ttl: int
+    rdtype: dns.rdatatype.RdataType
+    rdata: dns.rdata.Rdata
+    # the record's position within its rdataset, which identifies it when it's updated or deleted
+    index: int
+
+
 class ZFZone(dns.zone.Zone):
     """
     Extends the dnspython library's Zone class to provide additional handling
@@ -39,8 +66,9 @@ class ZFZone(dns.zone.Zone):
     # pylint: disable=super-init-not-called
     def __init__(self, zone: dns.zone.Zone, zonefile_folder: str):
         self._zone = zone  # Store the original zone instance
-        self.record_count = len(self.get_all_records())
+        self.record_count = self.count_rrsets()
         self.zonefile_folder = zonefile_folder
+        metrics.zone_records.set(self.origin.to_text(), value=self.record_count)
 
     # pylint: enable=super-init-not-called
 
@@ -63,66 +91,108 @@ class ZFZone(dns.zone.Zone):
         res["soa"] = record_to_response(soa)[0]
         return res
 
-    def write_to_file(self):
-        update_timestamp = int(datetime.now().strftime("%Y%m%d"))
+    @phase("file_write")
+    @traced("core.write_to_file")
+    def write_to_file(self, *, serial: int = None):
         zone_name = str(self.origin)
         with self.writer() as txn:
-            txn.update_serial(value=update_timestamp, relative=False)
+            if serial is None:
+                serial = next_serial(
+                    txn.get(dns.name.empty, dns.rdatatype.SOA)[0].serial
+                )
+            txn.update_serial(value=serial, relative=False)
         zone_file_path = join(self.zonefile_folder, f"{zone_name}zone")
 
         logger.debug("Writing zone %s to '%s'", self.origin, zone_file_path)
-        self.to_file(f=zone_file_path, want_comments=True, want_origin=True)
-        self.record_count = len(self.get_all_records())
+        # write to a temporary file first, so readers never see a partially written zone file
+        temp_file_path = f"{zone_file_path}.{getpid()}.{threading.get_ident()}.tmp"
+        with zone_store(self.zonefile_folder).writing(self._zone):
+            try:
+                with metrics.zone_serialize_duration.time():
+                    self.to_file(f=temp_file_path, want_comments=True, want_origin=True)
+                replace(temp_file_path, zone_file_path)
+            finally:
+                if exists(temp_file_path):
+                    remove(temp_file_path)
+        self.record_count = self.count_rrsets()
+        metrics.zone_file_bytes.set(zone_name, value=getsize(zone_file_path))
+        metrics.zone_records.set(zone_name, value=self.record_count)
+        schedule_notify(self)
 
     def get_all_records(self, record_type: str = None, include_soa: bool = False):
-        include_soa = include_soa or record_type == "SOA"
-        record_type = (
-            dns.rdatatype.from_text(record_type)
-            if record_type
-            else dns.rdatatype.from_text("ANY")
-        )
-        all_records_gen = self.iterate_rdatasets(rdtype=record_type)
-        all_records = [
-            dns.rrset.from_rdata_list(
-                record[0], ttl=record[1].ttl, rdatas=record[1].items
-            )
-            for record in all_records_gen
-            if include_soa or record[1].rdtype != dns.rdatatype.SOA
+        return [
+            dns.rrset.from_rdata_list(name, ttl=rdataset.ttl, rdatas=rdataset.items)
+            for name, rdataset in self.iter_rrsets(record_type, include_soa)
         ]
-        return list(all_records)
+
+    def iter_rrsets(
+        self, record_type: str = None, include_soa: bool = False
+    ) -> Iterator[tuple[dns.name.Name, dns.rdataset.Rdataset]]:
+        """
+        Yields the name and rdataset of each record set in the zone, optionally only those of a type, straight from the zone's nodes.
+        SOA records are skipped unless they're included or asked for by type.
+        """
+        rdtype = dns.rdatatype.from_text(record_type) if record_type else None
+        include_soa = include_soa or rdtype == dns.rdatatype.SOA
+        # committed versions are replaced rather than changed, so the nodes are read as of when iteration started
+        nodes = self.nodes
+        for name, node in nodes.items():
+            for rdataset in node.rdatasets:
+                if rdtype is not None and rdataset.rdtype != rdtype:
+                    continue
+                if rdataset.rdtype == dns.rdatatype.SOA and not include_soa:
+                    continue
+                yield name, rdataset
+
+    def iter_records(
+        self, record_type: str = None, include_soa: bool = False
+    ) -> Iterator[RecordView]:
+        """
+        Yields each record in the zone as a view of its rdata, optionally only those of a type.
+        """
+        for name, rdataset in self.iter_rrsets(record_type, include_soa):
+            for index, rdata in enumerate(rdataset):
+                yield RecordView(name, rdataset.ttl, rdataset.rdtype, rdata, index)
+
+    def count_rrsets(self) -> int:
+        return sum(1 for _ in self.iter_rrsets())
+
+
+def next_serial(serial: int) -> int:
+    """
+    Returns the serial a zone is written with after one with the provided serial: today's date as YYYYMMDDnn, or the next
+    serial if today's isn't greater in serial number arithmetic (RFC 1982), e.g. once the zone was written earlier today.
+    """
+    date_serial = int(datetime.now().strftime("%Y%m%d")) * 100
+    if 0 < (date_serial - serial) % 2**32 < 2**31:
+        return date_serial
+    return (serial + 1) % 2**32
 
 
+@phase("zone_load")
+@traced("core.get_zones")
 def get_zones(zonefile_folder: str, zone_name: dns.name.Name = None) -> list[ZFZone]:
-    zonefile_map = {}
-    zones = []
+    store = zone_store(zonefile_folder)
     if zone_name:
         logger.debug("Getting zone object for origin '%s'", zone_name)
-        zonefile_map[zone_name] = join(zonefile_folder, f"{zone_name}zone")
+        zone_names = [zone_name]
     else:
-        zonefile_pattern = join(zonefile_folder, "*zone")
-        zone_files = glob.glob(zonefile_pattern)
-        for filepath in zone_files:
-            filename = basename(filepath)
-            domain = ".".join(filename.split(".")[:-1])
-            if domain:
-                zonefile_map[domain] = filepath
-
-    for z_name, z_file_path in zonefile_map.items():
-        if not exists(z_file_path):
-            continue
+        zone_names = store.zone_names()
+
+    zones = []
+    for z_name in zone_names:
         try:
-            zone = dns.zone.from_file(
-                f=z_file_path,
-                origin=z_name,
-                zone_factory=dns.versioned.Zone,
-                relativize=True,
-            )
-            zfzone = ZFZone(zone=zone, zonefile_folder=zonefile_folder)
-            zones.append(zfzone)
+            zone = store.get(z_name)
         except Exception as e:
             raise InternalServerError(
-                f"ERROR: exception loading zone file '{z_file_path}'"
+                f"ERROR: exception loading zone file '{join(zonefile_folder, f'{z_name}zone')}'"
             ) from e
+        if zone is None:
+            continue
+        zones.append(ZFZone(zone=zone, zonefile_folder=zonefile_folder))
+    if zone_name and zones:
+        annotate(zone=zones[0].origin.to_text(), zone_records=zones[0].record_count)
+    set_attributes(zones=len(zones))
     return zones
 
 
@@ -133,6 +203,7 @@ def create_zone(
     soa_rrset: dns.rrset.RRset,
     ns_rrset: dns.rrset.RRset,
     ns_a_rrset: dns.rrset.RRset = None,
+    catalog_zone: dns.name.Name = None,
 ) -> ZFZone:
     zone_file_path = join(zonefile_folder, f"{zone_name}zone")
     if exists(zone_file_path):
@@ -147,18 +218,98 @@ def create_zone(
         if ns_a_rrset:
             txn.add(ns_a_rrset)
     new_zfzone.write_to_file()
+    if catalog_zone:
+        update_catalog(
+            catalog_zone=catalog_zone,
+            zonefile_folder=zonefile_folder,
+            added=[zone_name],
+        )
     return new_zfzone
 
 
-def delete_zone(zone_name: dns.name.Name, zonefile_folder: str) -> bool:
+def delete_zone(
+    zone_name: dns.name.Name,
+    zonefile_folder: str,
+    *,
+    catalog_zone: dns.name.Name = None,
+) -> bool:
     zone_file_name = join(zonefile_folder, f"{zone_name}zone")
     if exists(zone_file_name):
         logger.info("Removing zone %s", zone_name)
         remove(zone_file_name)
+        zone_store(zonefile_folder).discard(zone_name)
+        metrics.zone_file_bytes.remove(str(zone_name))
+        metrics.zone_records.remove(str(zone_name))
+        if catalog_zone:
+            update_catalog(
+                catalog_zone=catalog_zone,
+                zonefile_folder=zonefile_folder,
+                removed=[zone_name],
+            )
         return True
     return False
 
 
+def update_catalog(
+    *,
+    catalog_zone: dns.name.Name,
+    zonefile_folder: str,
+    added: list[dns.name.Name] = (),
+    removed: list[dns.name.Name] = (),
+) -> ZFZone:
+    """
+    Adds and removes members of the catalog zone, incrementing its serial so secondaries pick up the change.
+    If the catalog zone doesn't exist yet, it's created listing every local zone that isn't a catalog.
+    """
+    catalog_zone = dns.name.from_text(str(catalog_zone))
+    with metrics.timed_lock(catalog_lock, "catalog"):
+        return _update_catalog(
+            catalog_zone=catalog_zone,
+            zonefile_folder=zonefile_folder,
+            added=added,
+            removed=removed,
+        )
+
+
+def _update_catalog(
+    *,
+    catalog_zone: dns.name.Name,
+    zonefile_folder: str,
+    added: list[dns.name.Name],
+    removed: list[dns.name.Name],
+) -> ZFZone:
+    catalogs = get_zones(zonefile_folder, catalog_zone)
+    if not catalogs:
+        members = [
+            zone.origin
+            for zone in get_zones(zonefile_folder)
+            if zone.origin != catalog_zone and not is_catalog(zone)
+        ]
+        logger.info(
+            "Creating catalog zone %s with %d members", catalog_zone, len(members)
+        )
+        catalog = ZFZone(
+            zone=new_catalog_zone(catalog_zone, members),
+            zonefile_folder=zonefile_folder,
+        )
+        catalog.write_to_file(serial=1)
+        return catalog
+
+    catalog = catalogs[0]
+    members = catalog_members(catalog)
+    added = [zone_name for zone_name in added if zone_name not in members]
+    removed = [zone_name for zone_name in removed if zone_name in members]
+    if not added and not removed:
+        return catalog
+    with catalog.writer() as txn:
+        for zone_name in added:
+            add_member(txn, zone_name)
+        for zone_name in removed:
+            remove_member(txn, zone_name)
+    catalog.write_to_file(serial=(catalog.get_soa().serial + 1) % 2**32)
+    return catalog
+
+
 def get_records(
     zone_name: str,
     zonefile_folder: str,
@@ -167,42 +318,62 @@ def get_records(
     record_type: str = None,
     include_soa: bool = False,
 ) -> list[dns.rrset.RRset]:
+    zone = _get_zone(zone_name, zonefile_folder)
+    if not record_name:
+        return zone.get_all_records(record_type=record_type, include_soa=include_soa)
+    matching_records = [
+        dns.rrset.from_rdata_list(record_name, ttl=rdataset.ttl, rdatas=rdataset.items)
+        for rdataset in _node_rdatasets(zone, record_name, record_type)
+    ]
+    if not matching_records:
+        raise NotFound
+    return matching_records
+
+
+def iter_records(
+    zone_name: str,
+    zonefile_folder: str,
+    *,
+    record_name: str = None,
+    record_type: str = None,
+    include_soa: bool = False,
+) -> Iterator[RecordView]:
+    """
+    Like get_records, but returns the records as views that are only read from the zone as they're iterated over.
+    Missing zones and names are still raised as NotFound when it's called.
+    """
+    zone = _get_zone(zone_name, zonefile_folder)
+    if not record_name:
+        return zone.iter_records(record_type=record_type, include_soa=include_soa)
+    matching_records = [
+        RecordView(record_name, rdataset.ttl, rdataset.rdtype, rdata, index)
+        for rdataset in _node_rdatasets(zone, record_name, record_type)
+        for index, rdata in enumerate(rdataset)
+    ]
+    if not matching_records:
+        raise NotFound
+    return iter(matching_records)
+
+
+def _get_zone(zone_name: str, zonefile_folder: str) -> ZFZone:
     zone = get_zones(zonefile_folder=zonefile_folder, zone_name=zone_name)
     if not zone:
         raise NotFound("the specified zone does not exist.")
-    zone = ZFZone(zone=zone[0], zonefile_folder=zonefile_folder)
+    return zone[0]
 
-    if record_name:
-        try:
-            matching_node = zone[record_name].rdatasets
-        except KeyError:
-            # we're using the key indexing as a shortcut to test if we have the record
-            raise NotFound  # pylint: disable=raise-missing-from
-
-        if record_type:
-            record_type = dns.rdatatype.from_text(record_type)
-            matching_records = [
-                dns.rrset.from_rdata_list(
-                    record_name, ttl=record.ttl, rdatas=record.items
-                )
-                for record in matching_node
-                if record.rdtype == record_type
-            ]
-        else:
-            matching_records = [
-                dns.rrset.from_rdata_list(
-                    record_name, ttl=record.ttl, rdatas=record.items
-                )
-                for record in matching_node
-            ]
 
-        if not matching_records:
-            raise NotFound
-    else:
-        matching_records = zone.get_all_records(
-            record_type=record_type, include_soa=include_soa
-        )
-    return matching_records
+def _node_rdatasets(
+    zone: ZFZone, record_name: str, record_type: str = None
+) -> list[dns.rdataset.Rdataset]:
+    try:
+        matching_node = zone[record_name].rdatasets
+    except KeyError:
+        # we're using the key indexing as a shortcut to test if we have the record
+        raise NotFound  # pylint: disable=raise-missing-from
+    if not record_type:
+        return list(matching_node)
+    record_type = dns.rdatatype.from_text(record_type)
+    return [rdataset for rdataset in matching_node if rdataset.rdtype == record_type]
 
 
 # pylint: disable=too-many-arguments
@@ -250,7 +421,7 @@ def create_record(
         updated_rrset = new_rrset
 
     if write:
-        with zone.writer() as txn:
+        with phase("mutation"), zone.writer() as txn:
             txn.add(updated_rrset)
         logger.info(
             "Created record %s in zone %s with data '%s'",
@@ -300,7 +471,7 @@ def update_record(
     ]
     updated_rrset = dns.rrset.from_rdata_list(record_name, record_ttl, new_rdata_list)
 
-    with zone.writer() as txn:
+    with phase("mutation"), zone.writer() as txn:
         txn.replace(updated_rrset)
     logger.info(
         "Updated record %s in zone %s with data '%s'",
@@ -332,7 +503,7 @@ def delete_record(
         record_data=record_data,
         record_class=record_class,
     )
-    with zone.writer() as txn:
+    with phase("mutation"), zone.writer() as txn:
         try:
             txn.delete_exact(record_name, target_rdata)
             logger.info("Deleted record %s in zone %s", record_name, zone_name)
@@ -347,58 +518,72 @@ def delete_record(
 # pylint: enable=too-many-arguments
 
 
-def record_to_response(records: list[dns.rrset.RRset]) -> dict:
+@phase("serialize")
+@traced("core.record_to_response")
+def record_to_response(
+    records: dns.rrset.RRset | list[dns.rrset.RRset] | Iterator[RecordView],
+) -> list[dict]:
     transformed_records = []
     if isinstance(records, dns.rrset.RRset):
         records = [records]
 
-    for rrset in records:
-        logger.debug("transforming records under name %s", rrset.name)
-        rdata_index = 0
-        for rdata in rrset.items:
-            record_type = rrset.rdtype
-            record = {
-                "name": str(rrset.name),
-                "type": record_type._name_,  # pylint: disable=protected-access
-                "ttl": rrset.ttl,
-                "data": {},
-                "comment": "",
-                "index": rdata_index,
-            }
-            if getattr(rdata, "rdcomment", None):
-                record["comment"] = rdata.rdcomment
-            record_slots = get_rdata_class_slots(
-                record_type._name_  # pylint: disable=protected-access
-            )
-            for slot in record_slots:
-                property_value = getattr(rdata, slot)
-                # perform any necessary transformations
-                # needs to be explicitly checked for None since dns.name.Name for a root record is evaluated to False (len=0)
-                if property_value is not None:
-                    if slot == "strings":
-                        txt = ""
-                        prefix = ""
-                        for s in property_value:
-                            txt += f"{prefix}{dns.rdata._escapify(s)}"  # pylint: disable=protected-access
-                            prefix = " "
-                        property_value = txt
-                    if isinstance(property_value, dns.name.Name):
-                        property_value = property_value.to_text()
-                    if slot == "rname":
-                        email_not_relative = len(property_value.split(".")) > 1
-                        if email_not_relative:
-                            email_with_address = re.sub(
-                                r"(?<=[^\\])\.(?=(.*\.).*)", "@", property_value
-                            )
-                            email_proper = re.sub(r"\\\.", ".", email_with_address)
-                            property_value = email_proper
-                record["data"][slot] = property_value
-
-            transformed_records.append(record)
-            rdata_index += 1
+    for view in _record_views(records):
+        rdata = view.rdata
+        record_type = view.rdtype
+        record = {
+            "name": str(view.name),
+            "type": record_type._name_,  # pylint: disable=protected-access
+            "ttl": view.ttl,
+            "data": {},
+            "comment": "",
+            "index": view.index,
+        }
+        if getattr(rdata, "rdcomment", None):
+            record["comment"] = rdata.rdcomment
+        record_slots = get_rdata_class_slots(
+            record_type._name_  # pylint: disable=protected-access
+        )
+        for slot in record_slots:
+            property_value = getattr(rdata, slot)
+            # perform any necessary transformations
+            # needs to be explicitly checked for None since dns.name.Name for a root record is evaluated to False (len=0)
+            if property_value is not None:
+                if slot == "strings":
+                    txt = ""
+                    prefix = ""
+                    for s in property_value:
+                        txt += f"{prefix}{dns.rdata._escapify(s)}"  # pylint: disable=protected-access
+                        prefix = " "
+                    property_value = txt
+                if isinstance(property_value, dns.name.Name):
+                    property_value = property_value.to_text()
+                if slot == "rname":
+                    email_not_relative = len(property_value.split(".")) > 1
+                    if email_not_relative:
+                        email_with_address = re.sub(
+                            r"(?<=[^\\])\.(?=(.*\.).*)", "@", property_value
+                        )
+                        email_proper = re.sub(r"\\\.", ".", email_with_address)
+                        property_value = email_proper
+            record["data"][slot] = property_value
+
+        transformed_records.append(record)
     return transformed_records
 
 
+def _record_views(
+    records: list[dns.rrset.RRset] | Iterator[RecordView],
+) -> Iterator[RecordView]:
+    for record in records:
+        if isinstance(record, RecordView):
+            yield record
+            continue
+        logger.debug("transforming records under name %s", record.name)
+        for index, rdata in enumerate(record):
+            yield RecordView(record.name, record.ttl, record.rdtype, rdata, index)
+
+
+@traced("core.request_to_rdata")
 def request_to_rdata(
     *,
     zone_name: str,
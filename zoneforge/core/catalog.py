@@ -0,0 +1,85 @@
+"""
+Catalog zones (RFC 9432) list the member zones of a server as PTR records, so secondaries can discover and provision
+them with a single transfer.
+"""
+
+import hashlib
+import dns.name
+import dns.rdata
+import dns.rdataclass
+import dns.rdataset
+import dns.rdatatype
+import dns.transaction
+import dns.zone
+
+CATALOG_VERSION = "2"
+CATALOG_TTL = 0
+# the SOA and NS records of a catalog zone are never used for resolution, RFC 9432 section 4.1
+CATALOG_SOA = "invalid. invalid. {serial} 3600 600 2147483646 0"
+CATALOG_NS = "invalid."
+VERSION_NAME = dns.name.from_text("version", origin=None)
+ZONES_NAME = dns.name.from_text("zones", origin=None)
+
+
+def member_id(member: dns.name.Name) -> dns.name.Name:
+    """
+    Returns the catalog name, relative to the catalog origin, of the member zone's PTR record.
+    The unique label is the hash of the member's name, so that it is stable across catalog generations.
+    """
+    unique = hashlib.sha1(member.canonicalize().to_wire()).hexdigest()
+    return dns.name.Name((unique.encode(),)).concatenate(ZONES_NAME)
+
+
+def new_catalog_zone(
+    origin: dns.name.Name, members: list[dns.name.Name], *, serial: int = 1
+) -> dns.zone.Zone:
+    """
+    Builds a catalog zone listing the provided member zones.
+    """
+    catalog = dns.zone.Zone(origin=origin)
+    with catalog.writer() as txn:
+        txn.add(dns.name.empty, _rdataset("SOA", CATALOG_SOA.format(serial=serial)))
+        txn.add(dns.name.empty, _rdataset("NS", CATALOG_NS))
+        txn.add(VERSION_NAME, _rdataset("TXT", f'"{CATALOG_VERSION}"'))
+        for member in members:
+            add_member(txn, member)
+    return catalog
+
+
+def is_catalog(zone: dns.zone.Zone) -> bool:
+    """
+    Returns whether the zone is a catalog zone of a supported schema version.
+    """
+    version = zone.get_rdataset(VERSION_NAME, dns.rdatatype.TXT)
+    if not version:
+        return False
+    return any(b"".join(rdata.strings).decode() == CATALOG_VERSION for rdata in version)
+
+
+def catalog_members(zone: dns.zone.Zone) -> set[dns.name.Name]:
+    """
+    Returns the names of the member zones listed in a catalog zone.
+    """
+    zones_name = ZONES_NAME.derelativize(zone.origin)
+    members = set()
+    for name, rdataset in zone.iterate_rdatasets(dns.rdatatype.PTR):
+        name = name.derelativize(zone.origin)
+        # member zones are direct children of the zones label; deeper names hold member properties
+        if name.parent() == zones_name:
+            members.update(rdata.target.derelativize(zone.origin) for rdata in rdataset)
+    return members
+
+
+def add_member(txn: dns.transaction.Transaction, member: dns.name.Name):
+    txn.replace(member_id(member), _rdataset("PTR", member.to_text()))
+
+
+def remove_member(txn: dns.transaction.Transaction, member: dns.name.Name):
+    if txn.name_exists(member_id(member)):
+        txn.delete(member_id(member))
+
+
+def _rdataset(rdtype: str, text: str) -> dns.rdataset.Rdataset:
+    return dns.rdataset.from_rdata(
+        CATALOG_TTL, dns.rdata.from_text(dns.rdataclass.IN, rdtype, text)
+    )
@@ -0,0 +1,260 @@
+import bisect
+import json
+import sys
+from array import array
+from os.path import join
+import dns.name
+import dns.node
+import dns.rdatatype
+import dns.zone
+from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
+from zoneforge.accesslog import annotate, phase
+from zoneforge.core import RecordView, get_zones, iter_records, record_to_response
+from zoneforge.core.store import zone_store
+from zoneforge.tracing import traced
+
+
+# pylint: disable=too-many-instance-attributes
+class CompactZone:
+    """
+    A read-only copy of a zone's records, kept in columns rather than as dnspython objects, for listing records without keeping
+    the parsed zone in memory.
+
+    Records are kept grouped by name, in the zone's order. The names are held as text within a single string, and each record
+    as its type, TTL and index within its rdataset, in arrays, along with its data and comment rendered as JSON within another
+    string.
+    """
+
+    def __init__(self, zone: dns.zone.Zone):
+        self.origin = zone.origin
+        # the end of each name within _names, and the position of its first record
+        self._name_ends = array("I")
+        self._name_starts = array("I")
+        self._rdtypes = array("H")
+        self._ttls = array("I")
+        self._indexes = array("I")
+        # the end of each record's rendered data within _data
+        self._data_ends = array("I")
+        self._type_names = {}
+        self.record_count = 0
+        self.soa = None
+
+        names = []
+        rendered = []
+        for name, node in zone.nodes.items():
+            names.append(name.to_text())
+            self._name_ends.append(
+                (self._name_ends[-1] if self._name_ends else 0) + len(names[-1])
+            )
+            self._add_node(name, node, rendered=rendered)
+        self._name_starts.append(len(self._rdtypes))
+        self._names = "".join(names)
+        self._data = "".join(rendered)
+        # positions of the names in order of their lowercased text, to find them by bisection, as DNS names compare
+        # case-insensitively
+        self._sorted_names = array(
+            "I", sorted(range(len(names)), key=lambda position: names[position].lower())
+        )
+
+    def __len__(self) -> int:
+        return len(self._rdtypes)
+
+    def to_response(self) -> dict:
+        return {
+            "name": self.origin.to_text(),
+            "record_count": self.record_count,
+            "soa": self.soa,
+        }
+
+    def records(
+        self,
+        *,
+        record_name: str = None,
+        record_type: str = None,
+        include_soa: bool = False,
+    ) -> list[dict]:
+        """
+        Returns records as record_to_response would, optionally only those under a name and of a type.
+        SOA records are left out unless they're included, asked for by type, or the records of a name are requested.
+        Raises KeyError if there is no such name in the zone.
+        """
+        rdtype = dns.rdatatype.from_text(record_type) if record_type else None
+        if record_name:
+            positions = [self._find_name(record_name)]
+            include_soa = True
+        else:
+            positions = range(len(self._name_ends))
+            include_soa = include_soa or rdtype == dns.rdatatype.SOA
+        responses = []
+        for position in positions:
+            # records under a specific name are returned with the name as it was requested
+            name = record_name or self._name(position)
+            for i in range(
+                self._name_starts[position], self._name_starts[position + 1]
+            ):
+                record_rdtype = self._rdtypes[i]
+                if rdtype is not None and record_rdtype != rdtype:
+                    continue
+                if record_rdtype == dns.rdatatype.SOA and not include_soa:
+                    continue
+                data, comment = json.loads(
+                    self._data[self._data_ends[i - 1] if i else 0 : self._data_ends[i]]
+                )
+                responses.append(
+                    {
+                        "name": name,
+                        "type": self._type_names[record_rdtype],
+                        "ttl": self._ttls[i],
+                        "data": data,
+                        "comment": comment,
+                        "index": self._indexes[i],
+                    }
+                )
+        return responses
+
+    def footprint(self) -> dict:
+        """
+        Returns the memory held by the compact zone.
+        """
+        columns = (
+            self._names,
+            self._name_ends,
+            self._name_starts,
+            self._sorted_names,
+            self._rdtypes,
+            self._ttls,
+            self._indexes,
+            self._data_ends,
+            self._data,
+        )
+        return {
+            "zone": self.origin.to_text(),
+            "names": len(self._name_ends),
+            "rdata": len(self),
+            "total_bytes": sum(sys.getsizeof(column) for column in columns),
+        }
+
+    def _name(self, position: int) -> str:
+        start = self._name_ends[position - 1] if position else 0
+        return self._names[start : self._name_ends[position]]
+
+    def _folded_name(self, position: int) -> str:
+        return self._name(position).lower()
+
+    def _find_name(self, record_name: str) -> int:
+        name = dns.name.from_text(record_name, None)
+        if name.is_absolute():
+            if not name.is_subdomain(self.origin):
+                raise KeyError(record_name)
+            name = name.relativize(self.origin)
+        name_text = name.to_text().lower()
+        i = bisect.bisect_left(self._sorted_names, name_text, key=self._folded_name)
+        if (
+            i == len(self._sorted_names)
+            or self._folded_name(self._sorted_names[i]) != name_text
+        ):
+            raise KeyError(record_name)
+        return self._sorted_names[i]
+
+    def _add_node(self, name: dns.name.Name, node: dns.node.Node, *, rendered: list):
+        self._name_starts.append(len(self._rdtypes))
+        for rdataset in node.rdatasets:
+            self._type_names.setdefault(
+                int(rdataset.rdtype),
+                rdataset.rdtype._name_,  # pylint: disable=protected-access
+            )
+            if rdataset.rdtype != dns.rdatatype.SOA:
+                self.record_count += 1
+        views = [
+            RecordView(name, rdataset.ttl, rdataset.rdtype, rdata, index)
+            for rdataset in node.rdatasets
+            for index, rdata in enumerate(rdataset)
+        ]
+        for view, record in zip(views, record_to_response(views)):
+            if view.rdtype == dns.rdatatype.SOA:
+                self.soa = record
+            self._rdtypes.append(view.rdtype)
+            self._ttls.append(view.ttl)
+            self._indexes.append(view.index)
+            data = json.dumps(
+                [record["data"], record["comment"]], separators=(",", ":")
+            )
+            rendered.append(data)
+            self._data_ends.append(
+                (self._data_ends[-1] if self._data_ends else 0) + len(data)
+            )
+
+
+# pylint: enable=too-many-instance-attributes
+
+
+@phase("zone_load")
+@traced("core.compact_zone")
+def compact_zone(zonefile_folder: str, zone_name: dns.name.Name) -> CompactZone:
+    """
+    Returns the compact zone for the provided origin, or None if there is no such zone.
+    """
+    try:
+        compact = zone_store(zonefile_folder).read_copy(zone_name, build=CompactZone)
+    except Exception as e:
+        raise InternalServerError(
+            f"ERROR: exception loading zone file '{join(zonefile_folder, f'{zone_name}zone')}'"
+        ) from e
+    if compact is not None:
+        annotate(zone=compact.origin.to_text(), zone_records=compact.record_count)
+    return compact
+
+
+def get_zone_responses(
+    zonefile_folder: str, zone_name: dns.name.Name = None
+) -> list[dict]:
+    """
+    Returns the zones as ZFZone.to_response would, from compact zones if the zone file folder's store has compact_reads.
+    """
+    store = zone_store(zonefile_folder)
+    if not store.compact_reads:
+        return [zone.to_response() for zone in get_zones(zonefile_folder, zone_name)]
+    zones = [
+        compact_zone(zonefile_folder, z_name)
+        for z_name in ([zone_name] if zone_name else store.zone_names())
+    ]
+    return [zone.to_response() for zone in zones if zone is not None]
+
+
+def get_record_responses(
+    zone_name: str,
+    zonefile_folder: str,
+    *,
+    record_name: str = None,
+    record_type: str = None,
+    include_soa: bool = False,
+) -> list[dict]:
+    """
+    Returns the records get_records would, as record_to_response would, from a compact zone if the zone file folder's store
+    has compact_reads.
+    """
+    if not zone_store(zonefile_folder).compact_reads:
+        return record_to_response(
+            iter_records(
+                zone_name,
+                zonefile_folder,
+                record_name=record_name,
+                record_type=record_type,
+                include_soa=include_soa,
+            )
+        )
+    compact = compact_zone(zonefile_folder, zone_name)
+    if compact is None:
+        raise NotFound("the specified zone does not exist.")
+    try:
+        with phase("serialize"):
+            responses = compact.records(
+                record_name=record_name,
+                record_type=record_type,
+                include_soa=include_soa,
+            )
+    except KeyError:
+        raise NotFound  # pylint: disable=raise-missing-from
+    if record_name and not responses:
+        raise NotFound
+    return responses
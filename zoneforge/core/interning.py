@@ -0,0 +1,227 @@
+import collections
+import inspect
+import sys
+import threading
+import weakref
+import dns.name
+import dns.rdata
+import dns.rdataset
+from zoneforge import metrics
+
+# names beyond this many aren't interned until names no longer in use are dropped from the table
+DEFAULT_CAPACITY = 100_000
+
+
+class _InternedName(dns.name.Name):
+    """
+    A name that can be weakly referenced, so the table drops it once no zone or record holds it.
+    """
+
+    __slots__ = ("__weakref__",)
+
+
+# pylint: disable=too-many-instance-attributes
+class NameInterner:
+    """
+    Keeps a single instance of each name, so that the same relative names in each zone (such as www or mail), and the names
+    within rdata (such as the targets of NS and MX records), are shared instead of parsed into objects of their own.
+    The labels of the names are shared in the same way, e.g. those of a provider's domain between its nameservers' names.
+
+    Names are told apart by their labels as they're written, so names differing only in case aren't shared. The table holds
+    weak references to the names, which are dropped along with their labels once nothing else holds them. Once the table
+    reaches its capacity, names aren't interned until some are dropped.
+    """
+
+    def __init__(self, *, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        # weak references to interned names by their labels, which are the names' own tuples
+        self._names = {}
+        # the number of times each interned name was handed out, by its labels
+        self._references = {}
+        # shared labels, and the number of interned names holding each
+        self._labels = {}
+        self._label_counts = collections.Counter()
+        # references to dropped names, released from the tables by the next thread holding the lock
+        self._dropped = collections.deque()
+        self._lock = threading.Lock()
+        # the constructor arguments of each rdata class that may hold a name
+        self._rdata_fields = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def name(self, name: dns.name.Name) -> dns.name.Name:
+        """
+        Returns the interned name with the same labels as the provided one, interning it if there's none.
+        Returns the name itself while interning is disabled.
+        """
+        if not self.capacity:
+            return name
+        interned = self._get(name.labels)
+        if interned is not None:
+            self.hits += 1
+            return interned
+        self.misses += 1
+        with self._lock:
+            self._release_dropped()
+            interned = self._get(name.labels)
+            if interned is not None:
+                return interned
+            if name.labels in self._names:
+                # dropped, but not released yet
+                self._remove(self._names[name.labels])
+            if len(self._names) >= self.capacity:
+                return name
+            interned = _InternedName(
+                # single byte labels are already shared by Python
+                self._labels.setdefault(label, label) if len(label) > 1 else label
+                for label in name.labels
+            )
+            self._label_counts.update(
+                label for label in interned.labels if len(label) > 1
+            )
+            self._names[interned.labels] = weakref.KeyedRef(
+                interned, self._dropped.append, interned.labels
+            )
+            self._references[interned.labels] = 1
+            return interned
+
+    def rdataset(self, rdataset: dns.rdataset.Rdataset) -> dns.rdataset.Rdataset:
+        """
+        Returns an rdataset whose rdata hold interned names, which is the rdataset itself if they already do.
+        Rdata holding names that aren't interned are replaced by copies holding the interned ones.
+        """
+        if not self.capacity:
+            return rdataset
+        rdatas = [self.rdata(rdata) for rdata in rdataset]
+        if all(interned is rdata for interned, rdata in zip(rdatas, rdataset)):
+            return rdataset
+        interned = dns.rdataset.Rdataset(
+            rdataset.rdclass, rdataset.rdtype, rdataset.covers, rdataset.ttl
+        )
+        for rdata in rdatas:
+            interned.add(rdata)
+        return interned
+
+    def rdata(self, rdata: dns.rdata.Rdata) -> dns.rdata.Rdata:
+        """
+        Returns an rdata holding interned names, which is the rdata itself if it already does or holds none.
+        """
+        fields = self._rdata_fields.get(type(rdata))
+        if fields is None:
+            fields = self._rdata_fields.setdefault(type(rdata), _fields(type(rdata)))
+        replacements = {}
+        for field in fields:
+            value = getattr(rdata, field, None)
+            if isinstance(value, dns.name.Name):
+                interned = self.name(value)
+                if interned is not value:
+                    replacements[field] = interned
+        return rdata.replace(**replacements) if replacements else rdata
+
+    def usage(self) -> dict:
+        """
+        Returns the number of interned names and labels, and an estimate of the memory they save: the size of a name, its
+        tuple of labels and the labels for each time an interned name was handed out, less the size of the interned names
+        and labels and of the tables holding them.
+        """
+        with self._lock:
+            self._release_dropped()
+            names = [
+                (name, self._references.get(labels, 0))
+                for labels, ref in self._names.items()
+                if (name := ref()) is not None
+            ]
+            labels = list(self._labels)
+            table_bytes = sum(
+                sys.getsizeof(table)
+                for table in (
+                    self._names,
+                    self._references,
+                    self._labels,
+                    self._label_counts,
+                )
+            )
+        references = 0
+        unshared_bytes = 0
+        shared_bytes = table_bytes
+        for name, name_references in names:
+            size = sys.getsizeof(name) + sys.getsizeof(name.labels)
+            references += name_references
+            unshared_bytes += name_references * (
+                size + sum(sys.getsizeof(label) for label in name.labels)
+            )
+            shared_bytes += size
+        for label in labels:
+            shared_bytes += sys.getsizeof(label)
+        return {
+            "names": len(names),
+            "labels": len(labels),
+            "references": references,
+            "table_bytes": table_bytes,
+            "saved_bytes": unshared_bytes - shared_bytes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+            self._references.clear()
+            self._labels.clear()
+            self._label_counts.clear()
+            self._dropped.clear()
+
+    def _get(self, labels: tuple) -> dns.name.Name:
+        ref = self._names.get(labels)
+        interned = ref() if ref is not None else None
+        if interned is not None:
+            self._references[labels] = self._references.get(labels, 0) + 1
+        return interned
+
+    def _release_dropped(self):
+        """
+        Removes the names no longer held by anything else from the table, releasing their labels.
+        Names are dropped by whichever thread releases them last, so they're queued to change the table while holding the lock.
+        """
+        while self._dropped:
+            ref = self._dropped.popleft()
+            # unless the table was cleared, or the name was interned again, since it was dropped
+            if self._names.get(ref.key) is ref:
+                self._remove(ref)
+
+    def _remove(self, ref: weakref.KeyedRef):
+        del self._names[ref.key]
+        self._references.pop(ref.key, None)
+        for label in ref.key:
+            if len(label) > 1:
+                self._label_counts[label] -= 1
+                if not self._label_counts[label]:
+                    del self._label_counts[label]
+                    del self._labels[label]
+
+
+# pylint: enable=too-many-instance-attributes
+
+
+def _fields(cls) -> tuple:
+    return tuple(
+        parameter
+        for parameter in inspect.signature(cls.__init__).parameters
+        if parameter not in ("self", "rdclass", "rdtype")
+    )
+
+
+interner = NameInterner()  # pylint: disable=invalid-name
+metrics.watch_cache("names", interner)
+
+
+def configure(*, capacity: int = DEFAULT_CAPACITY) -> NameInterner:
+    """
+    Interns up to the provided number of names in this process, or none if it's 0.
+    Names interned before are kept by the zones holding them, but are no longer shared with names loaded afterwards.
+    """
+    interner.capacity = capacity
+    if not capacity:
+        interner.clear()
+    return interner
@@ -0,0 +1,304 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.opcode
+import dns.query
+import dns.rcode
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+# The process-wide scheduler used by ZFZone.write_to_file, if NOTIFY is enabled
+scheduler = None  # pylint: disable=invalid-name
+
+
+class NotifyTargetStats:
+    """
+    Counts the NOTIFY messages sent to a target. They're sent from several threads at once, so counts are updated under a lock.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.last_latency_ms = None
+        self.max_latency_ms = None
+        self._total_latency_ms = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def avg_latency_ms(self):
+        if not self.sent:
+            return None
+        return self._total_latency_ms / self.sent
+
+    def record(self, latency_ms: float):
+        with self._lock:
+            self.sent += 1
+            self._total_latency_ms += latency_ms
+            self.last_latency_ms = latency_ms
+            self.max_latency_ms = max(self.max_latency_ms or 0.0, latency_ms)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def to_response(self) -> dict:
+        with self._lock:
+            return {
+                "sent": self.sent,
+                "failed": self.failed,
+                "retries": self.retries,
+                "last_latency_ms": self.last_latency_ms,
+                "avg_latency_ms": self.avg_latency_ms,
+                "max_latency_ms": self.max_latency_ms,
+            }
+
+
+# pylint: disable=too-many-instance-attributes
+class NotifyScheduler:
+    """
+    Sends DNS NOTIFY (RFC 1996) messages to the secondaries of written zones from a background thread.
+
+    Notifications are debounced per zone: a round is sent once the zone has gone delay seconds without another write,
+    or max_delay seconds after the first pending write, whichever comes first.
+    Targets are the zone's NS records, excluding the primary nameserver in its SOA, plus any extra targets given as "address[:port]".
+    Each target is notified once per round, even if it's both an extra target and one of the zone's nameservers.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        *,
+        delay: float = 5,
+        max_delay: float = 60,
+        extra_targets: list[str] = None,
+        port: int = 53,
+        retries: int = 3,
+        timeout: float = 2,
+    ):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.extra_targets = [_parse_target(t, port) for t in extra_targets or []]
+        self.port = port
+        self.retries = retries
+        self.timeout = timeout
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="zf-notify"
+        )
+
+    # pylint: enable=too-many-arguments
+
+    def schedule(self, zone):
+        """
+        Queues a NOTIFY round for a zone that was just written.
+        """
+        notify_info = _zone_notify_info(zone)
+        now = time.monotonic()
+        with self._condition:
+            pending = self._pending.get(notify_info["origin"])
+            first_write = pending["first_write"] if pending else now
+            self._pending[notify_info["origin"]] = notify_info | {
+                "first_write": first_write,
+                "last_write": now,
+            }
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="zf-notify-scheduler", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def _due_at(self, pending: dict) -> float:
+        return min(
+            pending["last_write"] + self.delay, pending["first_write"] + self.max_delay
+        )
+
+    def _run(self):
+        try:
+            self._run_rounds()
+        finally:
+            # lets the next write start the thread again, should it ever stop
+            with self._condition:
+                self._thread = None
+
+    def _run_rounds(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                due = [
+                    origin
+                    for origin, pending in self._pending.items()
+                    if self._due_at(pending) <= now
+                ]
+                if not due:
+                    next_due = min(
+                        (self._due_at(p) for p in self._pending.values()), default=None
+                    )
+                    self._condition.wait(
+                        timeout=next_due - now if next_due is not None else None
+                    )
+                    continue
+                rounds = [self._pending.pop(origin) for origin in due]
+            for notify_info in rounds:
+                try:
+                    self.notify_zone(notify_info)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception(
+                        "Error sending NOTIFY for zone %s", notify_info["origin"]
+                    )
+
+    def notify_zone(self, notify_info: dict):
+        # in order, without duplicates
+        targets = list(
+            dict.fromkeys(self.extra_targets + self._resolve_targets(notify_info))
+        )
+        logger.info(
+            "Sending NOTIFY for zone %s to %d targets",
+            notify_info["origin"],
+            len(targets),
+        )
+        for target in targets:
+            self._executor.submit(
+                self._send, notify_info["origin"], notify_info["soa"], target=target
+            )
+
+    def _resolve_targets(self, notify_info: dict) -> list[tuple[str, int]]:
+        targets = []
+        for ns_name, addresses in notify_info["nameservers"]:
+            if not addresses:
+                addresses = _resolve_addresses(ns_name)
+            targets.extend((address, self.port) for address in addresses)
+        return targets
+
+    def _send(self, origin: dns.name.Name, soa: dns.rrset.RRset, *, target: tuple):
+        target_text = f"{target[0]}:{target[1]}"
+        with self._stats_lock:
+            stats = self.stats.setdefault(target_text, NotifyTargetStats())
+        query = dns.message.make_query(origin, dns.rdatatype.SOA)
+        query.set_opcode(dns.opcode.NOTIFY)
+        query.flags = (query.flags | dns.flags.AA) & ~dns.flags.RD
+        query.answer.append(soa)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                stats.record_retry()
+                time.sleep(min(2**attempt, 30) * 0.5)
+            start = time.monotonic()
+            try:
+                response = dns.query.udp(
+                    query, target[0], port=target[1], timeout=self.timeout
+                )
+            except (dns.exception.DNSException, OSError) as e:
+                logger.debug("NOTIFY for %s to %s failed: %s", origin, target_text, e)
+                continue
+            if response.rcode() != dns.rcode.NOERROR:
+                logger.debug(
+                    "NOTIFY for %s to %s answered with %s",
+                    origin,
+                    target_text,
+                    dns.rcode.to_text(response.rcode()),
+                )
+                continue
+            stats.record((time.monotonic() - start) * 1000)
+            logger.debug("NOTIFY for %s acknowledged by %s", origin, target_text)
+            return
+        stats.record_failure()
+        logger.warning(
+            "NOTIFY for zone %s to %s failed after %d attempts",
+            origin,
+            target_text,
+            self.retries + 1,
+        )
+
+
+# pylint: enable=too-many-instance-attributes
+
+
+def configure(**kwargs) -> NotifyScheduler:
+    """
+    Enables NOTIFY after zone writes for this process, using a scheduler created with the provided arguments.
+    """
+    global scheduler  # pylint: disable=global-statement
+    scheduler = NotifyScheduler(**kwargs)
+    return scheduler
+
+
+def schedule_notify(zone):
+    if scheduler is not None:
+        scheduler.schedule(zone)
+
+
+def _zone_notify_info(zone) -> dict:
+    """
+    Collects what a NOTIFY round for the zone needs: its SOA, and its secondary nameservers along with any in-zone addresses for them.
+    """
+    origin = zone.origin
+    soa_rdataset = zone.get_rdataset(dns.name.empty, dns.rdatatype.SOA)
+    # the NOTIFY is rendered without an origin, so the SOA's names need to be absolute
+    soa_rdata = soa_rdataset[0].replace(
+        mname=soa_rdataset[0].mname.derelativize(origin),
+        rname=soa_rdataset[0].rname.derelativize(origin),
+    )
+    soa = dns.rrset.from_rdata(origin, soa_rdataset.ttl, soa_rdata)
+    primary_ns = soa_rdata.mname
+    nameservers = []
+    ns_rdataset = zone.get_rdataset(dns.name.empty, dns.rdatatype.NS) or []
+    for ns in ns_rdataset:
+        ns_name = ns.target.derelativize(origin)
+        if ns_name == primary_ns:
+            continue
+        addresses = []
+        if ns_name.is_subdomain(origin):
+            for rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA):
+                glue = zone.get_rdataset(ns_name.relativize(origin), rdtype)
+                addresses.extend(rdata.address for rdata in glue or [])
+        nameservers.append((ns_name, addresses))
+    return {"origin": origin, "soa": soa, "nameservers": nameservers}
+
+
+def _resolve_addresses(ns_name: dns.name.Name) -> list[str]:
+    """
+    Resolves a nameserver's IPv4 and IPv6 addresses, logging a warning if it has neither.
+    """
+    addresses = []
+    for rdtype in ("A", "AAAA"):
+        try:
+            answer = dns.resolver.resolve(ns_name, rdtype)
+        except dns.exception.DNSException as e:
+            logger.debug("Unable to resolve %s %s for NOTIFY: %s", ns_name, rdtype, e)
+            continue
+        addresses.extend(rdata.address for rdata in answer)
+    if not addresses:
+        logger.warning("Unable to resolve nameserver %s for NOTIFY", ns_name)
+    return addresses
+
+
+def _parse_target(target: str, default_port: int) -> tuple[str, int]:
+    """
+    Parses "address", "address:port" or "[ipv6 address]:port" into an (address, port) tuple.
+    """
+    target = target.strip()
+    if target.startswith("["):
+        address, _, port = target[1:].partition("]:")
+        return address.rstrip("]"), int(port or default_port)
+    if target.count(":") == 1:
+        address, port = target.split(":")
+        return address, int(port)
+    return target, default_port
@@ -0,0 +1,382 @@
+import contextlib
+import glob
+import logging
+import os
+import threading
+import time
+from os.path import join, basename, abspath, dirname
+import dns.immutable
+import dns.name
+import dns.rdataclass
+import dns.rdataset
+import dns.versioned
+import dns.zone
+from zoneforge import metrics
+from zoneforge.core.interning import interner
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class _WritableVersion(dns.zone.WritableVersion):
+    """
+    Copies the nodes of the committed version with a plain dict copy when a write transaction starts.
+
+    dnspython copies them through the immutable mapping's Python level interface, hashing every name again,
+    which makes each write transaction on a zone with thousands of names cost tens of milliseconds.
+
+    The names of the records written, and those within their rdata, are interned so they're shared with other zones.
+    """
+
+    def __init__(self, zone: dns.zone.Zone, replacement: bool = False):
+        super().__init__(zone, replacement=True)
+        if not replacement:
+            nodes = zone.nodes
+            if isinstance(nodes, dns.immutable.Dict):
+                nodes = nodes._odict  # pylint: disable=protected-access
+            self.nodes.update(nodes)
+
+    def put_rdataset(self, name: dns.name.Name, rdataset: dns.rdataset.Rdataset):
+        # names are shared with other zones and records, whether they're parsed, transferred or created
+        super().put_rdataset(
+            interner.name(self._validate_name(name)), interner.rdataset(rdataset)
+        )
+
+
+class VersionedZone(dns.versioned.Zone):
+    """
+    The dns.versioned.Zone that zones are loaded as, with cheaper write transactions and interned names.
+    """
+
+    writable_version_factory = _WritableVersion
+
+
+# pylint: disable=too-many-instance-attributes
+class ZoneStore:
+    """
+    Keeps the zones of a zone file folder parsed in memory, revalidating each one against its zone file when accessed.
+
+    When more than one version is retained, a changed zone file is applied to the cached zone as a new version instead of replacing it,
+    so that earlier versions stay available (e.g. for incremental zone transfers).
+    Changes committed to a cached zone but not yet written to its file, such as dynamic updates waiting for their delayed write,
+    are kept if the file changes meanwhile: only what changed in the file since it was last read or written is applied to them.
+    Zone files are checked for changes at most once every revalidate_interval seconds; the default of 0 checks on every access.
+
+    Read-only copies of zones, such as compact ones for listing records when compact_reads is set, are kept alongside them by
+    read_copy(). Those don't need the zone to be kept parsed, which it only is once get() loads it, e.g. to change it.
+    """
+
+    def __init__(
+        self,
+        zonefile_folder: str,
+        *,
+        max_versions: int = 1,
+        revalidate_interval: float = 0,
+        compact_reads: bool = False,
+    ):
+        self.zonefile_folder = zonefile_folder
+        self.max_versions = max_versions
+        self.revalidate_interval = revalidate_interval
+        self.compact_reads = compact_reads
+        self._entries = {}
+        self._copies = {}
+        # each zone file's contents as last read or written: the cached zone's version matching it, or the zone parsed from
+        # it while the cached zone has changes that weren't written yet
+        self._file_contents = {}
+        self._zone_names = (None, [])
+        self._lock = threading.Lock()
+
+    def zone_names(self) -> list[dns.name.Name]:
+        listed_at, zone_names = self._zone_names
+        now = time.monotonic()
+        if listed_at is not None and now - listed_at < self.revalidate_interval:
+            return zone_names
+        zone_names = []
+        for filepath in glob.glob(join(self.zonefile_folder, "*zone")):
+            domain = ".".join(basename(filepath).split(".")[:-1])
+            if domain:
+                zone_names.append(dns.name.from_text(domain))
+        self._zone_names = (now, zone_names)
+        return zone_names
+
+    def find(self, name: dns.name.Name) -> dns.versioned.Zone:
+        """
+        Returns the zone that is the closest encloser of an absolute name, or None if no zone contains it.
+        """
+        zone_names = set(self.zone_names())
+        for depth in range(len(name.labels)):
+            candidate = dns.name.Name(name.labels[depth:])
+            if candidate in zone_names:
+                return self.get(candidate)
+        return None
+
+    def get(self, zone_name: dns.name.Name) -> dns.versioned.Zone:
+        """
+        Returns the cached zone for the provided origin, reloading it if its zone file changed. Returns None if there is no such zone.
+        """
+        zone_name = dns.name.from_text(str(zone_name))
+        entry = self._entries.get(zone_name)
+        now = time.monotonic()
+        if entry and now - entry[2] < self.revalidate_interval:
+            return entry[0]
+
+        zone_file_path = self._zone_file_path(zone_name)
+        if zone_file_path is None:
+            return None
+        file_key = _file_key(zone_file_path)
+        if entry and entry[1] == file_key:
+            self._entries[zone_name] = (entry[0], file_key, now)
+            return entry[0]
+        with metrics.timed_lock(self._lock, "zone_store"):
+            # the zone file may have been written while we waited for the lock
+            entry = self._entries.get(zone_name)
+            file_key = _file_key(zone_file_path)
+            if file_key is None:
+                self._entries.pop(zone_name, None)
+                self._file_contents.pop(zone_name, None)
+                return None
+            if entry and entry[1] == file_key:
+                return entry[0]
+            zone = self._load(
+                zone_name,
+                zone_file_path,
+                current_zone=entry[0] if entry else None,
+            )
+            self._entries[zone_name] = (zone, file_key, now)
+        metrics.zone_file_bytes.set(zone_name.to_text(), value=file_key[1])
+        return zone
+
+    def read_copy(self, zone_name: dns.name.Name, *, build):
+        """
+        Returns build(zone) for the zone with the provided origin, building it again if its zone file changed. Returns None if
+        there is no such zone. The zone it's built from is the cached one if it's current, and is otherwise parsed from its zone
+        file without being cached, so that only the copy is kept in memory.
+        """
+        zone_name = dns.name.from_text(str(zone_name))
+        entry = self._copies.get(zone_name)
+        now = time.monotonic()
+        if entry and now - entry[2] < self.revalidate_interval:
+            return entry[0]
+
+        zone_file_path = self._zone_file_path(zone_name)
+        file_key = _file_key(zone_file_path) if zone_file_path else None
+        if file_key is None:
+            self._copies.pop(zone_name, None)
+            return None
+        if entry and entry[1] == file_key:
+            self._copies[zone_name] = (entry[0], file_key, now)
+            return entry[0]
+        cached = self._entries.get(zone_name)
+        if cached and cached[1] == file_key:
+            zone = cached[0]
+        else:
+            logger.debug("Loading zone %s from '%s'", zone_name, zone_file_path)
+            with metrics.zone_parse_duration.time():
+                zone = dns.zone.from_file(
+                    f=zone_file_path, origin=zone_name, relativize=True
+                )
+        copy = build(zone)
+        self._copies[zone_name] = (copy, file_key, now)
+        return copy
+
+    @contextlib.contextmanager
+    def writing(self, zone: dns.zone.Zone):
+        """
+        Holds off reloading zones while a zone is written to its zone file, so a partially written file is never parsed.
+
+        Afterwards, a cached copy of the zone is kept without being parsed again, or discarded if the write failed.
+        """
+        with metrics.timed_lock(self._lock, "zone_store"):
+            entry = self._entries.get(zone.origin)
+            # plain zones, such as new ones, aren't cached until they're read
+            written_version = (
+                current_version(zone) if entry and entry[0] is zone else None
+            )
+            try:
+                yield
+            except BaseException:
+                self._entries.pop(zone.origin, None)
+                self._file_contents.pop(zone.origin, None)
+                raise
+            entry = self._entries.get(zone.origin)
+            if entry is None:
+                return
+            if entry[0] is zone:
+                zone_file_path = join(self.zonefile_folder, f"{zone.origin}zone")
+                self._entries[zone.origin] = (zone, _file_key(zone_file_path), entry[2])
+                self._file_contents[zone.origin] = written_version
+            else:
+                self._entries.pop(zone.origin, None)
+                self._file_contents.pop(zone.origin, None)
+
+    def cached(self) -> list[dns.versioned.Zone]:
+        """
+        Returns the zones currently parsed in memory.
+        """
+        return [entry[0] for entry in list(self._entries.values())]
+
+    def cached_copies(self) -> list:
+        """
+        Returns the read-only copies of zones currently kept in memory.
+        """
+        return [entry[0] for entry in list(self._copies.values())]
+
+    def discard(self, zone_name: dns.name.Name):
+        zone_name = dns.name.from_text(str(zone_name))
+        self._entries.pop(zone_name, None)
+        self._copies.pop(zone_name, None)
+        self._file_contents.pop(zone_name, None)
+
+    def _zone_file_path(self, zone_name: dns.name.Name) -> str:
+        """
+        Returns the path of the zone file for the provided origin, or None if it wouldn't be within the zone file folder.
+        Zone names may come from the network, and a label such as /etc/passwd would otherwise lead outside of it.
+        """
+        zone_file_path = join(self.zonefile_folder, f"{zone_name}zone")
+        if dirname(abspath(zone_file_path)) != abspath(self.zonefile_folder):
+            logger.info(
+                "Refused zone name %s outside of the zone file folder", zone_name
+            )
+            return None
+        return zone_file_path
+
+    def _load(
+        self, zone_name: dns.name.Name, zone_file_path: str, *, current_zone
+    ) -> dns.versioned.Zone:
+        logger.debug("Loading zone %s from '%s'", zone_name, zone_file_path)
+        file_contents = self._file_contents.get(zone_name)
+        unwritten = (
+            current_zone is not None
+            and file_contents is not None
+            and file_contents is not current_version(current_zone)
+        )
+        if current_zone is None or (self.max_versions == 1 and not unwritten):
+            with metrics.zone_parse_duration.time():
+                zone = dns.zone.from_file(
+                    f=zone_file_path,
+                    origin=zone_name,
+                    zone_factory=VersionedZone,
+                    relativize=True,
+                )
+            zone.set_max_versions(self.max_versions)
+            self._file_contents[zone_name] = current_version(zone)
+            return zone
+
+        with metrics.zone_parse_duration.time():
+            loaded_zone = dns.zone.from_file(
+                f=zone_file_path, origin=zone_name, relativize=True
+            )
+        if unwritten:
+            logger.info(
+                "Zone file of %s changed while it had unwritten changes, merging them",
+                zone_name,
+            )
+            _apply_zone_contents(current_zone, loaded_zone, base=file_contents)
+            self._file_contents[zone_name] = loaded_zone
+        else:
+            _apply_zone_contents(current_zone, loaded_zone)
+            self._file_contents[zone_name] = current_version(current_zone)
+        return current_zone
+
+
+# pylint: enable=too-many-instance-attributes
+
+
+def zone_store(
+    zonefile_folder: str,
+    *,
+    max_versions: int = None,
+    revalidate_interval: float = None,
+    compact_reads: bool = None,
+) -> ZoneStore:
+    """
+    Returns the process-wide ZoneStore for a zone file folder, applying any of the provided settings to it.
+    """
+    folder = abspath(zonefile_folder)
+    store = _stores.get(folder)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(folder, ZoneStore(zonefile_folder))
+    if max_versions is not None:
+        store.max_versions = max_versions
+    if revalidate_interval is not None:
+        store.revalidate_interval = revalidate_interval
+    if compact_reads is not None:
+        store.compact_reads = compact_reads
+    return store
+
+
+def retained_versions(zone: dns.versioned.Zone) -> list:
+    """
+    Returns the versions retained by a zone, oldest first.
+    """
+    # dnspython doesn't expose the retained versions, only readers for a specific one
+    with zone._version_lock:  # pylint: disable=protected-access
+        return list(zone._versions)  # pylint: disable=protected-access
+
+
+def current_version(zone: dns.versioned.Zone):
+    """
+    Returns the latest committed version of a zone. Committed versions are never modified, so it can be read without a transaction.
+    """
+    return zone._versions[-1]  # pylint: disable=protected-access
+
+
+def _file_key(zone_file_path: str) -> tuple:
+    try:
+        stat = os.stat(zone_file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _apply_zone_contents(
+    zone: dns.versioned.Zone, source: dns.zone.Zone, *, base=None
+) -> None:
+    """
+    Makes the contents of zone match source within a single write transaction, touching only the rdatasets that differ.
+
+    If base is provided, as the zone version or zone that source was changed from, only the rdatasets that differ between base
+    and source are applied, so that changes made to zone since base are kept. The merged contents match neither, so the serial
+    is then increased past the one they ended up with.
+    """
+    with zone.writer() as txn:
+        base_nodes = base.nodes if base is not None else None
+        names = set(source.nodes).union(
+            base_nodes if base is not None else txn.iterate_names()
+        )
+        for name in names:
+            source_node = source.nodes.get(name)
+            base_node = base_nodes.get(name) if base is not None else txn.get_node(name)
+            rdtypes = {
+                (rdataset.rdtype, rdataset.covers)
+                for node in (source_node, base_node)
+                if node is not None
+                for rdataset in node
+            }
+            for rdtype, covers in rdtypes:
+                rdataset = _get_rdataset(source_node, rdtype, covers)
+                if _same_rdataset(_get_rdataset(base_node, rdtype, covers), rdataset):
+                    continue
+                if rdataset is not None:
+                    txn.replace(name, rdataset)
+                elif txn.get(name, rdtype, covers) is not None:
+                    txn.delete(name, rdtype, covers)
+        if base is not None:
+            txn.update_serial()
+
+
+def _get_rdataset(node, rdtype, covers) -> dns.rdataset.Rdataset:
+    if node is None:
+        return None
+    return node.get_rdataset(dns.rdataclass.IN, rdtype, covers)
+
+
+def _same_rdataset(rdataset, other) -> bool:
+    if rdataset is None or other is None:
+        return rdataset is other
+    # rdatasets compare equal whatever their TTLs
+    return rdataset == other and rdataset.ttl == other.ttl
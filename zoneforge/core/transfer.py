@@ -1,10 +1,27 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 import dns.query
 import dns.zone
 import dns.resolver
 from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
-from zoneforge.core import ZFZone
+from zoneforge import metrics
+from zoneforge.core import ZFZone, delete_zone, get_zones, update_catalog
+from zoneforge.core.catalog import catalog_members, is_catalog
+from zoneforge.core.store import VersionedZone, zone_store
+from zoneforge.tracing import set_attributes, traced
 
+CATALOG_TRANSFER_WORKERS = 4
 
+logger = logging.getLogger()
+# member zone transfers run in the background, so a large catalog doesn't hold up the sync request
+catalog_executor = ThreadPoolExecutor(
+    max_workers=CATALOG_TRANSFER_WORKERS, thread_name_prefix="zf-catalog"
+)
+
+
+# pylint: disable=too-many-arguments
+@traced("transfer.zone_from_zone_transfer")
 def zone_from_zone_transfer(
     *,
     zone_name: dns.name.Name,
@@ -13,26 +30,28 @@ def zone_from_zone_transfer(
     nameserver_port: int = 53,
     use_udp: bool = False,
     transfer_timeout=60,
+    write: bool = True,
+    catalog_zone: dns.name.Name = None,
 ) -> ZFZone:
     """
     Initiate a DNS zone transfer for the specified zone from the specified nameserver. Saves the resultant zonefile to the specified zonefile folder.
     """
-    try:
-        soa_answer = dns.resolver.resolve(zone_name, "SOA")
-    except dns.resolver.NXDOMAIN as e:
-        raise BadRequest("SOA record for provided domain not resolvable") from e
-
     if not nameserver_ip:
+        try:
+            soa_answer = dns.resolver.resolve(zone_name, "SOA")
+        except dns.resolver.NXDOMAIN as e:
+            raise BadRequest("SOA record for provided domain not resolvable") from e
         master_answer = dns.resolver.resolve(soa_answer[0].mname, "A")
         nameserver_ip = master_answer[0].address
 
-    new_zone = dns.versioned.Zone(
+    new_zone = VersionedZone(
         origin=zone_name,
     )
     new_zfzone = ZFZone(zone=new_zone, zonefile_folder=zonefile_folder)
     udp_mode = dns.query.UDPMode.NEVER
     if use_udp:
         udp_mode = dns.query.UDPMode.TRY_FIRST
+    start = time.perf_counter()
     try:
         dns.query.inbound_xfr(
             where=nameserver_ip,
@@ -49,6 +68,117 @@ def zone_from_zone_transfer(
         raise BadGateway(
             "Zone transfer attempt timed out. Ensure the nameserver is available and consider increasing the transfer timeout."
         ) from e
+    metrics.transfer_duration.observe(time.perf_counter() - start, "in")
+    # dnspython doesn't report the size of the messages it received, only the records they held
+    rdatasets = sum(len(node) for node in new_zone.nodes.values())
+    metrics.transfer_records.inc("in", amount=rdatasets)
+    set_attributes(zone=str(zone_name), nameserver=nameserver_ip, rdatasets=rdatasets)
+    if not write:
+        return new_zfzone
     new_zfzone.write_to_file()
+    if catalog_zone:
+        update_catalog(
+            added=[new_zfzone.origin],
+            catalog_zone=catalog_zone,
+            zonefile_folder=zonefile_folder,
+        )
 
     return new_zfzone
+
+
+def sync_catalog(
+    *,
+    catalog_name: dns.name.Name,
+    zonefile_folder: str,
+    nameserver_ip: str,
+    nameserver_port: int = 53,
+    transfer_timeout=60,
+    catalog_zone: dns.name.Name = None,
+    authorize=None,
+) -> dict:
+    """
+    Transfers a catalog zone from the specified nameserver, and compares its members with the local zones.
+    Members new to the catalog are transferred from the same nameserver in the background, and members removed since the
+    catalog was last synced are deleted. Returns the names of the added and removed zones.
+    If provided, authorize(zone_name, permission) must allow writing each added zone and deleting each removed one,
+    otherwise the sync is refused with Forbidden before any zone is changed.
+    """
+    catalog_name = dns.name.from_text(str(catalog_name))
+    previous = get_zones(zonefile_folder, catalog_name)
+    previous_members = catalog_members(previous[0]) if previous else set()
+
+    catalog = zone_from_zone_transfer(
+        zone_name=catalog_name,
+        zonefile_folder=zonefile_folder,
+        nameserver_ip=nameserver_ip,
+        nameserver_port=nameserver_port,
+        transfer_timeout=transfer_timeout,
+        write=False,
+    )
+    if not is_catalog(catalog):
+        raise BadRequest(f"Zone {catalog_name} is not a version 2 catalog zone.")
+    members = catalog_members(catalog)
+    local = set(zone_store(zonefile_folder).zone_names())
+
+    added = sorted(members - local)
+    removed = sorted((previous_members - members) & local)
+    if authorize:
+        refused = [
+            zone_name for zone_name in added if not authorize(zone_name, "write")
+        ] + [zone_name for zone_name in removed if not authorize(zone_name, "delete")]
+        if refused:
+            raise Forbidden(
+                "User do not have the permissions to add or remove these catalog members: "
+                + ", ".join(zone_name.to_text() for zone_name in refused)
+            )
+    logger.info(
+        "Synced catalog zone %s, %d members to add and %d to remove",
+        catalog_name,
+        len(added),
+        len(removed),
+    )
+    for zone_name in removed:
+        delete_zone(zone_name, zonefile_folder, catalog_zone=catalog_zone)
+    for zone_name in added:
+        catalog_executor.submit(
+            _transfer_member,
+            zone_name=zone_name,
+            zonefile_folder=zonefile_folder,
+            nameserver_ip=nameserver_ip,
+            nameserver_port=nameserver_port,
+            transfer_timeout=transfer_timeout,
+            catalog_zone=catalog_zone,
+        )
+    # keep the primary's serial, so the next sync can tell whether the catalog changed
+    catalog.write_to_file(serial=catalog.get_soa().serial)
+
+    return {
+        "name": catalog_name.to_text(),
+        "added": [zone_name.to_text() for zone_name in added],
+        "removed": [zone_name.to_text() for zone_name in removed],
+    }
+
+
+def _transfer_member(
+    *,
+    zone_name: dns.name.Name,
+    zonefile_folder: str,
+    nameserver_ip: str,
+    nameserver_port: int,
+    transfer_timeout,
+    catalog_zone: dns.name.Name,
+):
+    try:
+        zone_from_zone_transfer(
+            zone_name=zone_name,
+            zonefile_folder=zonefile_folder,
+            nameserver_ip=nameserver_ip,
+            nameserver_port=nameserver_port,
+            transfer_timeout=transfer_timeout,
+            catalog_zone=catalog_zone,
+        )
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception("Transfer of catalog member zone %s failed", zone_name)
+
+
+# pylint: enable=too-many-arguments
@@ -1,3 +1,61 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 
 db = SQLAlchemy()
+
+
+def engine_options(
+    database_uri: str,
+    *,
+    busy_timeout: float = 5,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_recycle: int = 1800,
+) -> dict:
+    """
+    Returns the SQLAlchemy engine options for a database URI.
+    SQLite waits up to busy_timeout seconds for another worker's write lock, while other databases get a pool of checked connections.
+    """
+    if make_url(database_uri).get_backend_name() == "sqlite":
+        return {"connect_args": {"timeout": busy_timeout}}
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": True,
+    }
+
+
+def init_db(app, *, journal_mode: str = "WAL"):
+    """
+    Sets up the database for the app, creating its tables if needed.
+
+    SQLite connections use the provided journal mode. WAL lets readers in every worker proceed while another one writes,
+    and makes synchronous=NORMAL safe against corruption.
+    """
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            pragmas = {
+                "journal_mode": journal_mode,
+                "synchronous": "NORMAL" if journal_mode.upper() == "WAL" else "FULL",
+                "foreign_keys": "ON",
+            }
+            event.listen(
+                db.engine,
+                "connect",
+                lambda dbapi_connection, _: _set_pragmas(dbapi_connection, pragmas),
+            )
+        db.create_all()
+        # create_all only creates missing tables, so indexes added since are created separately
+        for table in db.metadata.tables.values():
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+
+
+def _set_pragmas(dbapi_connection, pragmas: dict):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in pragmas.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
@@ -24,7 +24,9 @@ class User(db.Model):
     username = db.Column(db.String(50), nullable=False, unique=True)
     password = db.Column(db.String(72), nullable=False)
 
-    group_id = db.Column(db.Integer, db.ForeignKey("group.id", ondelete="SET NULL"))
+    group_id = db.Column(
+        db.Integer, db.ForeignKey("group.id", ondelete="SET NULL"), index=True
+    )
 
 
 # pylint: disable=too-few-public-methods
@@ -32,7 +34,8 @@ class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
 
-    users = db.relationship("User", backref="group")
+    # the database clears group_id of a deleted group's users, without loading them
+    users = db.relationship("User", backref="group", passive_deletes=True)
     roles = db.relationship("Role", secondary=group_assign_roles, backref="groups")
 
 
@@ -42,4 +45,34 @@ class Role(db.Model):
     name = db.Column(db.String, nullable=False, unique=True)
 
 
+# pylint: disable=too-few-public-methods
+class ZoneGrant(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(
+        db.Integer,
+        db.ForeignKey("group.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    # a zone name, '*.' followed by a zone name for every zone below it, or '*' for every zone
+    zone_pattern = db.Column(db.String, nullable=False)
+    # bitset of zoneforge.acl.ZONE_PERMISSIONS
+    permissions = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint("group_id", "zone_pattern", name="unique_group_zone"),
+    )
+
+
+# pylint: disable=too-few-public-methods
+class RevokedToken(db.Model):
+    # ids only ever increase, even after the latest rows are purged, so workers can load the revocations newer than the ones they hold
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32), nullable=False, unique=True)
+    # the revocation can be purged once the token has expired
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = ({"sqlite_autoincrement": True},)
+
+
 # pylint: enable=too-few-public-methods
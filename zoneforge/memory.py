@@ -0,0 +1,183 @@
+import fnmatch
+import itertools
+import resource
+import sys
+import threading
+import tracemalloc
+from os.path import dirname, relpath
+import dns.name
+import dns.node
+import dns.rdata
+import dns.rdataset
+from zoneforge.core.store import current_version, retained_versions
+
+# zones with more names than this have their footprint estimated from an evenly spread sample of them
+SAMPLE_SIZE = 2000
+
+_PACKAGE_DIR = dirname(__file__)
+_trace_lock = threading.Lock()
+_trace_baseline = None  # pylint: disable=invalid-name
+
+
+def process_memory() -> dict:
+    """
+    Returns the resident set size of this process, and its peak, in bytes. The current size is None where it isn't known.
+    """
+    rss = None
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in KiB on Linux, but bytes on macOS
+    if sys.platform != "darwin":
+        peak *= 1024
+    return {"rss_bytes": rss, "peak_rss_bytes": peak}
+
+
+def zone_footprint(zone: dns.versioned.Zone, *, sample_size: int = SAMPLE_SIZE) -> dict:
+    """
+    Estimates the memory held by the current version of a zone, split into its names, its nodes and rdatasets, and the rdata
+    within them. Objects shared between versions, or with other zones, are counted once per zone.
+    """
+    nodes = current_version(zone).nodes
+    names = len(nodes)
+    step = max(names // sample_size, 1)
+    sizes = {"names": 0, "rdatasets": 0, "rdata": 0}
+    counts = {"rdatasets": 0, "rdata": 0}
+    seen = set()
+    sampled = 0
+    for name, node in itertools.islice(nodes.items(), 0, None, step):
+        sampled += 1
+        sizes["names"] += _deep_size(name, seen)
+        sizes["rdatasets"] += _shallow_size(node, seen)
+        for rdataset in node:
+            counts["rdatasets"] += 1
+            sizes["rdatasets"] += _shallow_size(rdataset, seen)
+            for rdata in rdataset:
+                counts["rdata"] += 1
+                sizes["rdata"] += _deep_size(rdata, seen)
+    scale = names / sampled if sampled else 0
+    estimate = {f"{key}_bytes": round(size * scale) for key, size in sizes.items()}
+    # the mapping of names to nodes is measured in full
+    estimate["names_bytes"] += sys.getsizeof(
+        getattr(nodes, "_odict", nodes)  # the dict within an immutable dict
+    )
+    return {
+        "zone": zone.origin.to_text(),
+        "versions": len(retained_versions(zone)),
+        "names": names,
+        "rdatasets": round(counts["rdatasets"] * scale),
+        "rdata": round(counts["rdata"] * scale),
+        **estimate,
+        "total_bytes": sum(estimate.values()),
+        "sampled": step > 1,
+    }
+
+
+def _shallow_size(obj, seen: set) -> int:
+    # an rdataset's rdata are kept in a list it holds, and a node's rdatasets in a list of its own
+    size = 0
+    for item in (obj, getattr(obj, "rdatasets", None), getattr(obj, "items", None)):
+        if item is None or callable(item) or id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+    return size
+
+
+def _deep_size(obj, seen: set) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (dns.name.Name, dns.rdata.Rdata)):
+        for slot in _slots(type(obj)):
+            value = getattr(obj, slot, None)
+            if value is not None:
+                size += _deep_size(value, seen)
+    elif isinstance(obj, (tuple, list, frozenset, set)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(
+            _deep_size(key, seen) + _deep_size(value, seen)
+            for key, value in obj.items()
+        )
+    return size
+
+
+def _slots(cls) -> list[str]:
+    return [
+        slot
+        for klass in cls.__mro__
+        for slot in getattr(klass, "__slots__", ())
+        # the rdata's class and type are shared enums
+        if slot not in ("rdclass", "rdtype", "__weakref__", "_abstract")
+    ]
+
+
+def start_tracing(*, frames: int = 16):
+    """
+    Starts tracing allocations, if they aren't traced already. Allocations made by libraries are only attributed to the
+    zoneforge code that led to them if it's within the provided number of frames, but each frame slows tracing down further.
+    """
+    global _trace_baseline  # pylint: disable=global-statement
+    with _trace_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _trace_baseline = None
+
+
+def stop_tracing():
+    global _trace_baseline  # pylint: disable=global-statement
+    with _trace_lock:
+        tracemalloc.stop()
+        _trace_baseline = None
+
+
+def allocation_diff(*, top: int = 10) -> list[dict]:
+    """
+    Returns the top allocation sites in zoneforge code by growth since the previous call, or since tracing started on the
+    first call. Each site is the zoneforge line that most recently led to allocations, even if they were made in a library.
+    """
+    global _trace_baseline  # pylint: disable=global-statement
+    with _trace_lock:
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, f"{_PACKAGE_DIR}/*", all_frames=True)]
+        )
+        # compared with an empty snapshot the first time, so that every allocation since tracing started is counted
+        baseline = _trace_baseline or tracemalloc.Snapshot(
+            (), tracemalloc.get_traceback_limit()
+        )
+        _trace_baseline = snapshot
+    sites = {}
+    for stat in snapshot.compare_to(baseline, "traceback"):
+        site = _zoneforge_frame(stat.traceback)
+        if site is None:
+            continue
+        totals = sites.setdefault(
+            site, {"size_bytes": 0, "size_diff_bytes": 0, "count": 0, "count_diff": 0}
+        )
+        totals["size_bytes"] += stat.size
+        totals["size_diff_bytes"] += stat.size_diff
+        totals["count"] += stat.count
+        totals["count_diff"] += stat.count_diff
+    ranked = sorted(
+        sites.items(), key=lambda site: abs(site[1]["size_diff_bytes"]), reverse=True
+    )
+    return [
+        {"module": module, "line": line} | totals
+        for (module, line), totals in ranked[:top]
+    ]
+
+
+def _zoneforge_frame(traceback: tracemalloc.Traceback) -> tuple:
+    # frames are ordered from the oldest to the most recent call
+    for frame in reversed(traceback):
+        if fnmatch.fnmatch(frame.filename, f"{_PACKAGE_DIR}/*"):
+            module = relpath(frame.filename, dirname(_PACKAGE_DIR))
+            return module.removesuffix(".py").replace("/", "."), frame.lineno
+    return None
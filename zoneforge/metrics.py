@@ -0,0 +1,454 @@
+import atexit
+import bisect
+import contextlib
+import fcntl
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from os.path import basename, join
+from flask import g, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOCK_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+# the counters and histograms of processes that have exited, added up
+EXITED_FILE = "exited.json"
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+_registry = {}
+# functions updating metrics kept elsewhere, before a snapshot is taken
+_collectors = {}
+
+
+# pylint: disable=too-few-public-methods
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, *, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+# pylint: enable=too-few-public-methods
+
+
+class Counter(_Metric):
+    """
+    A value that only ever increases, such as a number of requests. Workers' values are added up.
+    """
+
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, *labels, value: float):
+        """
+        Sets the value from a count kept elsewhere, such as by a cache.
+        """
+        with self._lock:
+            self._values[labels] = value
+
+
+class Gauge(_Metric):
+    """
+    A value that may go up and down, such as the size of a zone file. The value set most recently by any worker is reported.
+    """
+
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = (value, time.time())
+
+    def remove(self, *labels):
+        # kept as a removal, so values set by other workers before it aren't reported either
+        with self._lock:
+            self._values[labels] = (None, time.time())
+
+
+class Histogram(_Metric):
+    """
+    Counts observed values, such as durations, in buckets. Workers' counts are added up.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        *,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames=labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        # each value holds the count of every bucket, followed by the sum and count of all observations
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [
+                [list(labels), list(counts)] for labels, counts in self._values.items()
+            ]
+
+
+http_requests = Counter(
+    "zoneforge_http_requests_total",
+    "HTTP requests handled",
+    labelnames=("method", "endpoint", "status"),
+)
+http_request_duration = Histogram(
+    "zoneforge_http_request_duration_seconds",
+    "Time spent handling HTTP requests",
+    labelnames=("method", "endpoint"),
+)
+zone_parse_duration = Histogram(
+    "zoneforge_zone_parse_seconds", "Time spent parsing zone files"
+)
+zone_serialize_duration = Histogram(
+    "zoneforge_zone_serialize_seconds", "Time spent writing zones to zone files"
+)
+zone_file_bytes = Gauge(
+    "zoneforge_zone_file_bytes",
+    "Size of zone files when last read or written",
+    labelnames=("zone",),
+)
+zone_records = Gauge(
+    "zoneforge_zone_records", "Records in each zone", labelnames=("zone",)
+)
+cache_hits = Counter(
+    "zoneforge_cache_hits_total", "Cache lookups that hit", labelnames=("cache",)
+)
+cache_misses = Counter(
+    "zoneforge_cache_misses_total", "Cache lookups that missed", labelnames=("cache",)
+)
+lock_wait = Histogram(
+    "zoneforge_lock_wait_seconds",
+    "Time spent waiting to acquire locks",
+    labelnames=("lock",),
+    buckets=LOCK_BUCKETS,
+)
+transfer_bytes = Counter(
+    "zoneforge_transfer_bytes_total",
+    "Bytes of zone transfer messages",
+    labelnames=("direction",),
+)
+transfer_records = Counter(
+    "zoneforge_transfer_records_total",
+    "Records in zone transfers",
+    labelnames=("direction",),
+)
+transfer_duration = Histogram(
+    "zoneforge_transfer_duration_seconds",
+    "Time spent receiving zone transfers, or preparing the messages of those served",
+    labelnames=("direction",),
+)
+
+
+def init_app(app):
+    """
+    Counts and times the requests handled by a Flask app, by method and route.
+    """
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            # the route's rule rather than the path, so zone and record names don't each get their own series
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            http_request_duration.observe(
+                time.perf_counter() - start, request.method, endpoint
+            )
+            http_requests.inc(request.method, endpoint, str(response.status_code))
+        return response
+
+
+@contextlib.contextmanager
+def timed_lock(lock, name: str):
+    """
+    Acquires a lock like a with statement, observing how long it took to acquire.
+    """
+    start = time.perf_counter()
+    with lock:
+        lock_wait.observe(time.perf_counter() - start, name)
+        yield
+
+
+def watch_cache(name: str, cache):
+    """
+    Reports the hits and misses of an LRUCache under the provided name, replacing any cache previously watched under it.
+    """
+
+    def collect_cache():
+        cache_hits.set_total(name, value=cache.hits)
+        cache_misses.set_total(name, value=cache.misses)
+
+    _collectors[f"cache:{name}"] = collect_cache
+
+
+def snapshot() -> dict:
+    for collector in list(_collectors.values()):
+        collector()
+    return {
+        name: {
+            "kind": metric.kind,
+            "documentation": metric.documentation,
+            "labelnames": metric.labelnames,
+            "buckets": getattr(metric, "buckets", None),
+            "values": metric.snapshot(),
+        }
+        for name, metric in _registry.items()
+    }
+
+
+class MetricsWriter:
+    """
+    Writes this process's metrics to a file in a directory shared by every worker, every interval seconds, so that any worker
+    can report the metrics of all of them. Counters are only ever increased in memory, so requests don't wait on any file.
+    """
+
+    def __init__(self, directory: str, *, interval: float = 5):
+        self.directory = directory
+        self.interval = interval
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="zf-metrics", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._try_write()
+
+    def write(self):
+        path = join(self.directory, f"{os.getpid()}.json")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot(), f)
+        os.replace(temp_path, path)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._try_write()
+
+    def _try_write(self):
+        try:
+            self.write()
+        except OSError:
+            logger.warning(
+                "Failed to write metrics to '%s'", self.directory, exc_info=True
+            )
+
+
+writer = None  # pylint: disable=invalid-name
+
+
+def default_directory() -> str:
+    # gunicorn workers share their parent's pid, and a restarted server gets a new one, so counters start over with it
+    return join(tempfile.gettempdir(), f"zoneforge-metrics-{os.getppid()}")
+
+
+def configure(*, directory: str = "", interval: float = 5) -> MetricsWriter:
+    """
+    Starts writing this process's metrics to a directory shared with other processes, replacing any previous writer.
+    """
+    global writer  # pylint: disable=global-statement
+    if writer is not None:
+        writer.stop()
+    writer = MetricsWriter(directory or default_directory(), interval=interval)
+    writer.start()
+    return writer
+
+
+def _restart_after_fork():
+    # the writer's thread doesn't survive a fork, e.g. of gunicorn workers from a preloaded app
+    if writer is not None:
+        writer.start()
+
+
+def _write_at_exit():
+    if writer is not None:
+        writer.stop()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(_write_at_exit)
+
+
+def aggregate(directory: str) -> dict:
+    """
+    Returns the metrics of every process that wrote to the directory, added up.
+    The counters and histograms of processes that have exited are folded into a single file and kept, so totals never go
+    down when a worker is replaced, while their gauges are dropped.
+    """
+    for path in glob.glob(join(directory, "*.json")):
+        if basename(path) != EXITED_FILE and not _process_exists(path):
+            _fold_exited(directory, path)
+    metrics = {}
+    for path in glob.glob(join(directory, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                process_metrics = json.load(f)
+        except (OSError, ValueError):
+            # the process may have been writing it for the first time, or have exited since
+            continue
+        _merge_metrics(metrics, process_metrics)
+    return metrics
+
+
+def _fold_exited(directory: str, path: str):
+    exited_path = join(directory, EXITED_FILE)
+    # workers aggregating at once must not both fold the same file
+    with open(join(directory, "exited.lock"), "a", encoding="ascii") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path, encoding="utf-8") as f:
+                process_metrics = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            process_metrics = {}
+        exited = {}
+        with contextlib.suppress(FileNotFoundError):
+            with open(exited_path, encoding="utf-8") as f:
+                _merge_metrics(exited, json.load(f))
+        _merge_metrics(
+            exited,
+            {
+                name: metric
+                for name, metric in process_metrics.items()
+                if metric["kind"] != "gauge"
+            },
+        )
+        temp_path = f"{exited_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    name: metric
+                    | {"values": [[list(k), v] for k, v in metric["values"].items()]}
+                    for name, metric in exited.items()
+                },
+                f,
+            )
+        os.replace(temp_path, exited_path)
+        os.remove(path)
+
+
+def _merge_metrics(metrics: dict, process_metrics: dict):
+    for name, metric in process_metrics.items():
+        merged = metrics.setdefault(name, metric | {"values": {}})
+        for labels, value in metric["values"]:
+            _merge(merged, tuple(labels), value)
+
+
+def _process_exists(path: str) -> bool:
+    try:
+        os.kill(int(os.path.basename(path).removesuffix(".json")), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        # running as another user
+        return True
+    return True
+
+
+def _merge(metric: dict, labels: tuple, value):
+    values = metric["values"]
+    current = values.get(labels)
+    if metric["kind"] == "gauge":
+        if current is None or value[1] > current[1]:
+            values[labels] = value
+    elif metric["kind"] == "histogram":
+        values[labels] = (
+            value if current is None else [a + b for a, b in zip(current, value)]
+        )
+    else:
+        values[labels] = value + (current or 0)
+
+
+def render(metrics: dict) -> str:
+    """
+    Renders metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labelnames = metric["labelnames"]
+        for labels, value in sorted(metric["values"].items()):
+            if metric["kind"] == "gauge":
+                if value[0] is not None:
+                    lines.append(f"{name}{_labels(labelnames, labels)} {value[0]}")
+                continue
+            if metric["kind"] == "counter":
+                lines.append(f"{name}{_labels(labelnames, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_labels(labelnames + ['le'], labels + (str(bound),))} {cumulative}"
+                )
+            lines.append(
+                f"{name}_bucket{_labels(labelnames + ['le'], labels + ('+Inf',))} {value[-1]}"
+            )
+            lines.append(f"{name}_sum{_labels(labelnames, labels)} {value[-2]}")
+            lines.append(f"{name}_count{_labels(labelnames, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labelnames: list, labels: tuple) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{labelname}="{_escape(str(label))}"'
+        for labelname, label in zip(labelnames, labels)
+    )
+    return f"{{{pairs}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,122 @@
+import contextlib
+import fcntl
+import os
+import tempfile
+from os.path import join
+import bcrypt
+from werkzeug.exceptions import *  # pylint: disable=wildcard-import,unused-wildcard-import,redefined-builtin
+
+DEFAULT_ROUNDS = 12
+
+
+# pylint: disable=too-few-public-methods
+class ProcessSlots:
+    """
+    Limits how many callers run at once across every process sharing a directory, such as the workers of a gunicorn server,
+    with a lock on one of count files within it. A lock is released by the OS when its process exits, so a killed worker never
+    keeps its slot. Callers that find every slot taken are refused rather than made to wait.
+    """
+
+    def __init__(self, directory: str, count: int):
+        self.directory = directory
+        self.count = count
+
+    @contextlib.contextmanager
+    def hold(self):
+        """
+        Holds a slot while the code within it runs, raising ServiceUnavailable if none is free.
+        """
+        slot = self._acquire()
+        if slot is None:
+            raise ServiceUnavailable(
+                "Too many logins in progress, please try again shortly."
+            )
+        try:
+            yield
+        finally:
+            fcntl.flock(slot, fcntl.LOCK_UN)
+            slot.close()
+
+    def _acquire(self):
+        if self.count <= 0:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        # each process starts looking from a different slot, so they don't all contend for the first
+        first = os.getpid() % self.count
+        for i in range(self.count):
+            path = join(self.directory, f"slot-{(first + i) % self.count}")
+            slot = open(  # pylint: disable=consider-using-with
+                path, "a", encoding="ascii"
+            )
+            try:
+                fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot
+            except BlockingIOError:
+                slot.close()
+        return None
+
+
+# pylint: enable=too-few-public-methods
+
+
+def default_slots_directory() -> str:
+    # gunicorn workers share their parent's pid, so they share their slots
+    return join(tempfile.gettempdir(), f"zoneforge-bcrypt-slots-{os.getppid()}")
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords with bcrypt, limiting how many hashes run at once across every process sharing slots_directory
+    to max_concurrent. Further ones are refused with a 503 straight away rather than queued.
+
+    Hashing runs on the calling thread, so a sync gunicorn worker is blocked while it hashes: the limit bounds how many workers
+    password hashing can tie up at once, leaving the rest free for other requests. bcrypt releases the GIL while it works, so a
+    threaded worker's other requests carry on meanwhile.
+    """
+
+    def __init__(
+        self,
+        *,
+        rounds: int = DEFAULT_ROUNDS,
+        max_concurrent: int = 2,
+        slots_directory: str = "",
+    ):
+        self.rounds = rounds
+        self.max_concurrent = max_concurrent
+        self.slots = ProcessSlots(
+            slots_directory or default_slots_directory(), max_concurrent
+        )
+
+    def hash(self, password: str) -> str:
+        hashed = self._limited(
+            bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds)
+        )
+        return hashed.decode("utf-8")
+
+    def check(self, password: str, hashed: str) -> bool:
+        return self._limited(
+            bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8")
+        )
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """
+        Returns whether a hash was made with a cost other than the current one.
+        """
+        # bcrypt hashes are formatted as $<version>$<cost>$<salt and hash>
+        return int(hashed.split("$")[2]) != self.rounds
+
+    def _limited(self, func, *args):
+        with self.slots.hold():
+            return func(*args)
+
+
+hasher = PasswordHasher()  # pylint: disable=invalid-name
+
+
+def configure(**kwargs) -> PasswordHasher:
+    """
+    Replaces the password hasher for this process with one created with the provided arguments.
+    """
+    global hasher  # pylint: disable=global-statement
+    hasher = PasswordHasher(**kwargs)
+    return hasher
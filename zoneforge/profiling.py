@@ -0,0 +1,208 @@
+import contextlib
+import cProfile
+import glob
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from os.path import basename, join
+from flask import g, request
+
+MODES = ("cprofile", "sampler")
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+
+class StackSampler:
+    """
+    Samples the call stack of a thread at an interval, counting how often each stack was seen.
+    Unlike cProfile, the sampled thread isn't slowed down by tracing its calls.
+    """
+
+    def __init__(self, thread_id: int, *, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="zf-profile-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """
+        Returns the samples in the collapsed stack format read by flamegraph.pl, speedscope and similar tools.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(  # pylint: disable=protected-access
+                self.thread_id
+            )
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    """
+    Profiles a single request with cProfile or a StackSampler, then writes the profile to a directory along with the request's details.
+    """
+
+    _sequence = itertools.count()
+
+    def __init__(self, *, mode: str, interval: float = 0.005):
+        self.mode = mode
+        if mode == "cprofile":
+            self._profiler = cProfile.Profile()
+        else:
+            self._profiler = StackSampler(threading.get_ident(), interval=interval)
+        self._started = None
+
+    def start(self) -> bool:
+        """
+        Starts profiling the current thread. Returns False if another profiler is already running, which cProfile doesn't allow
+        on every Python version.
+        """
+        try:
+            if self.mode == "cprofile":
+                self._profiler.enable()
+            else:
+                self._profiler.start()
+        except ValueError:
+            return False
+        self._started = time.perf_counter()
+        return True
+
+    def stop(self, directory: str, *, metadata: dict) -> str:
+        """
+        Stops profiling and writes the profile and metadata files. Returns their path, without the extension.
+        """
+        duration = time.perf_counter() - self._started
+        if self.mode == "cprofile":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now(tz=timezone.utc)
+        path = join(
+            directory,
+            f"{timestamp:%Y%m%dT%H%M%S}-{os.getpid()}-{next(self._sequence)}",
+        )
+        if self.mode == "cprofile":
+            # read with pstats, or converted for flame graphs by tools such as flameprof
+            self._profiler.dump_stats(f"{path}.prof")
+        else:
+            with open(f"{path}.collapsed", "w", encoding="utf-8") as f:
+                f.write(self._profiler.collapsed())
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump(
+                metadata
+                | {
+                    "mode": self.mode,
+                    "started_at": timestamp.isoformat(),
+                    "duration_ms": round(duration * 1000, 3),
+                    "pid": os.getpid(),
+                },
+                f,
+            )
+        return path
+
+
+def prune_profiles(directory: str, *, keep: int):
+    """
+    Removes the oldest profiles in a directory, along with their metadata, so that at most keep remain.
+    """
+    metadata_paths = sorted(
+        glob.glob(join(directory, "*.json")), key=os.path.getmtime, reverse=True
+    )
+    for metadata_path in metadata_paths[keep:]:
+        path = metadata_path.removesuffix(".json")
+        for extension in (".json", ".prof", ".collapsed"):
+            # another worker may be pruning them too
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(f"{path}{extension}")
+
+
+# pylint: disable=too-many-arguments
+def init_app(
+    app,
+    *,
+    directory: str,
+    authorize,
+    mode: str = "cprofile",
+    header: str = "X-ZoneForge-Profile",
+    sample_rate: int = 0,
+    interval: float = 0.005,
+    max_profiles: int = 100,
+):
+    """
+    Profiles requests to a Flask app that carry the header, if authorize() returns True for them, and one in every sample_rate
+    other requests, if sample_rate isn't 0. Only the latest max_profiles profiles are kept in the directory.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode '{mode}', expected one of {MODES}")
+    requests_seen = itertools.count(1)
+
+    @app.before_request
+    def start_profiler():
+        if request.headers.get(header) and authorize():
+            trigger = "header"
+        elif sample_rate and next(requests_seen) % sample_rate == 0:
+            trigger = "sample"
+        else:
+            return
+        profiler = RequestProfiler(mode=mode, interval=interval)
+        if profiler.start():
+            g.profiler = profiler
+            g.profile_trigger = trigger
+
+    @app.after_request
+    def note_status(response):
+        if "profiler" in g:
+            g.profile_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def write_profile(_):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return
+        try:
+            path = profiler.stop(
+                directory,
+                metadata={
+                    "method": request.method,
+                    "path": request.full_path.rstrip("?"),
+                    "endpoint": request.url_rule.rule if request.url_rule else None,
+                    "status": g.get("profile_status"),
+                    "trigger": g.get("profile_trigger"),
+                },
+            )
+            logger.info("Profiled %s %s to '%s'", request.method, request.path, path)
+            prune_profiles(directory, keep=max_profiles)
+        except OSError:
+            logger.warning("Failed to write profile to '%s'", directory, exc_info=True)
+
+
+# pylint: enable=too-many-arguments
@@ -0,0 +1,132 @@
+import hashlib
+import math
+import threading
+import time
+
+
+class BloomFilter:
+    """
+    A fixed-size set of strings that may report false positives, but never false negatives.
+    """
+
+    def __init__(self, capacity: int, *, error_rate: float = 0.001):
+        self.capacity = max(capacity, 1)
+        # the optimal number of bits and hashes for the capacity and error rate
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray(math.ceil(self.size / 8))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def _positions(self, item: str):
+        # double hashing derives every position from the two halves of a single digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+
+# pylint: disable=too-many-instance-attributes
+class RevocationList:
+    """
+    The ids of revoked tokens, mirrored from the database into a Bloom filter.
+
+    Each revocation has a version, increasing in the order they were made. The list remembers the latest version it holds,
+    so refreshing it only loads newer revocations, along with the last lookback versions before it: versions are assigned
+    when a revocation is made, but a database may commit them out of order, so one below the latest can appear later.
+    The filter never reports a revoked id as valid, so only ids it matches need an exact check.
+    """
+
+    def __init__(
+        self,
+        *,
+        capacity: int = 10000,
+        refresh_interval: float = 5,
+        lookback: int = 1000
+    ):
+        self.version = 0
+        self.refresh_interval = refresh_interval
+        self.lookback = lookback
+        # the versions held since the lookback window, so those loaded again aren't added twice
+        self._recent = set()
+        self._capacity = capacity
+        self._filter = BloomFilter(capacity)
+        self._next_refresh = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._filter)
+
+    def might_be_revoked(self, token_id: str) -> bool:
+        return token_id in self._filter
+
+    @property
+    def since(self) -> int:
+        """
+        The version after which revocations are loaded when refreshing the list.
+        """
+        return max(self.version - self.lookback, 0)
+
+    def add(self, revocations: list[tuple[int, str]]) -> list[str]:
+        """
+        Adds (version, token id) pairs to the list, returning the ids of those it didn't hold already.
+        """
+        added = []
+        with self._lock:
+            for version, token_id in revocations:
+                if version in self._recent:
+                    continue
+                self._filter.add(token_id)
+                self._recent.add(version)
+                self.version = max(self.version, version)
+                added.append(token_id)
+            self._recent = {version for version in self._recent if version > self.since}
+        return added
+
+    def reset(self, revocations: list[tuple[int, str]]):
+        """
+        Replaces the contents of the list, sizing the filter for at least twice as many ids so it stays accurate as more are added.
+        """
+        revocations = list(revocations)
+        bloom_filter = BloomFilter(max(self._capacity, 2 * len(revocations)))
+        for _, token_id in revocations:
+            bloom_filter.add(token_id)
+        with self._lock:
+            self._filter = bloom_filter
+            self.version = max((version for version, _ in revocations), default=0)
+            self._recent = {
+                version for version, _ in revocations if version > self.since
+            }
+
+    def full(self) -> bool:
+        """
+        Returns whether the filter holds more ids than it was sized for, and should be rebuilt.
+        """
+        return len(self._filter) > self._filter.capacity
+
+    def refresh_due(self) -> bool:
+        """
+        Returns True once per refresh interval, to the one caller that should load newer revocations.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_refresh:
+                return False
+            self._next_refresh = now + self.refresh_interval
+            return True
+
+
+# pylint: enable=too-many-instance-attributes
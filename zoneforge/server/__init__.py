@@ -0,0 +1,328 @@
+import enum
+import ipaddress
+import logging
+import socket
+import socketserver
+import struct
+import threading
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.tsig
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+
+class ConnectionType(enum.IntEnum):
+    UDP = 1
+    TCP = 2
+
+
+class Request:
+    """
+    A parsed DNS message received by the server, along with where it came from.
+    """
+
+    def __init__(
+        self,
+        message: dns.message.Message,
+        *,
+        wire: bytes,
+        peer: tuple,
+        connection_type: ConnectionType,
+    ):
+        self.message = message
+        self.wire = wire
+        self.peer = peer
+        self.connection_type = connection_type
+
+    @property
+    def opcode(self):
+        return self.message.opcode()
+
+    @property
+    def question(self):
+        return self.message.question[0] if self.message.question else None
+
+    @property
+    def qname(self):
+        return self.question.name
+
+    @property
+    def qtype(self):
+        return self.question.rdtype
+
+    @property
+    def max_size(self) -> int:
+        """
+        The largest response the client can accept for this request.
+        """
+        if self.connection_type == ConnectionType.UDP:
+            return max(self.message.payload, 512) if self.message.edns >= 0 else 512
+        return 65535
+
+
+def peer_allowed(peer: tuple, networks: list) -> bool:
+    """
+    Checks a peer address against a list of ipaddress networks. An empty list allows every peer.
+    """
+    if not networks:
+        return True
+    address = ipaddress.ip_address(peer[0])
+    return any(address in network for network in networks)
+
+
+def parse_networks(networks_text: str) -> list:
+    """
+    Parses a comma separated list of addresses/CIDRs, such as from an environment variable.
+    """
+    return [
+        ipaddress.ip_network(network.strip(), strict=False)
+        for network in (networks_text or "").split(",")
+        if network.strip()
+    ]
+
+
+def parse_tsig_keys(keys_text: str) -> dict:
+    """
+    Parses a comma separated list of TSIG keys, each name:secret or name:algorithm:secret with a base64 secret, into a keyring.
+    Keys without an algorithm use hmac-sha256.
+    """
+    keyring = {}
+    for key_text in (keys_text or "").split(","):
+        if not key_text.strip():
+            continue
+        name, *algorithm, secret = key_text.strip().split(":")
+        key = dns.tsig.Key(
+            name, secret, algorithm[0] if algorithm else dns.tsig.HMAC_SHA256
+        )
+        keyring[key.name] = key
+    return keyring
+
+
+# requests signed with a key the server doesn't have, or whose signature doesn't verify
+TSIG_ERRORS = (
+    dns.message.UnknownTSIGKey,
+    dns.tsig.BadSignature,
+    dns.tsig.BadTime,
+    dns.tsig.BadKey,
+    dns.tsig.BadAlgorithm,
+)
+
+
+class _UDPRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        wire, sock = self.request
+        for response in self.server.dns_server.handle_wire(
+            wire, peer=self.client_address, connection_type=ConnectionType.UDP
+        ):
+            sock.sendto(response, self.client_address)
+
+
+class _TCPRequestHandler(socketserver.StreamRequestHandler):
+    # seconds an idle TCP connection is kept open
+    timeout = 30
+
+    def handle(self):
+        try:
+            while True:
+                length_data = self.rfile.read(2)
+                if len(length_data) < 2:
+                    return
+                (length,) = struct.unpack("!H", length_data)
+                wire = self.rfile.read(length)
+                if len(wire) < length:
+                    return
+                for response in self.server.dns_server.handle_wire(
+                    wire,
+                    peer=self.client_address,
+                    connection_type=ConnectionType.TCP,
+                ):
+                    self.wfile.write(struct.pack("!H", len(response)) + response)
+        except (TimeoutError, ConnectionError):
+            return
+
+
+# pylint: disable=too-few-public-methods
+class _AddressFamilyMixin:
+    # the DnsServer to hand requests to
+    dns_server = None
+
+    def __init__(self, server_address, handler_class):
+        if ":" in server_address[0]:
+            self.address_family = socket.AF_INET6
+        super().__init__(server_address, handler_class)
+
+
+# pylint: enable=too-few-public-methods
+
+
+class _UDPServer(_AddressFamilyMixin, socketserver.ThreadingUDPServer):
+    daemon_threads = True
+    max_packet_size = 65535
+
+
+class _TCPServer(_AddressFamilyMixin, socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class DnsServer:
+    """
+    A minimal UDP/TCP DNS listener that hands parsed requests to a list of handlers.
+
+    Each handler provides accepts(request) and handle(request), the latter returning a list of dns.message.Message or wire format bytes to send back.
+    The first handler that accepts a request handles it. Requests no handler accepts are answered with NOTIMP.
+
+    TSIG signed requests are verified against keyring, a dict of dns.tsig.Key by name, before they're handed to a handler,
+    and are answered with NOTAUTH if they don't verify. Responses to them are signed with the same key: handlers build them
+    for the request rather than serving cached wire, and sign each message of a zone transfer in sequence.
+
+    The server can be used as a context manager, serving from background threads, or run in the foreground with serve_forever().
+    """
+
+    def __init__(
+        self,
+        handlers: list,
+        *,
+        address: str = "127.0.0.1",
+        port: int = 0,
+        keyring: dict = None,
+    ):
+        self.handlers = handlers
+        self.keyring = keyring
+        self.address = address
+        self.port = port
+        self._servers = {}
+        self._threads = []
+
+    @property
+    def udp_address(self):
+        return self._servers[ConnectionType.UDP].server_address
+
+    @property
+    def tcp_address(self):
+        return self._servers[ConnectionType.TCP].server_address
+
+    def open_sockets(self):
+        # UDP and TCP must share a port, so when picking a random port take the one the UDP socket was given
+        udp = _UDPServer((self.address, self.port), _UDPRequestHandler)
+        try:
+            tcp = _TCPServer((self.address, udp.server_address[1]), _TCPRequestHandler)
+        except OSError:
+            udp.server_close()
+            raise
+        for connection_type, server in (
+            (ConnectionType.UDP, udp),
+            (ConnectionType.TCP, tcp),
+        ):
+            server.dns_server = self
+            self._servers[connection_type] = server
+
+    def serve_forever(self):
+        if not self._servers:
+            self.open_sockets()
+        logger.info("DNS server listening on %s port %s", *self.udp_address[:2])
+        tcp_thread = threading.Thread(
+            target=self._servers[ConnectionType.TCP].serve_forever, daemon=True
+        )
+        tcp_thread.start()
+        self._threads.append(tcp_thread)
+        try:
+            self._servers[ConnectionType.UDP].serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        for server in self._servers.values():
+            server.shutdown()
+            server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._servers = {}
+        self._threads = []
+
+    def __enter__(self):
+        self.open_sockets()
+        for server in self._servers.values():
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def handle_wire(self, wire: bytes, *, peer: tuple, connection_type: ConnectionType):
+        """
+        Parses a wire format request and returns the list of wire format responses to send.
+        """
+        try:
+            message = dns.message.from_wire(wire, keyring=self.keyring)
+        except dns.message.ShortHeader:
+            return []
+        except dns.exception.DNSException as e:
+            try:
+                message = dns.message.from_wire(wire, question_only=True)
+            except dns.exception.DNSException:
+                return []
+            if isinstance(e, TSIG_ERRORS):
+                logger.info("Refused request from %s: %s", peer[0], e)
+                return [error_response(message, dns.rcode.NOTAUTH).to_wire()]
+            return [error_response(message, dns.rcode.FORMERR).to_wire()]
+
+        request = Request(
+            message, wire=wire, peer=peer, connection_type=connection_type
+        )
+        responses = None
+        for handler in self.handlers:
+            if handler.accepts(request):
+                try:
+                    responses = handler.handle(request)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception("Error handling DNS request from %s", peer[0])
+                    responses = [error_response(message, dns.rcode.SERVFAIL)]
+                break
+        if responses is None:
+            responses = [error_response(message, dns.rcode.NOTIMP)]
+
+        return [
+            (
+                response_to_wire(response, request.max_size)
+                if isinstance(response, dns.message.Message)
+                else response
+            )
+            for response in responses
+        ]
+
+
+def response_to_wire(
+    response: dns.message.Message, max_size: int, *, origin: dns.name.Name = None
+) -> bytes:
+    """
+    Renders a response within max_size, dropping the additional section if needed, and setting TC if it still doesn't fit.
+    """
+    try:
+        return response.to_wire(origin=origin, max_size=max_size)
+    except dns.exception.TooBig:
+        pass
+    if response.additional:
+        response.additional = []
+        try:
+            return response.to_wire(origin=origin, max_size=max_size)
+        except dns.exception.TooBig:
+            pass
+    # let the client know to retry over TCP
+    response.flags |= dns.flags.TC
+    response.answer = []
+    response.authority = []
+    return response.to_wire(origin=origin, max_size=max_size)
+
+
+def error_response(message: dns.message.Message, rcode: dns.rcode.Rcode):
+    response = dns.message.make_response(message)
+    response.set_rcode(rcode)
+    return response
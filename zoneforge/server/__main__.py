@@ -0,0 +1,79 @@
+import logging
+import os
+import sys
+
+from zoneforge import metrics
+from zoneforge.core.store import zone_store
+from zoneforge.server import DnsServer, parse_networks, parse_tsig_keys
+from zoneforge.server.query import QueryHandler
+from zoneforge.server.update import UpdateHandler
+from zoneforge.server.xfr import XfrHandler
+
+
+def main():
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "WARNING").upper(),
+        format="%(levelname)s [%(filename)-s%(funcName)s():%(lineno)s]: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    # the web app's workers report the server's metrics too, when it shares their metrics directory
+    if os.environ.get("METRICS_DIR"):
+        metrics.configure(
+            directory=os.environ["METRICS_DIR"],
+            interval=float(os.environ.get("METRICS_FLUSH_INTERVAL", 5)),
+        )
+    # zone writes from update handling keep the process-wide store in sync
+    store = zone_store(
+        os.environ.get("ZONE_FILE_FOLDER", "./lib/examples"),
+        max_versions=int(os.environ.get("DNS_XFR_HISTORY", 10)),
+        revalidate_interval=float(os.environ.get("DNS_ZONE_REVALIDATE_INTERVAL", 1)),
+    )
+    keyring = parse_tsig_keys(os.environ.get("DNS_TSIG_KEYS", ""))
+    handlers = []
+    if os.environ.get("DNS_XFR_ENABLED", "true").lower() == "true":
+        handlers.append(
+            XfrHandler(
+                store,
+                allowed_networks=parse_networks(
+                    os.environ.get("DNS_XFR_ALLOW", "127.0.0.1,::1")
+                ),
+                keyring=keyring,
+                cache_size=int(os.environ.get("DNS_XFR_CACHE_SIZE", 64)),
+            )
+        )
+    if os.environ.get("DNS_QUERY_ENABLED", "false").lower() == "true":
+        handlers.append(
+            QueryHandler(
+                store, cache_size=int(os.environ.get("DNS_QUERY_CACHE_SIZE", 1024))
+            )
+        )
+    update_handler = None
+    if os.environ.get("DNS_UPDATE_ENABLED", "false").lower() == "true":
+        update_handler = UpdateHandler(
+            store,
+            allowed_networks=parse_networks(
+                os.environ.get("DNS_UPDATE_ALLOW", "127.0.0.1,::1")
+            ),
+            keyring=keyring,
+            write_delay=float(os.environ.get("DNS_UPDATE_WRITE_DELAY", 1)),
+            batch_window=float(os.environ.get("DNS_UPDATE_BATCH_WINDOW", 0.002)),
+            max_batch=int(os.environ.get("DNS_UPDATE_MAX_BATCH", 1000)),
+        )
+        handlers.append(update_handler)
+    server = DnsServer(
+        handlers,
+        address=os.environ.get("DNS_LISTEN_ADDRESS", "0.0.0.0"),
+        port=int(os.environ.get("DNS_LISTEN_PORT", 5353)),
+        keyring=keyring,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if update_handler:
+            update_handler.flush()
+
+
+if __name__ == "__main__":
+    main()
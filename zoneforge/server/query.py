@@ -0,0 +1,262 @@
+import logging
+import struct
+import threading
+import dns.flags
+import dns.message
+import dns.name
+import dns.opcode
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+import dns.versioned
+from zoneforge import metrics
+from zoneforge.cache import LRUCache
+from zoneforge.core.store import ZoneStore, current_version
+from zoneforge.server import Request, error_response, response_to_wire
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+# How many CNAMEs are followed within a zone before answering with what we have
+MAX_CNAME_CHAIN = 8
+# Record types whose targets get their in-zone addresses added to the additional section
+ADDITIONAL_TARGET_FIELDS = {
+    dns.rdatatype.NS: "target",
+    dns.rdatatype.MX: "exchange",
+    dns.rdatatype.SRV: "target",
+}
+ADDRESS_TYPES = (dns.rdatatype.A, dns.rdatatype.AAAA)
+WILDCARD_LABEL = b"*"
+# RD within the high byte of the header flags
+RD_BIT = dns.flags.RD >> 8
+
+
+# pylint: disable=too-few-public-methods
+class _ZoneState:
+    """
+    A committed version of a zone, along with the answers rendered from it.
+    """
+
+    def __init__(self, origin: dns.name.Name, version, *, cache_size: int):
+        self.origin = origin
+        self.version = version
+        self.cache = LRUCache(maxsize=cache_size)
+        # every name that exists in the zone, including empty non-terminals
+        self.names = set()
+        for name in version.nodes:
+            while name not in self.names:
+                self.names.add(name)
+                if name == dns.name.empty:
+                    break
+                name = name.parent()
+
+
+# pylint: enable=too-few-public-methods
+
+
+class QueryHandler:
+    """
+    Answers standard queries authoritatively from the zones of a ZoneStore.
+
+    Rendered responses are cached per zone, keyed by question and the response size the client accepts. Responses to TSIG
+    signed requests are signed for each request, and aren't cached.
+    A zone's cache is dropped as soon as a new version of the zone is committed, so an answer never outlives the zone contents it was built from.
+    The hits and misses of every zone's cache, including those dropped, are reported together.
+    """
+
+    def __init__(self, store: ZoneStore, *, cache_size: int = 1024):
+        self.store = store
+        self.cache_size = cache_size
+        self._zone_states = {}
+        self._lock = threading.Lock()
+        # hits and misses of the caches dropped so far
+        self._dropped_hits = 0
+        self._dropped_misses = 0
+        metrics.watch_cache("query", self)
+
+    @property
+    def hits(self) -> int:
+        states = list(self._zone_states.values())
+        return self._dropped_hits + sum(state.cache.hits for state in states)
+
+    @property
+    def misses(self) -> int:
+        states = list(self._zone_states.values())
+        return self._dropped_misses + sum(state.cache.misses for state in states)
+
+    def accepts(self, request: Request) -> bool:
+        return (
+            request.opcode == dns.opcode.QUERY
+            and request.question is not None
+            and request.qtype not in (dns.rdatatype.AXFR, dns.rdatatype.IXFR)
+        )
+
+    def handle(self, request: Request) -> list:
+        message = request.message
+        if request.question.rdclass != dns.rdataclass.IN:
+            return [error_response(message, dns.rcode.REFUSED)]
+        zone = self.store.find(request.qname)
+        if zone is None:
+            return [error_response(message, dns.rcode.REFUSED)]
+        state = self.zone_state(zone)
+        if message.had_tsig:
+            # responses to signed requests are signed for them, so they're never cached
+            response = _build_response(state, message)
+            return [response_to_wire(response, request.max_size, origin=state.origin)]
+
+        # names compare case-insensitively, but the question is echoed back as asked
+        cache_key = (
+            request.qname.labels,
+            request.qtype,
+            message.edns >= 0,
+            request.max_size,
+        )
+        wire = state.cache.get(cache_key)
+        if wire is None:
+            response = _build_response(state, message)
+            wire = response_to_wire(response, request.max_size, origin=state.origin)
+            state.cache.set(cache_key, wire)
+        # cached responses carry the ID and RD bit of the request they were built for
+        flags_high = (wire[2] & ~RD_BIT) | (request.wire[2] & RD_BIT)
+        return [struct.pack("!HB", message.id, flags_high) + wire[3:]]
+
+    def zone_state(self, zone: dns.versioned.Zone) -> _ZoneState:
+        version = current_version(zone)
+        state = self._zone_states.get(zone.origin)
+        if state is None or state.version is not version:
+            with self._lock:
+                state = self._zone_states.get(zone.origin)
+                if state is None or state.version is not version:
+                    logger.debug(
+                        "Zone %s changed, dropping its cached answers", zone.origin
+                    )
+                    if state is not None:
+                        self._dropped_hits += state.cache.hits
+                        self._dropped_misses += state.cache.misses
+                    state = _ZoneState(zone.origin, version, cache_size=self.cache_size)
+                    self._zone_states[zone.origin] = state
+        return state
+
+
+def _build_response(state: _ZoneState, message: dns.message.Message):
+    origin = state.origin
+    nodes = state.version.nodes
+    qtype = message.question[0].rdtype
+    response = dns.message.make_response(message)
+    response.flags |= dns.flags.AA
+
+    name = message.question[0].name
+    followed = {name}
+    for _ in range(MAX_CNAME_CHAIN + 1):
+        relative_name = name.relativize(origin)
+        delegation = _find_delegation(nodes, relative_name, qtype)
+        if delegation:
+            cut, ns_rdataset = delegation
+            if not response.answer:
+                response.flags &= ~dns.flags.AA
+            response.authority.append(_rrset(cut.derelativize(origin), ns_rdataset))
+            break
+
+        node = _find_node(state, relative_name)
+        if node is None:
+            if relative_name not in state.names:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(_negative_soa(state))
+            break
+        if qtype == dns.rdatatype.ANY:
+            rdatasets = list(node)
+        else:
+            rdatasets = [node.get_rdataset(dns.rdataclass.IN, qtype)]
+        rdatasets = [rdataset for rdataset in rdatasets if rdataset]
+        if rdatasets:
+            response.answer.extend(_rrset(name, rdataset) for rdataset in rdatasets)
+            break
+        cname = node.get_rdataset(dns.rdataclass.IN, dns.rdatatype.CNAME)
+        if cname is None:
+            response.authority.append(_negative_soa(state))
+            break
+        response.answer.append(_rrset(name, cname))
+        name = cname[0].target.derelativize(origin)
+        # targets outside of this zone are left for the client to resolve
+        if not name.is_subdomain(origin) or name in followed:
+            break
+        followed.add(name)
+
+    response.additional.extend(
+        _additional_rrsets(nodes, origin, response.answer + response.authority)
+    )
+    return response
+
+
+def _find_delegation(nodes: dict, relative_name: dns.name.Name, qtype) -> tuple:
+    """
+    Returns the (zone cut, NS rdataset) of the delegation below the apex that contains a name, if any.
+    """
+    labels = relative_name.labels
+    for depth in range(1, len(labels) + 1):
+        cut = dns.name.Name(labels[-depth:])
+        node = nodes.get(cut)
+        if node is None:
+            continue
+        ns_rdataset = node.get_rdataset(dns.rdataclass.IN, dns.rdatatype.NS)
+        if ns_rdataset is None:
+            continue
+        # the DS records of a delegation live on the parent side of the cut
+        if depth == len(labels) and qtype == dns.rdatatype.DS:
+            return None
+        return cut, ns_rdataset
+    return None
+
+
+def _find_node(state: _ZoneState, relative_name: dns.name.Name):
+    """
+    Returns the node answering for a name, synthesized from a wildcard if needed (RFC 4592), or None if there isn't one.
+    """
+    node = state.version.nodes.get(relative_name)
+    if node is not None or relative_name in state.names:
+        return node
+    closest_encloser = relative_name.parent()
+    while closest_encloser not in state.names:
+        closest_encloser = closest_encloser.parent()
+    return state.version.nodes.get(
+        dns.name.Name((WILDCARD_LABEL,) + closest_encloser.labels)
+    )
+
+
+def _negative_soa(state: _ZoneState) -> dns.rrset.RRset:
+    soa_rdataset = state.version.nodes[dns.name.empty].get_rdataset(
+        dns.rdataclass.IN, dns.rdatatype.SOA
+    )
+    # RFC 2308: negative answers are cached for the lesser of the SOA TTL and minimum
+    ttl = min(soa_rdataset.ttl, soa_rdataset[0].minimum)
+    return dns.rrset.from_rdata_list(state.origin, ttl, soa_rdataset)
+
+
+def _additional_rrsets(nodes: dict, origin: dns.name.Name, rrsets: list) -> list:
+    """
+    Returns the in-zone address records of the nameservers, mail exchangers and service targets referenced by rrsets.
+    """
+    additional = []
+    added = set()
+    for rrset in rrsets:
+        target_field = ADDITIONAL_TARGET_FIELDS.get(rrset.rdtype)
+        if target_field is None:
+            continue
+        for rdata in rrset:
+            target = getattr(rdata, target_field).derelativize(origin)
+            if target in added or not target.is_subdomain(origin):
+                continue
+            added.add(target)
+            node = nodes.get(target.relativize(origin))
+            if node is None:
+                continue
+            for rdtype in ADDRESS_TYPES:
+                rdataset = node.get_rdataset(dns.rdataclass.IN, rdtype)
+                if rdataset:
+                    additional.append(_rrset(target, rdataset))
+    return additional
+
+
+def _rrset(name: dns.name.Name, rdataset) -> dns.rrset.RRset:
+    return dns.rrset.from_rdata_list(name, rdataset.ttl, rdataset)
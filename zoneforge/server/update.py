@@ -0,0 +1,436 @@
+import logging
+import queue
+import threading
+import time
+import dns.message
+import dns.name
+import dns.opcode
+import dns.rcode
+import dns.rdata
+import dns.rdataclass
+import dns.rdataset
+import dns.rdatatype
+import dns.rrset
+import dns.versioned
+from zoneforge.core import ZFZone
+from zoneforge.core.store import ZoneStore
+from zoneforge.server import Request, error_response, peer_allowed
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+# Record types that can't be added or deleted by name through an update (RFC 2136 section 3.4.1.3)
+META_TYPES = (
+    dns.rdatatype.ANY,
+    dns.rdatatype.AXFR,
+    dns.rdatatype.IXFR,
+    dns.rdatatype.MAILA,
+    dns.rdatatype.MAILB,
+)
+
+
+class UpdateFailed(Exception):
+    """
+    Raised while checking an update, before any of it is applied, to answer it with rcode.
+    """
+
+    def __init__(self, rcode: dns.rcode.Rcode):
+        super().__init__(dns.rcode.to_text(rcode))
+        self.rcode = rcode
+
+
+# pylint: disable=too-few-public-methods
+class _PendingUpdate:
+    """
+    An update message waiting for the transaction it is committed in.
+    """
+
+    def __init__(self, zone: dns.versioned.Zone, message: dns.message.Message):
+        self.zone = zone
+        self.message = message
+        self.rcode = None
+        self.done = threading.Event()
+        self._started = False
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """
+        Marks the update as being committed, returning False if it was cancelled first.
+        """
+        with self._lock:
+            self._started = not self._cancelled
+            return self._started
+
+    def cancel(self) -> bool:
+        """
+        Cancels the update unless it's already being committed, returning whether it was cancelled.
+        """
+        with self._lock:
+            self._cancelled = not self._started
+            return self._cancelled
+
+
+# pylint: enable=too-few-public-methods
+
+
+# pylint: disable=too-many-instance-attributes
+class UpdateHandler:
+    """
+    Applies RFC 2136 dynamic updates to the zones of a ZoneStore.
+
+    Updates are committed to the in-memory zone by a single background thread. Each commit applies, in one transaction, the
+    updates that arrive within batch_window seconds of the first, up to max_batch of them, as a commit costs time in
+    proportion to the size of the zone however few updates it holds. Each update's prerequisites are checked against the
+    transaction so far, so updates see each other in the order they arrived. A response is only sent once its update is committed.
+    An update still waiting to be committed after timeout seconds is cancelled and answered with SERVFAIL, while one already
+    being committed is answered once it is.
+
+    Writing the zone file is deferred: updates to a zone within write_delay seconds of each other are written together,
+    so a busy zone costs one zone file write per write_delay seconds rather than one per update. Each commit increases the
+    zone's serial, and changes made to the zone file before the updates are written are merged with them by the ZoneStore.
+    Only peers within allowed_networks may send updates. When keyring is set, updates must also be signed with one of its
+    TSIG keys, which the DnsServer verifies with the same keyring; otherwise the allowed networks are the only protection.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        store: ZoneStore,
+        *,
+        allowed_networks: list,
+        keyring: dict = None,
+        write_delay: float = 1,
+        batch_window: float = 0.002,
+        max_batch: int = 1000,
+        timeout: float = 10,
+    ):
+        self.store = store
+        self.allowed_networks = allowed_networks
+        self.keyring = keyring
+        self.write_delay = write_delay
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.updates = 0
+        self.commits = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pending_writes = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    # pylint: enable=too-many-arguments
+
+    def accepts(self, request: Request) -> bool:
+        return request.opcode == dns.opcode.UPDATE
+
+    def handle(self, request: Request) -> list:
+        message = request.message
+        # an empty allow list refuses everyone, unlike zone transfers. A signature was verified when the request was parsed
+        if (
+            not self.allowed_networks
+            or not peer_allowed(request.peer, self.allowed_networks)
+            or (
+                self.keyring
+                and not (message.had_tsig and message.keyname in self.keyring)
+            )
+        ):
+            logger.info("Refused update from %s", request.peer[0])
+            return [error_response(message, dns.rcode.REFUSED)]
+        if len(message.zone) != 1 or message.zone[0].rdtype != dns.rdatatype.SOA:
+            return [error_response(message, dns.rcode.FORMERR)]
+        zone = self.store.get(message.zone[0].name)
+        if zone is None or message.zone[0].rdclass != dns.rdataclass.IN:
+            return [error_response(message, dns.rcode.NOTAUTH)]
+
+        pending = _PendingUpdate(zone, message)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="zf-update-committer", daemon=True
+                )
+                self._thread.start()
+        self._queue.put(pending)
+        if not pending.done.wait(timeout=self.timeout):
+            if pending.cancel():
+                logger.warning("Timed out committing update from %s", request.peer[0])
+                return [error_response(message, dns.rcode.SERVFAIL)]
+            # the update is already being committed, so the client is told how that went
+            pending.done.wait()
+        if pending.rcode != dns.rcode.NOERROR:
+            logger.info(
+                "Update of zone %s from %s failed: %s",
+                zone.origin,
+                request.peer[0],
+                dns.rcode.to_text(pending.rcode),
+            )
+            return [error_response(message, pending.rcode)]
+        return [dns.message.make_response(message)]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(
+                        self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    )
+                except queue.Empty:
+                    break
+            zone_batches = {}
+            for pending in batch:
+                zone_batches.setdefault(id(pending.zone), []).append(pending)
+            for zone_batch in zone_batches.values():
+                self._commit(zone_batch[0].zone, zone_batch)
+
+    def _commit(self, zone: dns.versioned.Zone, batch: list):
+        """
+        Applies a batch of updates to a zone in a single transaction, leaving out those cancelled while they waited.
+        """
+        batch = [pending for pending in batch if pending.start()]
+        if not batch:
+            return
+        try:
+            with zone.writer() as txn:
+                for pending in batch:
+                    pending.rcode = _apply_message(txn, zone.origin, pending.message)
+                # secondaries tell the zone changed by its serial, before it's written
+                if any(
+                    pending.rcode == dns.rcode.NOERROR and pending.message.update
+                    for pending in batch
+                ):
+                    txn.update_serial()
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Error committing updates to zone %s", zone.origin)
+            for pending in batch:
+                pending.rcode = dns.rcode.SERVFAIL
+        applied = [pending for pending in batch if pending.rcode == dns.rcode.NOERROR]
+        self.updates += len(applied)
+        self.commits += 1
+        logger.debug("Committed %d updates to zone %s", len(applied), zone.origin)
+        if any(pending.message.update for pending in applied):
+            self.schedule_write(zone)
+        for pending in batch:
+            pending.done.set()
+
+    def schedule_write(self, zone: dns.versioned.Zone):
+        """
+        Writes the zone to its zone file after write_delay seconds, unless a write is already pending.
+        """
+        with self._lock:
+            if zone.origin in self._pending_writes:
+                return
+            timer = threading.Timer(self.write_delay, self._write, args=(zone,))
+            timer.daemon = True
+            self._pending_writes[zone.origin] = timer
+            timer.start()
+
+    def flush(self):
+        """
+        Immediately writes every zone with a pending write, such as before shutting down.
+        """
+        with self._lock:
+            pending = list(self._pending_writes.values())
+        for timer in pending:
+            timer.cancel()
+            self._write(*timer.args)
+
+    def _write(self, zone: dns.versioned.Zone):
+        origin = zone.origin
+        with self._lock:
+            if self._pending_writes.pop(origin, None) is None:
+                return
+        with self._write_lock:
+            try:
+                # merges any change made to the zone file since the updates were committed, so that neither is lost
+                zone = self.store.get(origin)
+                if zone is None:
+                    logger.warning(
+                        "Zone %s was deleted before its updates were written", origin
+                    )
+                    return
+                ZFZone(
+                    zone=zone, zonefile_folder=self.store.zonefile_folder
+                ).write_to_file()
+                self.writes += 1
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Error writing updated zone %s", origin)
+
+
+# pylint: enable=too-many-instance-attributes
+
+
+def _apply_message(txn, origin: dns.name.Name, message: dns.message.Message):
+    """
+    Checks and applies an update message within txn, returning its rcode. A message that fails is left entirely unapplied.
+    """
+    try:
+        _check_prerequisites(txn, origin, message.prerequisite)
+        _check_updates(origin, message.update)
+    except UpdateFailed as e:
+        return e.rcode
+    for rrset in message.update:
+        _apply_update(txn, origin, rrset)
+    return dns.rcode.NOERROR
+
+
+def _relativize(rdata: dns.rdata.Rdata, origin: dns.name.Name) -> dns.rdata.Rdata:
+    """
+    Returns rdata with its names relative to origin, matching how zones are parsed from zone files.
+    """
+    return dns.rdata.from_text(
+        rdata.rdclass,
+        rdata.rdtype,
+        rdata.to_text(origin=origin, relativize=True),
+        origin=origin,
+        relativize=True,
+    )
+
+
+def _relative_name(name: dns.name.Name, origin: dns.name.Name) -> dns.name.Name:
+    if not name.is_subdomain(origin):
+        raise UpdateFailed(dns.rcode.NOTZONE)
+    return name.relativize(origin)
+
+
+def _check_prerequisites(txn, origin: dns.name.Name, prerequisites: list):
+    """
+    Checks the prerequisite section of an update against the zone (RFC 2136 section 3.2).
+    """
+    required_rrsets = {}
+    for rrset in prerequisites:
+        if rrset.ttl != 0:
+            raise UpdateFailed(dns.rcode.FORMERR)
+        name = _relative_name(rrset.name, origin)
+        if rrset.deleting is None:
+            # "RRset exists (value dependent)", compared once the whole section is collected
+            required = required_rrsets.setdefault(
+                (name, rrset.rdtype, rrset.covers), set()
+            )
+            required.update(_relativize(rdata, origin) for rdata in rrset)
+            continue
+        if len(rrset) > 0:
+            raise UpdateFailed(dns.rcode.FORMERR)
+        exists = (
+            txn.name_exists(name)
+            if rrset.rdtype == dns.rdatatype.ANY
+            else txn.get(name, rrset.rdtype, rrset.covers) is not None
+        )
+        if rrset.deleting == dns.rdataclass.ANY and not exists:
+            raise UpdateFailed(
+                dns.rcode.NXDOMAIN
+                if rrset.rdtype == dns.rdatatype.ANY
+                else dns.rcode.NXRRSET
+            )
+        if rrset.deleting == dns.rdataclass.NONE and exists:
+            raise UpdateFailed(
+                dns.rcode.YXDOMAIN
+                if rrset.rdtype == dns.rdatatype.ANY
+                else dns.rcode.YXRRSET
+            )
+    for (name, rdtype, covers), required in required_rrsets.items():
+        rdataset = txn.get(name, rdtype, covers)
+        if rdataset is None or set(rdataset) != required:
+            raise UpdateFailed(dns.rcode.NXRRSET)
+
+
+def _check_updates(origin: dns.name.Name, updates: list):
+    """
+    Checks the update section of an update before any of it is applied (RFC 2136 section 3.4.1).
+    """
+    for rrset in updates:
+        _relative_name(rrset.name, origin)
+        if rrset.deleting is None:
+            if rrset.rdtype in META_TYPES:
+                raise UpdateFailed(dns.rcode.FORMERR)
+        elif rrset.ttl != 0 or rrset.rdtype in META_TYPES[1:]:
+            raise UpdateFailed(dns.rcode.FORMERR)
+        # ANY deletes every RRset of a name, but only by name: not as an RR to delete
+        elif rrset.deleting == dns.rdataclass.ANY and len(rrset) > 0:
+            raise UpdateFailed(dns.rcode.FORMERR)
+        elif (
+            rrset.deleting == dns.rdataclass.NONE and rrset.rdtype == dns.rdatatype.ANY
+        ):
+            raise UpdateFailed(dns.rcode.FORMERR)
+
+
+def _apply_update(txn, origin: dns.name.Name, rrset: dns.rrset.RRset):
+    """
+    Applies a single RR of the update section (RFC 2136 section 3.4.2).
+    """
+    name = rrset.name.relativize(origin)
+    if rrset.deleting is None:
+        _add_rrset(txn, name, rrset, origin=origin)
+    elif rrset.deleting == dns.rdataclass.ANY:
+        _delete_rrsets(txn, name, rrset)
+    else:
+        _delete_rdatas(txn, name, rrset, origin=origin)
+
+
+def _add_rrset(txn, name: dns.name.Name, rrset, *, origin: dns.name.Name):
+    # the serial is managed by ZoneForge when the zone is written, so SOA updates are ignored
+    if rrset.rdtype == dns.rdatatype.SOA:
+        return
+    node = txn.get_node(name)
+    if node is not None:
+        has_cname = node.get_rdataset(dns.rdataclass.IN, dns.rdatatype.CNAME)
+        has_other = any(rds.rdtype != dns.rdatatype.CNAME for rds in node)
+        # CNAMEs can't share a name with other data, so the update is ignored rather than replacing it
+        if (rrset.rdtype == dns.rdatatype.CNAME and has_other) or (
+            rrset.rdtype != dns.rdatatype.CNAME and has_cname
+        ):
+            return
+    rdataset = dns.rdataset.from_rdata_list(
+        rrset.ttl, [_relativize(rdata, origin) for rdata in rrset]
+    )
+    if rrset.rdtype == dns.rdatatype.CNAME:
+        txn.replace(name, rdataset)
+    else:
+        txn.add(name, rdataset)
+
+
+def _delete_rrsets(txn, name: dns.name.Name, rrset):
+    at_apex = name == dns.name.empty
+    if rrset.rdtype != dns.rdatatype.ANY:
+        if at_apex and rrset.rdtype in (dns.rdatatype.SOA, dns.rdatatype.NS):
+            return
+        rdtypes = [(rrset.rdtype, rrset.covers)]
+    elif not at_apex:
+        if txn.name_exists(name):
+            txn.delete(name)
+        return
+    else:
+        # the apex SOA and NS records are never deleted by name
+        rdtypes = [
+            (rds.rdtype, rds.covers)
+            for rds in txn.get_node(name) or []
+            if rds.rdtype not in (dns.rdatatype.SOA, dns.rdatatype.NS)
+        ]
+    for rdtype, covers in rdtypes:
+        if txn.get(name, rdtype, covers) is not None:
+            txn.delete(name, rdtype, covers)
+
+
+def _delete_rdatas(txn, name: dns.name.Name, rrset, *, origin: dns.name.Name):
+    if rrset.rdtype == dns.rdatatype.SOA:
+        return
+    existing = txn.get(name, rrset.rdtype, rrset.covers)
+    if existing is None:
+        return
+    rdatas = [
+        rdata
+        for rdata in (_relativize(rdata, origin) for rdata in rrset)
+        if rdata in existing
+    ]
+    # the zone must keep at least one apex NS record
+    if (
+        name == dns.name.empty
+        and rrset.rdtype == dns.rdatatype.NS
+        and len(rdatas) >= len(existing)
+    ):
+        return
+    if rdatas:
+        txn.delete(name, dns.rdataset.from_rdata_list(existing.ttl, rdatas))
@@ -0,0 +1,397 @@
+import logging
+import struct
+import time
+import weakref
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.opcode
+import dns.rcode
+import dns.rdataclass
+import dns.rdataset
+import dns.rdatatype
+import dns.renderer
+import dns.versioned
+import dns.zone
+from zoneforge import metrics
+from zoneforge.cache import LRUCache
+from zoneforge.core.store import ZoneStore, retained_versions
+from zoneforge.server import ConnectionType, Request, error_response, peer_allowed
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+SERIAL_BITS = 32
+
+
+class XfrHandler:
+    """
+    Serves outbound AXFR and IXFR requests for the zones of a ZoneStore.
+
+    The wire format message sequence of a transfer is rendered once per zone version and cached, so that any number of secondaries
+    pulling the same serial share a single serialization. IXFR responses are built from the zone versions retained by the store,
+    falling back to a full transfer when the requested serial is no longer available.
+
+    Transfers requested with a TSIG signature, which the DnsServer verified, are rendered for each request instead, so that each
+    message is signed in sequence for it. When keyring is set, transfers must be signed with one of its keys.
+    """
+
+    def __init__(
+        self,
+        store: ZoneStore,
+        *,
+        allowed_networks: list = None,
+        keyring: dict = None,
+        cache_size: int = 64,
+    ):
+        self.store = store
+        self.allowed_networks = allowed_networks or []
+        self.keyring = keyring
+        self.cache = LRUCache(maxsize=cache_size)
+        metrics.watch_cache("xfr", self.cache)
+
+    def accepts(self, request: Request) -> bool:
+        return (
+            request.opcode == dns.opcode.QUERY
+            and request.question is not None
+            and request.qtype in (dns.rdatatype.AXFR, dns.rdatatype.IXFR)
+        )
+
+    def handle(self, request: Request) -> list:
+        start = time.perf_counter()
+        message = request.message
+        if not peer_allowed(request.peer, self.allowed_networks) or (
+            self.keyring and not (message.had_tsig and message.keyname in self.keyring)
+        ):
+            logger.info("Refused zone transfer request from %s", request.peer[0])
+            return [error_response(message, dns.rcode.REFUSED)]
+        # AXFR is only ever served over TCP
+        if (
+            request.qtype == dns.rdatatype.AXFR
+            and request.connection_type == ConnectionType.UDP
+        ):
+            return [error_response(message, dns.rcode.FORMERR)]
+        zone = self.store.get(request.qname)
+        if zone is None:
+            return [error_response(message, dns.rcode.NOTAUTH)]
+        signed_request = message if message.had_tsig else None
+
+        if request.qtype == dns.rdatatype.IXFR:
+            client_serial = _request_serial(message)
+            if client_serial is None:
+                return [error_response(message, dns.rcode.FORMERR)]
+            messages = self.ixfr_messages(
+                zone,
+                client_serial,
+                udp=request.connection_type == ConnectionType.UDP,
+                signed_request=signed_request,
+            )
+        else:
+            messages = self.axfr_messages(zone, signed_request=signed_request)
+
+        logger.info(
+            "Serving %s of zone %s to %s",
+            dns.rdatatype.to_text(request.qtype),
+            zone.origin,
+            request.peer[0],
+        )
+        metrics.transfer_bytes.inc("out", amount=sum(len(wire) for wire in messages))
+        metrics.transfer_duration.observe(time.perf_counter() - start, "out")
+        if signed_request is not None:
+            return messages
+        # cached messages are rendered with an ID of 0, and only the ID differs between requests
+        message_id = struct.pack("!H", message.id)
+        return [message_id + wire[2:] for wire in messages]
+
+    def axfr_messages(
+        self,
+        zone: dns.versioned.Zone,
+        *,
+        signed_request: dns.message.Message = None,
+    ) -> list[bytes]:
+        """
+        Returns the messages of a full transfer of the zone, signed for signed_request if it's provided.
+        """
+        version = retained_versions(zone)[-1]
+        if signed_request is not None:
+            return _render_messages(
+                zone.origin,
+                dns.rdatatype.AXFR,
+                _axfr_records(version),
+                signed_request=signed_request,
+            )
+        cache_key = ("AXFR", zone.origin)
+        messages = self._cached(cache_key, version)
+        if messages is None:
+            messages = _render_messages(
+                zone.origin, dns.rdatatype.AXFR, _axfr_records(version)
+            )
+            self._cache(cache_key, version, messages=messages)
+        return messages
+
+    def ixfr_messages(
+        self,
+        zone: dns.versioned.Zone,
+        client_serial: int,
+        *,
+        udp: bool = False,
+        signed_request: dns.message.Message = None,
+    ) -> list[bytes]:
+        """
+        Returns the messages of an incremental transfer of the zone from client_serial, signed for signed_request if it's provided.
+        """
+        versions = retained_versions(zone)
+        current = versions[-1]
+        cache_key = ("IXFR", zone.origin, client_serial, udp)
+        if signed_request is None:
+            messages = self._cached(cache_key, current)
+            if messages is not None:
+                return messages
+
+        soa_only = [(dns.name.empty, _soa_rdataset(current))]
+        if not _serial_newer(_version_serial(current), client_serial):
+            # the client is already up to date
+            records = soa_only
+        else:
+            chain = _version_chain(versions, client_serial)
+            if chain:
+                records = _ixfr_records(chain)
+            elif udp:
+                records = soa_only
+            else:
+                records = _axfr_records(current)
+
+        max_size = 512 if udp else 65535
+        messages = _render_messages(
+            zone.origin,
+            dns.rdatatype.IXFR,
+            records,
+            max_size=max_size,
+            signed_request=signed_request,
+        )
+        if udp and len(messages) > 1:
+            # RFC 1995: when an IXFR over UDP doesn't fit a single message, reply with only the SOA so the client retries over TCP
+            messages = _render_messages(
+                zone.origin,
+                dns.rdatatype.IXFR,
+                soa_only,
+                max_size=max_size,
+                signed_request=signed_request,
+            )
+        if signed_request is None:
+            self._cache(cache_key, current, messages=messages)
+        return messages
+
+    def _cached(self, cache_key: tuple, version: dns.zone.Version) -> list[bytes]:
+        # version ids restart when a zone is reloaded from its file, so entries are matched to the version object itself
+        entry = self.cache.get(cache_key + (id(version),))
+        if entry is None or entry[0]() is not version:
+            return None
+        return entry[1]
+
+    def _cache(
+        self, cache_key: tuple, version: dns.zone.Version, *, messages: list[bytes]
+    ):
+        self.cache.set(cache_key + (id(version),), (weakref.ref(version), messages))
+
+
+def _soa_rdataset(version) -> dns.rdataset.Rdataset:
+    return version.nodes[dns.name.empty].get_rdataset(
+        dns.rdataclass.IN, dns.rdatatype.SOA
+    )
+
+
+def _version_serial(version) -> int:
+    return _soa_rdataset(version)[0].serial
+
+
+def _serial_newer(serial: int, other: int) -> bool:
+    """
+    Whether serial is newer than other, using RFC 1982 serial number arithmetic.
+    """
+    return 0 < (serial - other) % (2**SERIAL_BITS) < 2 ** (SERIAL_BITS - 1)
+
+
+def _request_serial(message: dns.message.Message) -> int:
+    for rrset in message.authority:
+        if rrset.rdtype == dns.rdatatype.SOA and len(rrset) > 0:
+            return rrset[0].serial
+    return None
+
+
+def _version_chain(versions: list, client_serial: int) -> list:
+    """
+    Returns the versions to diff between to bring a client at client_serial up to date, or None if that isn't possible.
+    """
+    # consecutive versions sharing a serial are indistinguishable to a client, so only the newest of each run can be diffed to
+    runs = []
+    for version in versions:
+        serial = _version_serial(version)
+        if runs and runs[-1][0] == serial:
+            runs[-1][1].append(version)
+        else:
+            runs.append((serial, [version]))
+    for index, (serial, run_versions) in enumerate(runs):
+        if serial == client_serial:
+            if len(run_versions) > 1:
+                # we can't know which of these versions the client has
+                return None
+            return run_versions + [run[1][-1] for run in runs[index + 1 :]]
+    return None
+
+
+def _axfr_records(version) -> list:
+    soa = (dns.name.empty, _soa_rdataset(version))
+    records = [soa]
+    for name, node in version.nodes.items():
+        for rdataset in node:
+            if name == dns.name.empty and rdataset.rdtype == dns.rdatatype.SOA:
+                continue
+            records.append((name, rdataset))
+    records.append(soa)
+    return records
+
+
+def _ixfr_records(chain: list) -> list:
+    records = [(dns.name.empty, _soa_rdataset(chain[-1]))]
+    for old, new in zip(chain, chain[1:]):
+        deleted, added = _diff_versions(old, new)
+        records.append((dns.name.empty, _soa_rdataset(old)))
+        records.extend(deleted)
+        records.append((dns.name.empty, _soa_rdataset(new)))
+        records.extend(added)
+    records.append((dns.name.empty, _soa_rdataset(chain[-1])))
+    return records
+
+
+def _diff_versions(old, new) -> tuple[list, list]:
+    """
+    Returns the (name, rdataset) pairs deleted and added between two versions of a zone, excluding the SOA.
+    """
+    deleted = []
+    added = []
+    for name in old.nodes.keys() | new.nodes.keys():
+        old_node = old.nodes.get(name)
+        new_node = new.nodes.get(name)
+        # nodes untouched by a write are shared between versions
+        if old_node is new_node:
+            continue
+        old_rdatasets = {(rds.rdtype, rds.covers): rds for rds in old_node or []}
+        new_rdatasets = {(rds.rdtype, rds.covers): rds for rds in new_node or []}
+        for key in old_rdatasets.keys() | new_rdatasets.keys():
+            if key[0] == dns.rdatatype.SOA:
+                continue
+            old_rdataset = old_rdatasets.get(key)
+            new_rdataset = new_rdatasets.get(key)
+            if old_rdataset and new_rdataset and old_rdataset.ttl == new_rdataset.ttl:
+                removed_rdatas = [rd for rd in old_rdataset if rd not in new_rdataset]
+                added_rdatas = [rd for rd in new_rdataset if rd not in old_rdataset]
+            else:
+                removed_rdatas = list(old_rdataset or [])
+                added_rdatas = list(new_rdataset or [])
+            if removed_rdatas:
+                deleted.append(
+                    (
+                        name,
+                        dns.rdataset.from_rdata_list(old_rdataset.ttl, removed_rdatas),
+                    )
+                )
+            if added_rdatas:
+                added.append(
+                    (
+                        name,
+                        dns.rdataset.from_rdata_list(new_rdataset.ttl, added_rdatas),
+                    )
+                )
+    return deleted, added
+
+
+# pylint: disable=too-few-public-methods
+class _TransferSigner:
+    """
+    Signs the messages of a response to a TSIG signed request, each one's signature covering those before it (RFC 8945 section 5.3.1).
+    """
+
+    def __init__(self, request: dns.message.Message):
+        self.message_id = request.id
+        # a response carries the key and request MAC to sign with
+        self.response = dns.message.make_response(request)
+        self.reserve = (
+            self.response._compute_tsig_reserve()
+        )  # pylint: disable=protected-access
+        self._ctx = None
+
+    def sign(self, renderer: dns.renderer.Renderer):
+        tsig = self.response.tsig[0]
+        self._ctx = renderer.add_multi_tsig(
+            self._ctx,
+            self.response.keyname,
+            self.response.keyring,
+            tsig.fudge,
+            tsig.original_id,
+            tsig.error,
+            tsig.other,
+            self.response.request_mac,
+            self.response.keyalgorithm,
+        )
+
+
+# pylint: enable=too-few-public-methods
+
+
+def _new_renderer(
+    origin: dns.name.Name,
+    rdtype: dns.rdatatype.RdataType,
+    max_size: int,
+    *,
+    signer: _TransferSigner = None,
+) -> dns.renderer.Renderer:
+    renderer = dns.renderer.Renderer(
+        id=signer.message_id if signer else 0,
+        flags=dns.flags.QR | dns.flags.AA,
+        max_size=max_size,
+        origin=origin,
+    )
+    if signer:
+        renderer.reserve(signer.reserve)
+    renderer.add_question(origin, rdtype)
+    return renderer
+
+
+def _finish(
+    renderer: dns.renderer.Renderer, *, signer: _TransferSigner = None
+) -> bytes:
+    renderer.write_header()
+    if signer:
+        renderer.release_reserved()
+        signer.sign(renderer)
+    return renderer.get_wire()
+
+
+def _render_messages(
+    origin: dns.name.Name,
+    rdtype: dns.rdatatype.RdataType,
+    records: list,
+    *,
+    max_size: int = 65535,
+    signed_request: dns.message.Message = None,
+) -> list[bytes]:
+    """
+    Renders (name, rdataset) pairs into as few wire format messages as possible, preserving their order.
+    Messages are rendered with an ID of 0, unless they're signed for signed_request, which they then answer.
+    """
+    signer = _TransferSigner(signed_request) if signed_request is not None else None
+    messages = []
+    renderer = _new_renderer(origin, rdtype, max_size, signer=signer)
+    for name, rdataset in records:
+        try:
+            renderer.add_rdataset(dns.renderer.ANSWER, name, rdataset)
+        except dns.exception.TooBig:
+            if renderer.counts[dns.renderer.ANSWER] == 0:
+                raise
+            messages.append(_finish(renderer, signer=signer))
+            renderer = _new_renderer(origin, rdtype, max_size, signer=signer)
+            renderer.add_rdataset(dns.renderer.ANSWER, name, rdataset)
+    messages.append(_finish(renderer, signer=signer))
+    return messages
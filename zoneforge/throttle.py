@@ -0,0 +1,203 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 65536
+
+
+class MemoryBuckets:
+    """
+    Token bucket states for this process, keeping at most maxsize of the most recently used ones.
+    A bucket that is evicted starts over full, which only a key idle for longer than the others can benefit from.
+    """
+
+    def __init__(self, *, maxsize: int = DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def update(self, key: str, func):
+        """
+        Replaces the (tokens, updated) state of a bucket, or None for a new one, with the first value returned by func, and
+        returns the second.
+        """
+        with self._lock:
+            state, result = func(self._buckets.pop(key, None))
+            self._buckets[key] = state
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return result
+
+
+class SQLiteBuckets:
+    """
+    Token bucket states in a SQLite file, shared by every worker process using the same path.
+    The table is trimmed to the maxsize most recently used buckets every so often.
+    """
+
+    TRIM_INTERVAL = 1024
+
+    def __init__(self, path: str, *, maxsize: int = DEFAULT_MAXSIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS login_bucket"
+                " (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_login_bucket_updated ON login_bucket (updated)"
+            )
+
+    def __len__(self):
+        return (
+            self._connection()
+            .execute("SELECT COUNT(*) FROM login_bucket")
+            .fetchone()[0]
+        )
+
+    def update(self, key: str, func):
+        """
+        Replaces the (tokens, updated) state of a bucket, or None for a new one, with the first value returned by func, and
+        returns the second. The bucket is locked against other workers in the meantime.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated FROM login_bucket WHERE key = ?", (key,)
+            ).fetchone()
+            state, result = func(row)
+            connection.execute(
+                "INSERT INTO login_bucket (key, tokens, updated) VALUES (?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, *state),
+            )
+            self._writes += 1
+            if self._writes % self.TRIM_INTERVAL == 0:
+                connection.execute(
+                    "DELETE FROM login_bucket WHERE key IN"
+                    " (SELECT key FROM login_bucket ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return result
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+
+class LoginThrottle:
+    """
+    Limits login attempts per username and per client address with token buckets.
+
+    Each attempt takes a token from both of its buckets before the password is checked, and successful logins give theirs
+    back, so only failed attempts count. Buckets hold up to burst tokens and regain rate of them per minute. A burst of 0
+    disables that bucket.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        *,
+        store=None,
+        user_burst: int = 10,
+        user_rate: float = 10,
+        address_burst: int = 50,
+        address_rate: float = 50,
+    ):
+        self.store = store if store is not None else MemoryBuckets()
+        self.limits = {
+            "user": (user_burst, user_rate),
+            "address": (address_burst, address_rate),
+        }
+
+    # pylint: enable=too-many-arguments
+
+    def acquire(self, username: str, address: str) -> float:
+        """
+        Takes a token for a login attempt. Returns 0 if the attempt may proceed, or else the seconds until it may be retried.
+        """
+        wait = self._take("user", username)
+        if wait:
+            return wait
+        wait = self._take("address", address)
+        if wait:
+            self._give_back("user", username)
+        return wait
+
+    def release(self, username: str, address: str):
+        """
+        Gives back the tokens of an attempt that shouldn't count against its user and address.
+        """
+        self._give_back("user", username)
+        self._give_back("address", address)
+
+    def _take(self, kind: str, value: str) -> float:
+        burst, rate = self.limits[kind]
+        if not burst or not rate:
+            return 0
+        now = time.time()
+
+        def take(state):
+            tokens = self._refilled(state, now=now, burst=burst, rate=rate)
+            if tokens >= 1:
+                return (tokens - 1, now), 0
+            return (tokens, now), (1 - tokens) * 60 / rate
+
+        return self.store.update(f"{kind}:{value}", take)
+
+    def _give_back(self, kind: str, value: str):
+        burst, rate = self.limits[kind]
+        if not burst or not rate:
+            return
+        now = time.time()
+
+        def give_back(state):
+            tokens = self._refilled(state, now=now, burst=burst, rate=rate)
+            return (min(tokens + 1, burst), now), None
+
+        self.store.update(f"{kind}:{value}", give_back)
+
+    @staticmethod
+    def _refilled(state, *, now: float, burst: int, rate: float) -> float:
+        if state is None:
+            return burst
+        tokens, updated = state
+        return min(burst, tokens + max(now - updated, 0) * rate / 60)
+
+
+login_throttle = LoginThrottle()  # pylint: disable=invalid-name
+
+
+def configure(
+    *, shared_path: str = "", maxsize: int = DEFAULT_MAXSIZE, **kwargs
+) -> LoginThrottle:
+    """
+    Replaces the login throttle for this process with one created with the provided arguments.
+    Its buckets are shared with other processes through the SQLite file at shared_path, if one is provided.
+    """
+    global login_throttle  # pylint: disable=global-statement
+    store = (
+        SQLiteBuckets(shared_path, maxsize=maxsize)
+        if shared_path
+        else MemoryBuckets(maxsize=maxsize)
+    )
+    login_throttle = LoginThrottle(store=store, **kwargs)
+    return login_throttle
@@ -0,0 +1,394 @@
+import abc
+import collections
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from os.path import join
+from flask import g, request
+from sqlalchemy import event
+
+# spans beyond this many in one trace, e.g. of a catalog sync's many transfers, are counted but not kept
+MAX_SPANS_PER_TRACE = 1000
+
+# Assume we have a logger setup for us already
+logger = logging.getLogger()
+
+# the span being run in this context, if any
+_current_span = contextvars.ContextVar("zoneforge_current_span", default=None)
+
+tracer = None  # pylint: disable=invalid-name
+
+
+class Trace:
+    """
+    The spans started from a root span, such as a request, and those within them.
+    """
+
+    def __init__(self, owner):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.tracer = owner
+        self.spans = []
+        self.dropped = 0
+        # the wall clock time the spans' monotonic times are measured from
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self._span_ids = itertools.count(1)
+
+    def add(self, new_span) -> bool:
+        if len(self.spans) >= MAX_SPANS_PER_TRACE:
+            self.dropped += 1
+            return False
+        new_span.span_id = next(self._span_ids)
+        self.spans.append(new_span)
+        return True
+
+    @property
+    def root(self):
+        return self.spans[0]
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    def to_response(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started_at": datetime.fromtimestamp(
+                self.started_at, tz=timezone.utc
+            ).isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "dropped_spans": self.dropped,
+            "spans": [span.to_response() for span in self.spans],
+        }
+
+
+# pylint: disable=too-many-instance-attributes
+class Span:
+    """
+    Times the code run within it, as part of the trace of the span it's started in, or of a new trace if there's none.
+    """
+
+    __slots__ = (
+        "name",
+        "attributes",
+        "trace",
+        "parent",
+        "span_id",
+        "thread_id",
+        "start",
+        "end",
+    )
+
+    def __init__(self, name: str, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.trace = None
+        self.parent = None
+        self.span_id = None
+        self.thread_id = None
+        self.start = None
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self.trace = self.parent.trace if self.parent is not None else Trace(tracer)
+        self.trace.add(self)
+        self.thread_id = threading.get_ident()
+        _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end = time.perf_counter()
+        if exc_info[0] is not None:
+            self.attributes["error"] = exc_info[0].__name__
+        # set rather than reset, since a request's span is finished by a later callback than the one that started it
+        _current_span.set(self.parent)
+        if self.parent is None and self.trace.tracer is not None:
+            self.trace.tracer.finish(self.trace)
+        return False
+
+    def to_response(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.started) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+
+# pylint: enable=too-many-instance-attributes
+
+
+class _NoSpan:
+    """
+    Stands in for a span while tracing is disabled, so that disabled spans cost next to nothing.
+    """
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Returns a span timing the code within it, or one doing nothing if tracing is disabled.
+    """
+    if tracer is None:
+        return _no_span
+    return Span(name, **attributes)
+
+
+def traced(name: str):
+    """
+    Decorates a function to run within a span of the provided name.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return func(*args, **kwargs)
+            with Span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def set_attributes(**attributes):
+    """
+    Adds attributes to the span being run, if any.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+class Exporter(abc.ABC):
+    """
+    Receives each trace once its root span finishes. Exporters are called by the thread that finished the trace.
+    """
+
+    @abc.abstractmethod
+    def export(self, trace: Trace):
+        """
+        Writes out a finished trace.
+        """
+
+    def close(self):
+        pass
+
+
+class TraceEventFileExporter(Exporter):
+    """
+    Appends spans to a file in the JSON trace event format, which Perfetto and chrome://tracing open.
+    Each process writes to a file of its own in the directory. The format allows the array of events to be left unterminated,
+    so the file can be opened while it's still being written.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        events = [
+            json.dumps(
+                {
+                    "name": trace_span.name,
+                    "cat": "zoneforge",
+                    "ph": "X",
+                    "ts": round(
+                        (trace.started_at + trace_span.start - trace.started)
+                        * 1_000_000
+                    ),
+                    "dur": round(trace_span.duration * 1_000_000),
+                    "pid": os.getpid(),
+                    "tid": trace_span.thread_id,
+                    "args": trace_span.attributes
+                    | {
+                        "trace_id": trace.trace_id,
+                        "span_id": trace_span.span_id,
+                        "parent_id": (
+                            trace_span.parent.span_id
+                            if trace_span.parent is not None
+                            else None
+                        ),
+                    },
+                },
+                default=str,
+            )
+            for trace_span in trace.spans
+        ]
+        with self._lock:
+            f = self._open()
+            f.write("".join(f"{event},\n" for event in events))
+            f.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open(self):
+        # gunicorn workers forked from a preloaded app each need a file of their own
+        if self._file is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            path = join(self.directory, f"trace-{self._pid}.json")
+            self._file = open(  # pylint: disable=consider-using-with
+                path, "a", encoding="utf-8"
+            )
+            if self._file.tell() == 0:
+                self._file.write("[\n")
+        return self._file
+
+
+class Tracer:
+    """
+    Keeps the most recent traces in a ring buffer, passing each one to the exporters as it finishes.
+    """
+
+    def __init__(self, *, capacity: int = 100, exporters: list = ()):
+        self.capacity = capacity
+        self.exporters = list(exporters)
+        self._traces = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def finish(self, trace: Trace):
+        with self._lock:
+            self._traces.append(trace)
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Unable to export trace %s", trace.trace_id)
+
+    def recent(self, *, limit: int = 20, min_duration: float = 0) -> list[Trace]:
+        """
+        Returns up to limit of the most recent traces lasting at least min_duration seconds, most recent first.
+        """
+        with self._lock:
+            traces = list(self._traces)
+        return [trace for trace in reversed(traces) if trace.duration >= min_duration][
+            :limit
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+
+def configure(*, capacity: int = 100, export_dir: str = "") -> Tracer:
+    """
+    Enables tracing for this process, keeping the provided number of recent traces and writing them to export_dir if it's set.
+    """
+    global tracer  # pylint: disable=global-statement
+    if tracer is not None:
+        tracer.close()
+    exporters = [TraceEventFileExporter(export_dir)] if export_dir else []
+    tracer = Tracer(capacity=capacity, exporters=exporters)
+    return tracer
+
+
+def disable():
+    global tracer  # pylint: disable=global-statement
+    if tracer is not None:
+        tracer.close()
+    tracer = None
+
+
+def init_app(app):
+    """
+    Traces each request to a Flask app, along with the database statements run by its engine, if it has one.
+    """
+
+    @app.before_request
+    def start_request_span():
+        if tracer is None:
+            return
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.trace_span = Span(f"{request.method} {rule}", path=request.path)
+        g.trace_span.__enter__()  # pylint: disable=unnecessary-dunder-call
+
+    @app.after_request
+    def set_request_status(response):
+        if "trace_span" in g:
+            g.trace_span.set(status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def finish_request_span(exc):
+        request_span = g.pop("trace_span", None)
+        if request_span is not None:
+            request_span.__exit__(type(exc) if exc else None, exc, None)
+
+    if "sqlalchemy" in app.extensions:
+        with app.app_context():
+            instrument_engine(app.extensions["sqlalchemy"].engine)
+
+
+def instrument_engine(engine):
+    """
+    Runs each statement executed by a SQLAlchemy engine within a span.
+    """
+
+    def start_statement(conn, _cursor, statement, *_):
+        if tracer is None:
+            return
+        statement_span = Span("db.execute", statement=statement[:200])
+        conn.info.setdefault("zoneforge_spans", []).append(
+            statement_span.__enter__()  # pylint: disable=unnecessary-dunder-call
+        )
+
+    def finish_statement(conn, *_):
+        spans = conn.info.get("zoneforge_spans")
+        if spans:
+            spans.pop().__exit__(None, None, None)
+
+    def fail_statement(context):
+        spans = (
+            context.connection.info.get("zoneforge_spans")
+            if context.connection
+            else None
+        )
+        if spans:
+            error = context.original_exception
+            spans.pop().__exit__(type(error), error, None)
+
+    event.listen(engine, "before_cursor_execute", start_statement)
+    event.listen(engine, "after_cursor_execute", finish_statement)
+    event.listen(engine, "handle_error", fail_statement)